@@ -0,0 +1,195 @@
+"""
+DynamoDB attribute encoding
+Converts between Python values and the DynamoDB wire format shared by the
+client and the repositories
+"""
+
+import gzip
+import math
+import orjson
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Any
+from decimal import Decimal
+from boto3.dynamodb.types import Binary, TypeDeserializer, TypeSerializer
+
+
+# Prompts at least this large are stored gzip-compressed as Binary; below it
+# the gzip header would outweigh the savings
+PROMPT_COMPRESS_MIN_BYTES = 256
+
+_type_serializer = TypeSerializer()
+_type_deserializer = TypeDeserializer()
+
+
+def epoch_now() -> int:
+    """Current epoch time in whole seconds, the integer form every timestamp attribute uses"""
+    # Integer seconds encode as short 'N' values and never touch the float conversion path
+    return int(time.time())
+
+
+@lru_cache(maxsize=4096)
+def _float_to_decimal(value: float) -> Decimal:
+    """Convert a float to a Decimal, reusing results for repeated values"""
+    # Keyed on the float itself so cache hits skip the repr() formatting too
+    if not math.isfinite(value):
+        raise ValueError(f"DynamoDB cannot store non-finite number {value!r}")
+    return Decimal(repr(value))
+
+
+@lru_cache(maxsize=1024)
+def _decimal_to_float(value: Decimal) -> float:
+    """Convert a Decimal to float, reusing results for repeated values"""
+    return float(value)
+
+
+# Leaf types that never need conversion; checking these inline skips a
+# recursive call for the common str/int attributes
+_PLAIN_WRITE_TYPES = frozenset({str, int, bool, type(None), bytes, Decimal})
+_PLAIN_READ_TYPES = frozenset({str, int, bool, type(None), bytes, float})
+
+
+def floats_to_decimal(value: Any) -> Any:
+    """Recursively convert floats to Decimals, the only type boto3 rejects"""
+    # Exact type checks are cheaper than isinstance chains on this hot path
+    value_type = type(value)
+    if value_type is float:
+        return _float_to_decimal(value)
+    
+    # Containers are copied only once a value inside them actually changes
+    if value_type is dict:
+        converted = None
+        for k, v in value.items():
+            if type(v) not in _PLAIN_WRITE_TYPES:
+                new_v = floats_to_decimal(v)
+                if new_v is not v:
+                    if converted is None:
+                        converted = value.copy()
+                    converted[k] = new_v
+        return value if converted is None else converted
+    if value_type is list:
+        converted = None
+        for i, v in enumerate(value):
+            if type(v) not in _PLAIN_WRITE_TYPES:
+                new_v = floats_to_decimal(v)
+                if new_v is not v:
+                    if converted is None:
+                        converted = value.copy()
+                    converted[i] = new_v
+        return value if converted is None else converted
+    return value
+
+
+def decimals_to_float(value: Any) -> Any:
+    """Recursively convert the Decimals boto3 returns back to floats"""
+    value_type = type(value)
+    if value_type is Decimal:
+        return _decimal_to_float(value)
+    if value_type is dict:
+        converted = None
+        for k, v in value.items():
+            if type(v) not in _PLAIN_READ_TYPES:
+                new_v = decimals_to_float(v)
+                if new_v is not v:
+                    if converted is None:
+                        converted = value.copy()
+                    converted[k] = new_v
+        return value if converted is None else converted
+    if value_type is list:
+        converted = None
+        for i, v in enumerate(value):
+            if type(v) not in _PLAIN_READ_TYPES:
+                new_v = decimals_to_float(v)
+                if new_v is not v:
+                    if converted is None:
+                        converted = value.copy()
+                    converted[i] = new_v
+        return value if converted is None else converted
+    return value
+
+
+@lru_cache(maxsize=4096)
+def _float_to_number(value: float) -> str:
+    """Format a float as a DynamoDB number string, reusing results for repeated values"""
+    if not math.isfinite(value):
+        raise ValueError(f"DynamoDB cannot store non-finite number {value!r}")
+    return repr(value)
+
+
+def _to_attribute_value(value: Any) -> Dict[str, Any]:
+    """Encode a Python value as a DynamoDB typed attribute value for the low-level client"""
+    # Numbers go straight to their wire string, skipping the Decimal round-trip TypeSerializer needs
+    value_type = type(value)
+    if value_type is str:
+        return {'S': value}
+    if value_type is int:
+        return {'N': str(value)}
+    if value_type is bool:
+        return {'BOOL': value}
+    if value_type is float:
+        return {'N': _float_to_number(value)}
+    if value_type is dict:
+        return {'M': {k: _to_attribute_value(v) for k, v in value.items()}}
+    if value_type is list:
+        return {'L': [_to_attribute_value(v) for v in value]}
+    if value is None:
+        return {'NULL': True}
+    if value_type is Decimal:
+        return {'N': str(value)}
+    if value_type is bytes:
+        return {'B': value}
+    # Sets and subclasses keep TypeSerializer's validation
+    return _type_serializer.serialize(floats_to_decimal(value))
+
+
+def to_wire_item(item: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Encode a whole item or key for the low-level client"""
+    return {k: _to_attribute_value(v) for k, v in item.items()}
+
+
+def from_wire_item(item: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Decode an item returned by the low-level client"""
+    return {k: _type_deserializer.deserialize(v) for k, v in item.items()}
+
+
+def encode_prompt(prompt: Any) -> Any:
+    """Serialize a prompt for storage, gzip-compressing large ones"""
+    encoded = orjson.dumps(prompt)
+    if len(encoded) < PROMPT_COMPRESS_MIN_BYTES:
+        return encoded.decode()
+    return gzip.compress(encoded, compresslevel=6)
+
+
+def decode_prompt(value: Any) -> Any:
+    """Parse a stored prompt, whether a JSON string or compressed Binary"""
+    if type(value) is str:
+        return orjson.loads(value)
+    # boto3 hands Binary attributes back wrapped
+    if type(value) is Binary:
+        value = value.value
+    if type(value) is bytes:
+        return orjson.loads(gzip.decompress(value))
+    return value
+
+
+def build_update_params(updates: Dict[str, Any], remove: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Build UpdateItem SET (and optional REMOVE) expression parameters for the given field updates"""
+    names = {}
+    values = {}
+    assignments = []
+    for i, (field, value) in enumerate(updates.items()):
+        names[f'#f{i}'] = field
+        values[f':v{i}'] = floats_to_decimal(value)
+        assignments.append(f'#f{i} = :v{i}')
+    
+    expression = 'SET ' + ', '.join(assignments)
+    if remove:
+        for i, field in enumerate(remove):
+            names[f'#r{i}'] = field
+        expression += ' REMOVE ' + ', '.join(f'#r{i}' for i in range(len(remove)))
+    
+    return {
+        'UpdateExpression': expression,
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values
+    }
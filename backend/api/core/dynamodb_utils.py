@@ -1,101 +1,250 @@
 """
 DynamoDB utilities for single-table design
-Handles CRUD operations for all entities in the FigureForge application
+Wraps the shared table client; entity operations live in api.core.repositories
 """
 
 import boto3
-import uuid
+import copy
 import time
-from typing import Dict, List, Optional, Any, Tuple
-from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Any, Tuple
 from django.conf import settings
+from botocore.config import Config
 from botocore.exceptions import ClientError
+from api.core.cache import TTLCache
+from api.core.dynamodb_encoding import (
+    build_update_params, decimals_to_float, epoch_now, floats_to_decimal, from_wire_item, to_wire_item
+)
 
 
-class DynamoDBClient:
-    """Wrapper for DynamoDB operations with single-table design"""
-    
-    def __init__(self):
-        self.dynamodb = boto3.resource(
+# Shared connection settings: keep-alive sockets and a pool large enough for
+# concurrent repository calls, so requests skip the TCP/TLS handshake
+_DYNAMODB_CONFIG = Config(
+    max_pool_connections=64,
+    retries={'max_attempts': 3, 'mode': 'adaptive'},
+    tcp_keepalive=True,
+    connect_timeout=1,
+    read_timeout=3
+)
+
+# BatchGetItem reads at most 100 keys per request; unprocessed keys are
+# re-requested with capped exponential backoff so throttled tables can recover
+BATCH_GET_LIMIT = 100
+UNPROCESSED_RETRY_BASE_DELAY = 0.05
+UNPROCESSED_RETRY_MAX_DELAY = 1.0
+
+# TransactWriteItems accepts at most 100 operations per call
+TRANSACT_WRITE_LIMIT = 100
+
+# Soft-deleted items and finished job status entries carry an expires_at TTL
+# attribute; DynamoDB's TTL sweeper removes them once this retention has passed
+EXPIRED_ITEM_RETENTION_SECONDS = 7 * 24 * 60 * 60
+
+# Soft deletes are updates, which BatchWriteItem cannot carry, so multi-item
+# soft deletes run concurrently here over the thread-safe low-level client
+_WRITE_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix='dynamodb-write')
+
+# get_item results are reused for this long within a process. Kept under the
+# frontend's 2s job-status poll so every poll still sees writes from the worker
+ITEM_CACHE_TTL = 1.0
+
+_dynamodb_resource = None
+_dynamodb_low_level_client = None
+_dynamodb_client = None
+
+
+def _get_dynamodb_resource():
+    """Return the process-wide DynamoDB resource, creating it on first use"""
+    global _dynamodb_resource
+    if _dynamodb_resource is None:
+        _dynamodb_resource = boto3.resource(
+            'dynamodb',
+            region_name=settings.AWS_REGION,
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            config=_DYNAMODB_CONFIG
+        )
+    return _dynamodb_resource
+
+
+def _get_dynamodb_low_level_client():
+    """Return the process-wide low-level DynamoDB client, creating it on first use"""
+    # The resource's meta.client carries marshaling hooks; this one takes typed values as-is
+    global _dynamodb_low_level_client
+    if _dynamodb_low_level_client is None:
+        _dynamodb_low_level_client = boto3.client(
             'dynamodb',
             region_name=settings.AWS_REGION,
             aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            config=_DYNAMODB_CONFIG
         )
+    return _dynamodb_low_level_client
+
+
+def get_dynamodb_client() -> 'DynamoDBClient':
+    """Return the shared DynamoDBClient used by all repositories"""
+    global _dynamodb_client
+    if _dynamodb_client is None:
+        _dynamodb_client = DynamoDBClient()
+    return _dynamodb_client
+
+
+class DynamoDBClient:
+    """Wrapper for DynamoDB operations with single-table design"""
+    
+    # Per-process read-through cache for get_item, keyed by (pk, sk)
+    _item_cache = TTLCache(maxsize=8192, ttl=ITEM_CACHE_TTL)
+    
+    def __init__(self):
+        self.dynamodb = _get_dynamodb_resource()
+        self.client = _get_dynamodb_low_level_client()
         self.table = self.dynamodb.Table(settings.AWS_DYNAMODB_TABLE_NAME)
     
     def _serialize_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
         """Convert Python types to DynamoDB-compatible types"""
-        serialized = {}
-        for key, value in item.items():
-            if isinstance(value, float):
-                serialized[key] = Decimal(str(value))
-            elif isinstance(value, list):
-                serialized_list = []
-                for v in value:
-                    if isinstance(v, float):
-                        serialized_list.append(Decimal(str(v)))
-                    elif isinstance(v, dict):
-                        serialized_list.append(self._serialize_item(v))
-                    else:
-                        serialized_list.append(v)
-                serialized[key] = serialized_list
-            elif isinstance(value, dict):
-                serialized[key] = self._serialize_item(value)
-            else:
-                serialized[key] = value
-        return serialized
+        # Float-free items, nested or not, come back as the same object with no copy
+        return floats_to_decimal(item)
     
-    def _deserialize_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
+    def _deserialize_item(self, item: Dict[str, Any], decode_floats: bool = False) -> Dict[str, Any]:
         """Convert DynamoDB types back to Python types"""
-        deserialized = {}
-        for key, value in item.items():
-            if isinstance(value, Decimal):
-                deserialized[key] = float(value)
-            elif isinstance(value, list):
-                deserialized_list = []
-                for v in value:
-                    if isinstance(v, Decimal):
-                        deserialized_list.append(float(v))
-                    elif isinstance(v, dict):
-                        deserialized_list.append(self._deserialize_item(v))
-                    else:
-                        deserialized_list.append(v)
-                deserialized[key] = deserialized_list
-            elif isinstance(value, dict):
-                deserialized[key] = self._deserialize_item(value)
-            else:
-                deserialized[key] = value
-        return deserialized
+        # Decimals serialize to JSON as-is, so only walk the item when a caller needs floats
+        if decode_floats:
+            return decimals_to_float(item)
+        return item
+    
+    def _invalidate(self, pk: str, sk: str) -> None:
+        """Drop a cached get_item result before the item is written"""
+        self._item_cache.pop((pk, sk))
     
-    def put_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
-        """Create or update an item"""
+    def put_item(self, item: Dict[str, Any], condition: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Create or update an item, returning None if the optional condition fails"""
         # Add timestamp if not present
         if 'created_at' not in item:
-            item['created_at'] = int(time.time())
+            item['created_at'] = epoch_now()
         
-        serialized_item = self._serialize_item(item)
+        self._invalidate(item['pk'], item['sk'])
+        put_params = {'TableName': self.table.name, 'Item': to_wire_item(item)}
+        if condition:
+            put_params['ConditionExpression'] = condition
         
         try:
-            self.table.put_item(Item=serialized_item)
-            return self._deserialize_item(serialized_item)
+            self.client.put_item(**put_params)
+            # The caller's item already holds the plain Python values that were written
+            return item
         except ClientError as e:
+            if e.response['Error'].get('Code') == 'ConditionalCheckFailedException':
+                return None
             raise Exception(f"Error putting item: {e.response['Error']['Message']}")
     
-    def get_item(self, pk: str, sk: str) -> Optional[Dict[str, Any]]:
-        """Get a single item by primary key"""
+    def batch_put(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Create or update several items in batched write requests"""
+        now = epoch_now()
+        serialized_items = []
+        for item in items:
+            if 'created_at' not in item:
+                item['created_at'] = now
+            self._invalidate(item['pk'], item['sk'])
+            serialized_items.append(self._serialize_item(item))
+        
+        try:
+            # batch_writer chunks into 25-item requests and retries unprocessed items;
+            # BatchWriteItem rejects repeated keys, so a later item replaces an earlier one
+            with self.table.batch_writer(overwrite_by_pkeys=['pk', 'sk']) as batch:
+                for serialized_item in serialized_items:
+                    batch.put_item(Item=serialized_item)
+            return items
+        except ClientError as e:
+            raise Exception(f"Error batch putting items: {e.response['Error']['Message']}")
+    
+    def batch_delete(self, keys: List[Tuple[str, str]]) -> bool:
+        """Hard delete several items by (pk, sk) in batched write requests"""
+        try:
+            with self.table.batch_writer(overwrite_by_pkeys=['pk', 'sk']) as batch:
+                for pk, sk in keys:
+                    self._invalidate(pk, sk)
+                    batch.delete_item(Key={'pk': pk, 'sk': sk})
+            return True
+        except ClientError as e:
+            raise Exception(f"Error batch deleting items: {e.response['Error']['Message']}")
+    
+    def get_item(self, pk: str, sk: str, decode_floats: bool = False,
+                 consistent: bool = False) -> Optional[Dict[str, Any]]:
+        """Get a single item by primary key, served from a short-lived cache when possible"""
+        # A consistent read must see the latest write, so it skips the cache
+        item = None if consistent else self._item_cache.get((pk, sk))
+        if item is None:
+            get_params = {'Key': {'pk': pk, 'sk': sk}}
+            if consistent:
+                get_params['ConsistentRead'] = True
+            try:
+                response = self.table.get_item(**get_params)
+            except ClientError as e:
+                raise Exception(f"Error getting item: {e.response['Error']['Message']}")
+            
+            # Misses are not cached so a freshly created item is visible at once
+            item = response.get('Item')
+            if item is None:
+                return None
+            self._item_cache.set((pk, sk), item)
+        
+        # Callers mutate the result, nested lists and maps included, so hand out a deep copy
+        return self._deserialize_item(copy.deepcopy(item), decode_floats)
+    
+    def get_item_fast(self, pk: str, sk: str) -> Optional[Dict[str, Any]]:
+        """Get a single item by primary key through the low-level client"""
         try:
-            response = self.table.get_item(
-                Key={'pk': pk, 'sk': sk}
+            response = self.client.get_item(
+                TableName=self.table.name,
+                Key={'pk': {'S': pk}, 'sk': {'S': sk}}
             )
-            if 'Item' in response:
-                return self._deserialize_item(response['Item'])
-            return None
         except ClientError as e:
             raise Exception(f"Error getting item: {e.response['Error']['Message']}")
+        
+        item = response.get('Item')
+        if item is None:
+            return None
+        return from_wire_item(item)
+    
+    def batch_get(self, keys: List[Tuple[str, str]], decode_floats: bool = False) -> List[Dict[str, Any]]:
+        """Get several items by (pk, sk) in batched reads, preserving key order"""
+        # DynamoDB rejects duplicate keys within one BatchGetItem request
+        unique_keys = list(dict.fromkeys(keys))
+        table_name = self.table.name
+        found = {}
+        
+        try:
+            for start in range(0, len(unique_keys), BATCH_GET_LIMIT):
+                request_items = {table_name: {
+                    'Keys': [{'pk': pk, 'sk': sk} for pk, sk in unique_keys[start:start + BATCH_GET_LIMIT]]
+                }}
+                
+                # Retry any keys DynamoDB could not process in this round, backing off between rounds
+                retries = 0
+                while request_items:
+                    if retries:
+                        time.sleep(min(UNPROCESSED_RETRY_MAX_DELAY, UNPROCESSED_RETRY_BASE_DELAY * 2 ** (retries - 1)))
+                    response = self.dynamodb.batch_get_item(RequestItems=request_items)
+                    for item in response.get('Responses', {}).get(table_name, []):
+                        found[(item['pk'], item['sk'])] = self._deserialize_item(item, decode_floats)
+                    request_items = response.get('UnprocessedKeys')
+                    retries += 1
+        except ClientError as e:
+            raise Exception(f"Error batch getting items: {e.response['Error']['Message']}")
+        
+        return [found[key] for key in keys if key in found]
+    
+    def _add_projection(self, query_params: Dict[str, Any], attributes: Optional[List[str]]) -> None:
+        """Restrict a query to the given attributes (aliased to avoid reserved words)"""
+        if attributes:
+            names = {f'#p{i}': name for i, name in enumerate(attributes)}
+            query_params['ProjectionExpression'] = ','.join(names)
+            query_params['ExpressionAttributeNames'] = names
     
     def query_items(self, pk: str, sk_prefix: Optional[str] = None, 
-                   limit: Optional[int] = None, last_evaluated_key: Optional[Dict] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict]]:
+                   limit: Optional[int] = None, last_evaluated_key: Optional[Dict] = None,
+                   projection: Optional[List[str]] = None,
+                   decode_floats: bool = False) -> Tuple[List[Dict[str, Any]], Optional[Dict]]:
         """Query items by partition key and optional sort key prefix"""
         query_params = {
             'KeyConditionExpression': 'pk = :pk',
@@ -112,31 +261,174 @@ class DynamoDBClient:
         if last_evaluated_key:
             query_params['ExclusiveStartKey'] = last_evaluated_key
         
+        self._add_projection(query_params, projection)
+        
         try:
             response = self.table.query(**query_params)
-            items = [self._deserialize_item(item) for item in response.get('Items', [])]
+            items = [self._deserialize_item(item, decode_floats) for item in response.get('Items', [])]
             return items, response.get('LastEvaluatedKey')
         except ClientError as e:
             raise Exception(f"Error querying items: {e.response['Error']['Message']}")
     
+    def iter_query(self, pk: str, sk_prefix: Optional[str] = None,
+                   last_evaluated_key: Optional[Dict] = None, projection: Optional[List[str]] = None,
+                   index_name: Optional[str] = None, page_size: Optional[int] = None,
+                   decode_floats: bool = False) -> Iterator[Dict[str, Any]]:
+        """Yield items by partition key across pages, fetching each page only when it is reached"""
+        query_params = {
+            'KeyConditionExpression': 'pk = :pk',
+            'ExpressionAttributeValues': {':pk': pk}
+        }
+        
+        if index_name:
+            query_params['IndexName'] = index_name
+        
+        if sk_prefix:
+            query_params['KeyConditionExpression'] += ' AND begins_with(sk, :sk_prefix)'
+            query_params['ExpressionAttributeValues'][':sk_prefix'] = sk_prefix
+        
+        if page_size:
+            query_params['Limit'] = page_size
+        
+        if last_evaluated_key:
+            query_params['ExclusiveStartKey'] = last_evaluated_key
+        
+        self._add_projection(query_params, projection)
+        
+        while True:
+            try:
+                response = self.table.query(**query_params)
+            except ClientError as e:
+                raise Exception(f"Error querying items: {e.response['Error']['Message']}")
+            
+            for item in response.get('Items', []):
+                yield self._deserialize_item(item, decode_floats)
+            
+            if 'LastEvaluatedKey' not in response:
+                return
+            query_params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    
+    def update_fields(self, pk: str, sk: str, updates: Dict[str, Any],
+                      remove: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Update (or remove) fields of an existing item in place, returning None if it does not exist"""
+        update_params = build_update_params(updates, remove)
+        update_params['ConditionExpression'] = 'attribute_exists(pk)'
+        self._invalidate(pk, sk)
+        
+        try:
+            response = self.table.update_item(
+                Key={'pk': pk, 'sk': sk},
+                ReturnValues='ALL_NEW',
+                **update_params
+            )
+            return self._deserialize_item(response['Attributes'])
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return None
+            raise Exception(f"Error updating item: {e.response['Error']['Message']}")
+    
+    def increment_field(self, pk: str, sk: str, field: str, amount: int) -> Optional[Dict[str, Any]]:
+        """Atomically add to a numeric field, returning None if the item is missing or it would go negative"""
+        update_params = {
+            'UpdateExpression': 'ADD #f :amount',
+            'ConditionExpression': 'attribute_exists(pk)',
+            'ExpressionAttributeNames': {'#f': field},
+            'ExpressionAttributeValues': {':amount': amount}
+        }
+        if amount < 0:
+            update_params['ConditionExpression'] += ' AND #f >= :floor'
+            update_params['ExpressionAttributeValues'][':floor'] = -amount
+        self._invalidate(pk, sk)
+        
+        try:
+            response = self.table.update_item(
+                Key={'pk': pk, 'sk': sk},
+                ReturnValues='ALL_NEW',
+                **update_params
+            )
+            return self._deserialize_item(response['Attributes'])
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return None
+            raise Exception(f"Error updating item: {e.response['Error']['Message']}")
+    
+    def transact_write(self, operations: List[Dict[str, Any]], ignore_condition_failure: bool = False) -> bool:
+        """Apply Put/Update/Delete operations atomically in one TransactWriteItems call, or return False on an ignored condition failure"""
+        table_name = self.table.name
+        transact_items = []
+        for operation in operations:
+            for action, params in operation.items():
+                key = params.get('Key') or params['Item']
+                self._invalidate(key['pk'], key['sk'])
+                wire_params = {'TableName': table_name}
+                for param, value in params.items():
+                    if param in ('Item', 'Key', 'ExpressionAttributeValues'):
+                        # The low-level client expects DynamoDB-typed attribute values
+                        value = to_wire_item(value)
+                    wire_params[param] = value
+                transact_items.append({action: wire_params})
+        
+        try:
+            self.client.transact_write_items(TransactItems=transact_items)
+            return True
+        except ClientError as e:
+            if ignore_condition_failure and e.response['Error'].get('Code') == 'TransactionCanceledException':
+                reasons = e.response.get('CancellationReasons', [])
+                if any(reason.get('Code') == 'ConditionalCheckFailed' for reason in reasons):
+                    return False
+            raise Exception(f"Error in write transaction: {e.response['Error']['Message']}")
+    
     def delete_item(self, pk: str, sk: str) -> bool:
-        """Delete an item (soft delete by setting deleted_at)"""
+        """Delete an item (soft delete by setting deleted_at, with a TTL to reap it later)"""
+        self._invalidate(pk, sk)
+        now = epoch_now()
         try:
             self.table.update_item(
                 Key={'pk': pk, 'sk': sk},
-                UpdateExpression='SET deleted_at = :timestamp',
-                ExpressionAttributeValues={':timestamp': int(time.time())}
+                UpdateExpression='SET deleted_at = :timestamp, expires_at = :expires_at',
+                ExpressionAttributeValues={
+                    ':timestamp': now,
+                    ':expires_at': now + EXPIRED_ITEM_RETENTION_SECONDS
+                }
             )
             return True
         except ClientError as e:
             raise Exception(f"Error deleting item: {e.response['Error']['Message']}")
     
+    def delete_items(self, keys: List[Tuple[str, str]]) -> bool:
+        """Soft delete several items by (pk, sk) concurrently"""
+        now = epoch_now()
+        table_name = self.table.name
+        expression_values = to_wire_item({
+            ':timestamp': now,
+            ':expires_at': now + EXPIRED_ITEM_RETENTION_SECONDS
+        })
+        
+        def soft_delete(key: Tuple[str, str]) -> None:
+            self._invalidate(*key)
+            self.client.update_item(
+                TableName=table_name,
+                Key={'pk': {'S': key[0]}, 'sk': {'S': key[1]}},
+                UpdateExpression='SET deleted_at = :timestamp, expires_at = :expires_at',
+                ExpressionAttributeValues=expression_values
+            )
+        
+        try:
+            # Every delete is submitted up front; consuming the results re-raises the first failure
+            list(_WRITE_POOL.map(soft_delete, keys))
+            return True
+        except ClientError as e:
+            raise Exception(f"Error deleting items: {e.response['Error']['Message']}")
+    
     def query_gsi(self, index_name: str, pk_value: str, sk_value: Optional[str] = None,
-                  limit: Optional[int] = None, last_evaluated_key: Optional[Dict] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict]]:
+                  limit: Optional[int] = None, last_evaluated_key: Optional[Dict] = None,
+                  projection: Optional[List[str]] = None,
+                  pk_attr: str = 'pk',
+                  decode_floats: bool = False) -> Tuple[List[Dict[str, Any]], Optional[Dict]]:
         """Query a Global Secondary Index"""
         query_params = {
             'IndexName': index_name,
-            'KeyConditionExpression': 'pk = :pk',
+            'KeyConditionExpression': f'{pk_attr} = :pk',
             'ExpressionAttributeValues': {':pk': pk_value}
         }
         
@@ -150,289 +442,11 @@ class DynamoDBClient:
         if last_evaluated_key:
             query_params['ExclusiveStartKey'] = last_evaluated_key
         
+        self._add_projection(query_params, projection)
+        
         try:
             response = self.table.query(**query_params)
-            items = [self._deserialize_item(item) for item in response.get('Items', [])]
+            items = [self._deserialize_item(item, decode_floats) for item in response.get('Items', [])]
             return items, response.get('LastEvaluatedKey')
         except ClientError as e:
             raise Exception(f"Error querying GSI: {e.response['Error']['Message']}")
-
-
-class UserRepository:
-    """Repository for User entity operations"""
-    
-    def __init__(self):
-        self.db = DynamoDBClient()
-    
-    def create_user(self, user_id: str, email: str, username: Optional[str] = None) -> Dict[str, Any]:
-        """Create a new user"""
-        user = {
-            'pk': f'USER#{user_id}',
-            'sk': 'PROFILE',
-            'user_id': user_id,
-            'email': email,
-            'username': username or f'user_{user_id[:8]}',
-            'role': 'user',
-            'quota_used': 0,
-            'quota_limit': 0,  # Will be set based on subscription
-            'created_at': int(time.time())
-        }
-        
-        # Also create email index entry
-        email_index = {
-            'pk': f'EMAIL#{email}',
-            'sk': f'USER#{user_id}',
-            'created_at': int(time.time())
-        }
-        
-        self.db.put_item(user)
-        self.db.put_item(email_index)
-        
-        return user
-    
-    def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
-        """Get user by ID"""
-        return self.db.get_item(f'USER#{user_id}', 'PROFILE')
-    
-    def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
-        """Get user by email using GSI"""
-        items, _ = self.db.query_gsi('byEmail', f'EMAIL#{email}', limit=1)
-        if items:
-            user_id = items[0]['sk'].split('#')[1]
-            return self.get_user(user_id)
-        return None
-    
-    def update_user(self, user_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
-        """Update user profile"""
-        user = self.get_user(user_id)
-        if not user:
-            raise ValueError(f"User {user_id} not found")
-        
-        user.update(updates)
-        return self.db.put_item(user)
-
-
-class ImageRepository:
-    """Repository for Image entity operations"""
-    
-    def __init__(self):
-        self.db = DynamoDBClient()
-    
-    def create_image(self, image_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Create a new image record"""
-        image_id = str(uuid.uuid4())
-        image = {
-            'pk': f'IMG#{image_id}',
-            'sk': 'META',
-            'image_id': image_id,
-            'user_id': image_data.get('user_id'),
-            'url': image_data['url'],
-            'tags': image_data.get('tags', []),
-            'prompt_json': image_data.get('prompt_json', {}),
-            'provider': image_data.get('provider', 'fal.ai'),
-            'provider_model_id': image_data.get('provider_model_id'),
-            'cost_cents': image_data.get('cost_cents', 0),
-            'favorited_count': 0,
-            'public': image_data.get('public', True),
-            'private_gallery_ids': image_data.get('private_gallery_ids', []),
-            'flag_status': 'clean',
-            'created_at': int(time.time()),
-            'deleted_at': None
-        }
-        
-        self.db.put_item(image)
-        
-        # Create tag index entries
-        for tag in image['tags']:
-            tag_index = {
-                'pk': f'TAG#{tag}',
-                'sk': f'IMG#{image_id}',
-                'created_at': int(time.time())
-            }
-            self.db.put_item(tag_index)
-        
-        # Create user image index entry if user_id exists
-        if image['user_id']:
-            user_image_index = {
-                'pk': f'USER#{image['user_id']}',
-                'sk': f'IMG#{image_id}',
-                'created_at': int(time.time())
-            }
-            self.db.put_item(user_image_index)
-        
-        return image
-    
-    def get_image(self, image_id: str) -> Optional[Dict[str, Any]]:
-        """Get image by ID"""
-        return self.db.get_item(f'IMG#{image_id}', 'META')
-    
-    def get_images_by_tag(self, tag: str, limit: int = 20, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
-        """Get images by tag"""
-        last_key = {'pk': f'TAG#{tag}', 'sk': cursor} if cursor else None
-        
-        items, next_key = self.db.query_items(f'TAG#{tag}', limit=limit, last_evaluated_key=last_key)
-        
-        # Fetch full image data
-        images = []
-        for item in items:
-            image_id = item['sk'].split('#')[1]
-            image = self.get_image(image_id)
-            if image and not image.get('deleted_at'):
-                images.append(image)
-        
-        next_cursor = next_key['sk'] if next_key else None
-        return images, next_cursor
-    
-    def get_user_images(self, user_id: str, limit: int = 20, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
-        """Get images by user"""
-        last_key = {'pk': f'USER#{user_id}', 'sk': cursor} if cursor else None
-        
-        items, next_key = self.db.query_gsi('imagesByUser', f'USER#{user_id}', limit=limit, last_evaluated_key=last_key)
-        
-        # Fetch full image data
-        images = []
-        for item in items:
-            if item['sk'].startswith('IMG#'):
-                image_id = item['sk'].split('#')[1]
-                image = self.get_image(image_id)
-                if image and not image.get('deleted_at'):
-                    images.append(image)
-        
-        next_cursor = next_key['sk'] if next_key else None
-        return images, next_cursor
-
-
-class JobRepository:
-    """Repository for GenerationJob entity operations"""
-    
-    def __init__(self):
-        self.db = DynamoDBClient()
-    
-    def create_job(self, user_id: str, filters: Dict[str, Any], batch_size: int) -> Dict[str, Any]:
-        """Create a new generation job"""
-        job_id = str(uuid.uuid4())
-        job = {
-            'pk': f'USER#{user_id}',
-            'sk': f'JOB#{job_id}',
-            'job_id': job_id,
-            'user_id': user_id,
-            'status': 'queued',
-            'filters': filters,
-            'batch_size': batch_size,
-            'image_ids': [],
-            'error': None,
-            'created_at': int(time.time()),
-            'updated_at': int(time.time())
-        }
-        
-        self.db.put_item(job)
-        
-        # Also create job status index entry
-        status_index = {
-            'pk': f'JOBSTATUS#{job["status"]}',
-            'sk': str(job['created_at']),
-            'job_id': job_id,
-            'user_id': user_id
-        }
-        self.db.put_item(status_index)
-        
-        return job
-    
-    def get_job(self, user_id: str, job_id: str) -> Optional[Dict[str, Any]]:
-        """Get job by ID"""
-        return self.db.get_item(f'USER#{user_id}', f'JOB#{job_id}')
-    
-    def update_job_status(self, user_id: str, job_id: str, status: str, 
-                         image_ids: Optional[List[str]] = None, error: Optional[str] = None) -> Dict[str, Any]:
-        """Update job status"""
-        job = self.get_job(user_id, job_id)
-        if not job:
-            raise ValueError(f"Job {job_id} not found")
-        
-        # Remove old status index entry
-        old_status_index = {
-            'pk': f'JOBSTATUS#{job["status"]}',
-            'sk': str(job['created_at'])
-        }
-        self.db.delete_item(old_status_index['pk'], old_status_index['sk'])
-        
-        # Update job
-        job['status'] = status
-        job['updated_at'] = int(time.time())
-        if image_ids:
-            job['image_ids'] = image_ids
-        if error:
-            job['error'] = error
-        
-        self.db.put_item(job)
-        
-        # Create new status index entry
-        new_status_index = {
-            'pk': f'JOBSTATUS#{status}',
-            'sk': str(job['created_at']),
-            'job_id': job_id,
-            'user_id': user_id
-        }
-        self.db.put_item(new_status_index)
-        
-        return job
-
-
-class SubscriptionRepository:
-    """Repository for Subscription entity operations"""
-    
-    def __init__(self):
-        self.db = DynamoDBClient()
-    
-    def create_subscription(self, user_id: str, stripe_sub_id: str, plan_id: str, 
-                          status: str, current_period_end: int) -> Dict[str, Any]:
-        """Create a new subscription"""
-        subscription = {
-            'pk': f'USER#{user_id}',
-            'sk': f'SUB#{stripe_sub_id}',
-            'subscription_id': stripe_sub_id,
-            'user_id': user_id,
-            'plan_id': plan_id,
-            'status': status,
-            'current_period_end': current_period_end,
-            'created_at': int(time.time()),
-            'updated_at': int(time.time())
-        }
-        
-        self.db.put_item(subscription)
-        
-        # Also create Stripe subscription index
-        stripe_index = {
-            'pk': f'SUB#{stripe_sub_id}',
-            'sk': f'USER#{user_id}',
-            'created_at': int(time.time())
-        }
-        self.db.put_item(stripe_index)
-        
-        return subscription
-    
-    def get_subscription(self, user_id: str, stripe_sub_id: str) -> Optional[Dict[str, Any]]:
-        """Get subscription by ID"""
-        return self.db.get_item(f'USER#{user_id}', f'SUB#{stripe_sub_id}')
-    
-    def get_user_subscriptions(self, user_id: str) -> List[Dict[str, Any]]:
-        """Get all subscriptions for a user"""
-        items, _ = self.db.query_items(f'USER#{user_id}', sk_prefix='SUB#')
-        return [item for item in items if item.get('subscription_id')]
-    
-    def get_active_subscription(self, user_id: str) -> Optional[Dict[str, Any]]:
-        """Get the active subscription for a user"""
-        subscriptions = self.get_user_subscriptions(user_id)
-        active_subs = [s for s in subscriptions if s['status'] == 'active']
-        return active_subs[0] if active_subs else None
-    
-    def update_subscription(self, user_id: str, stripe_sub_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
-        """Update subscription"""
-        subscription = self.get_subscription(user_id, stripe_sub_id)
-        if not subscription:
-            raise ValueError(f"Subscription {stripe_sub_id} not found")
-        
-        subscription.update(updates)
-        subscription['updated_at'] = int(time.time())
-        
-        return self.db.put_item(subscription)
@@ -3,16 +3,68 @@ fal.ai client for image generation
 Handles API calls to fal.ai for generating images
 """
 
+import copy
 import requests
-import json
+import logging
+import orjson
+import random
+import threading
 import time
-from typing import Dict, List, Optional, Any
+from types import MappingProxyType
+from typing import Dict, List, Optional, Any, Tuple
 from django.conf import settings
 
+from api.core.cache import TTLCache
+from api.core.fal_prompts import IMAGE_SIZE_MAP, _PROMPT_PARTS, _compose_prompt
+from api.core.fal_rate_limit import _get_rate_limiter, _parse_number_header
+from api.core.fal_session import MAX_BATCH_WORKERS, _BATCH_POOL, _METHOD_FUNCS, _get_session
+
+logger = logging.getLogger(__name__)
+
+
+# Upper bound in seconds of the random jitter added to each poll delay, so requests
+# submitted together don't poll fal.ai in lockstep
+POLL_JITTER = 0.1
+
+# Seconds a status request asks fal.ai to hold the connection open until the job
+# settles; servers that don't support long polling answer at once and the
+# backoff loop carries on. Kept under the read timeout and the worker's cancel
+# margin, so a held request never outlasts the Lambda invocation
+LONG_POLL_SECONDS = 20
+
+# Overall seconds one generation is polled for before giving up
+POLL_TIMEOUT = 120
+
+# Model metadata is static, so lookups are reused for an hour within a process
+MODEL_INFO_CACHE_TTL = 60 * 60
+
+# Completed generation results are kept this long, so a request polled again (a
+# retried job, or a batch and a single poll overlapping) is not fetched twice
+RESULT_CACHE_TTL = 10 * 60
+
+# Times a rate-limited (429) request is retried after waiting out Retry-After
+MAX_RATE_LIMIT_RETRIES = 3
+
+# Generation parameters sent unless the caller overrides them
+DEFAULT_GENERATION_PARAMS = MappingProxyType({
+    "image_size": "square",
+    "num_inference_steps": 28,
+    "guidance_scale": 3.5,
+    "num_images": 1,
+    "enable_safety_checker": True,
+    "output_format": "png"
+})
+
 
 class FalAIClient:
     """Client for interacting with fal.ai API"""
     
+    # Per-process cache of get_model_info responses, keyed by model_id
+    _model_info_cache = TTLCache(maxsize=32, ttl=MODEL_INFO_CACHE_TTL)
+    
+    # Per-process cache of completed generation results, keyed by request_id
+    _result_cache = TTLCache(maxsize=256, ttl=RESULT_CACHE_TTL)
+    
     def __init__(self):
         self.api_key = settings.FAL_API_KEY
         self.base_url = "https://api.fal.ai/v1"
@@ -20,78 +72,184 @@ class FalAIClient:
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        self.session = _get_session()
+        self.rate_limiter = _get_rate_limiter()
+        self._cancelled = threading.Event()
+    
+    def cancel(self) -> None:
+        """Abort in-flight and future polls, e.g. when the caller is out of time"""
+        self._cancelled.set()
     
-    def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Dict:
-        """Make a request to the fal.ai API"""
+    def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None,
+                      response_headers: Optional[Dict] = None) -> Dict:
+        """Make a request to the fal.ai API, copying response headers into response_headers if given"""
         url = f"{self.base_url}{endpoint}"
         
         try:
-            if method == "GET":
-                response = requests.get(url, headers=self.headers)
-            elif method == "POST":
-                response = requests.post(url, headers=self.headers, json=data)
-            else:
-                raise ValueError(f"Unsupported method: {method}")
+            send = _METHOD_FUNCS[method]
+        except KeyError:
+            raise ValueError(f"Unsupported method: {method}")
+        
+        try:
+            for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+                self.rate_limiter.acquire()
+                response = send(self.session, url, self.headers, data)
+                self.rate_limiter.update(response.headers)
+                
+                # GETs are retried on 429 by the session adapter; a rejected POST was never
+                # processed, so it is safe to resend once the server allows it
+                if response.status_code != 429 or attempt == MAX_RATE_LIMIT_RETRIES:
+                    break
+                delay = _parse_number_header(response.headers.get("Retry-After"))
+                if self._cancelled.wait(delay if delay is not None else 2 ** attempt):
+                    break
             
             response.raise_for_status()
-            return response.json()
+            if response_headers is not None:
+                response_headers.update(response.headers)
+            return orjson.loads(response.content)
             
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
             raise Exception(f"fal.ai API request failed: {str(e)}")
     
-    def generate_image(self, prompt: str, model_id: str = "flux/dev", 
-                      parameters: Optional[Dict] = None) -> Dict:
-        """Generate an image using fal.ai"""
-        
-        # Default parameters
-        default_params = {
-            "prompt": prompt,
-            "image_size": "square",
-            "num_inference_steps": 28,
-            "guidance_scale": 3.5,
-            "num_images": 1,
-            "enable_safety_checker": True,
-            "output_format": "png"
-        }
+    def start_generation(self, prompt: str, model_id: str = "flux/dev",
+                         parameters: Optional[Dict] = None) -> Dict:
+        """Submit a generation, returning either its images or a request_id to poll"""
         
-        # Merge with provided parameters
+        # Merge provided parameters over the defaults
+        request_params = {"prompt": prompt, **DEFAULT_GENERATION_PARAMS}
         if parameters:
-            default_params.update(parameters)
+            request_params.update(parameters)
         
         # Submit generation request
         endpoint = f"/models/{model_id}/generate"
-        result = self._make_request("POST", endpoint, default_params)
+        result = self._make_request("POST", endpoint, request_params)
         
         # fal.ai returns results immediately or a request_id for polling
+        if "images" not in result and "request_id" not in result:
+            raise Exception("Unexpected response from fal.ai")
+        return result
+    
+    def generate_image(self, prompt: str, model_id: str = "flux/dev", 
+                      parameters: Optional[Dict] = None) -> Dict:
+        """Generate an image using fal.ai"""
+        result = self.start_generation(prompt, model_id, parameters)
         if "images" in result:
             return result
-        elif "request_id" in result:
-            # Poll for results
-            return self._poll_for_results(result["request_id"])
-        else:
-            raise Exception("Unexpected response from fal.ai")
+        return self._poll_for_results(result["request_id"])
     
     def _poll_for_results(self, request_id: str, max_attempts: int = 60, 
-                         interval: int = 2) -> Dict:
-        """Poll for generation results"""
+                         interval: float = 2, initial_interval: float = 0.25,
+                         timeout: float = POLL_TIMEOUT) -> Dict:
+        """Poll for generation results, backing off exponentially up to interval"""
+        cached = self._result_cache.get(request_id)
+        if cached is not None:
+            return cached
+        
         endpoint = f"/requests/{request_id}"
+        deadline = time.monotonic() + timeout
+        wait = min(LONG_POLL_SECONDS, int(timeout))
         
         for attempt in range(max_attempts):
-            result = self._make_request("GET", endpoint)
+            headers = {}
+            result = self._make_request("GET", f"{endpoint}?wait={wait}", response_headers=headers)
             
             if result.get("status") == "completed":
-                return result.get("result", {})
+                return self._store_result(request_id, result)
             elif result.get("status") == "failed":
                 raise Exception(f"Generation failed: {result.get('error', 'Unknown error')}")
             
-            time.sleep(interval)
+            # Fast generations are picked up quickly; slow ones settle at interval
+            delay = min(interval, initial_interval * 2 ** attempt) + random.uniform(0, POLL_JITTER)
+            retry_after = _parse_number_header(headers.get("Retry-After"))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            delay = min(delay, remaining)
+            # A held request must not outlast the deadline either
+            wait = min(LONG_POLL_SECONDS, int(remaining - delay))
+            
+            # Waiting on the event (rather than sleeping) lets cancel() wake us immediately
+            if self._cancelled.wait(delay):
+                raise Exception("Generation cancelled")
         
         raise Exception("Generation timed out")
     
+    def _store_result(self, request_id: str, response: Dict) -> Dict:
+        """Extract a completed request's result and remember it"""
+        result = response.get("result", {})
+        self._result_cache.set(request_id, result)
+        return result
+    
+    def _check_status(self, request_id: str, wait: int = 0) -> Optional[Any]:
+        """Fetch one request's status: its result, a failure exception, or None while pending"""
+        cached = self._result_cache.get(request_id)
+        if cached is not None:
+            return cached
+        
+        endpoint = f"/requests/{request_id}"
+        if wait:
+            endpoint = f"{endpoint}?wait={wait}"
+        try:
+            result = self._make_request("GET", endpoint)
+        except Exception as e:
+            return e
+        
+        if result.get("status") == "completed":
+            return self._store_result(request_id, result)
+        elif result.get("status") == "failed":
+            return Exception(f"Generation failed: {result.get('error', 'Unknown error')}")
+        return None
+    
+    def poll_batch(self, request_ids: List[str], max_attempts: int = 60,
+                   interval: float = 2, initial_interval: float = 0.25,
+                   timeout: float = POLL_TIMEOUT) -> Dict[str, Any]:
+        """Poll several requests on one shared schedule, mapping each ID to its result or exception"""
+        results = {}
+        pending = list(request_ids)
+        deadline = time.monotonic() + timeout
+        wait = min(LONG_POLL_SECONDS, int(timeout))
+        
+        for attempt in range(max_attempts):
+            # Held requests only overlap while every pending one has a worker of its own;
+            # beyond that they would queue behind each other and overrun the deadline
+            tick_wait = wait if len(pending) <= MAX_BATCH_WORKERS else 0
+            outcomes = _BATCH_POOL.map(lambda request_id: self._check_status(request_id, tick_wait), pending)
+            for request_id, outcome in zip(pending, outcomes):
+                if outcome is not None:
+                    results[request_id] = outcome
+            pending = [request_id for request_id in pending if request_id not in results]
+            if not pending:
+                return results
+            
+            delay = min(interval, initial_interval * 2 ** attempt) + random.uniform(0, POLL_JITTER)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            delay = min(delay, remaining)
+            wait = min(LONG_POLL_SECONDS, int(remaining - delay))
+            
+            if self._cancelled.wait(delay):
+                for request_id in pending:
+                    results[request_id] = Exception("Generation cancelled")
+                return results
+        
+        for request_id in pending:
+            results[request_id] = Exception("Generation timed out")
+        return results
+    
     def get_model_info(self, model_id: str = "flux/dev") -> Dict:
-        """Get information about a model"""
-        endpoint = f"/models/{model_id}"
-        return self._make_request("GET", endpoint)
+        """Get information about a model, served from cache when possible"""
+        info = self._model_info_cache.get(model_id)
+        if info is None:
+            endpoint = f"/models/{model_id}"
+            info = self._make_request("GET", endpoint)
+            self._model_info_cache.set(model_id, info)
+        
+        # Callers may mutate the result, nested values included, so hand out a copy
+        return copy.deepcopy(info)
 
 
 class ImageGenerator:
@@ -129,27 +287,55 @@ class ImageGenerator:
                 }
             }
         }
+        
+        # Per-model request parameters that don't depend on the filters
+        self._model_params = {
+            key: MappingProxyType({**config["parameters"], "num_images": 1})
+            for key, config in self.models.items()
+        }
+        
+        # Per-image cost by model key, for cost estimates
+        self._costs = {key: config["cost_cents"] for key, config in self.models.items()}
     
-    def generate_from_filters(self, filters: Dict[str, Any], 
-                            model_key: str = "flux_dev") -> List[Dict]:
-        """Generate images based on filter parameters"""
+    def _prepare_generation(self, filters: Dict[str, Any], model_key: str) -> Tuple[Dict, str, Dict]:
+        """Resolve the model, prompt and request parameters for one image"""
         
         # Get model configuration
-        model_config = self.models.get(model_key, self.models["flux_dev"])
+        if model_key not in self.models:
+            model_key = "flux_dev"
+        model_config = self.models[model_key]
         
         # Build prompt from filters
         prompt = self._build_prompt(filters)
         
-        # Prepare parameters
+        # Prepare parameters; we generate one image at a time for better control
         parameters = {
-            **model_config["parameters"],
-            "seed": filters.get("seed"),
-            "image_size": self._get_image_size(filters.get("aspect_ratio", "square")),
-            "num_images": 1  # We generate one at a time for better control
+            **self._model_params[model_key],
+            "image_size": self._get_image_size(filters.get("aspect_ratio", "square"))
         }
-        
-        # Remove None values
-        parameters = {k: v for k, v in parameters.items() if v is not None}
+        if filters.get("seed") is not None:
+            parameters["seed"] = filters["seed"]
+        return model_config, prompt, parameters
+    
+    def _build_images(self, result: Dict, model_config: Dict, prompt: str, parameters: Dict) -> List[Dict]:
+        """Turn a fal.ai result into image records"""
+        images = []
+        for image_data in result.get("images", []):
+            images.append({
+                "url": image_data.get("url"),
+                "seed": result.get("seed", image_data.get("seed")),
+                "prompt": prompt,
+                "model_id": model_config["id"],
+                "model_name": model_config["name"],
+                "cost_cents": model_config["cost_cents"],
+                "parameters": parameters
+            })
+        return images
+    
+    def generate_from_filters(self, filters: Dict[str, Any], 
+                            model_key: str = "flux_dev") -> List[Dict]:
+        """Generate images based on filter parameters"""
+        model_config, prompt, parameters = self._prepare_generation(filters, model_key)
         
         try:
             # Generate image
@@ -158,105 +344,97 @@ class ImageGenerator:
                 model_id=model_config["id"],
                 parameters=parameters
             )
-            
-            # Process results
-            images = []
-            for image_data in result.get("images", []):
-                images.append({
-                    "url": image_data.get("url"),
-                    "seed": result.get("seed", image_data.get("seed")),
-                    "prompt": prompt,
-                    "model_id": model_config["id"],
-                    "model_name": model_config["name"],
-                    "cost_cents": model_config["cost_cents"],
-                    "parameters": parameters
-                })
-            
-            return images
+            return self._build_images(result, model_config, prompt, parameters)
             
         except Exception as e:
             raise Exception(f"Image generation failed: {str(e)}")
     
     def _build_prompt(self, filters: Dict[str, Any]) -> str:
         """Build a prompt from filter parameters"""
-        prompt_parts = []
-        
-        # Base description
         base = filters.get("base_prompt", "A human figure reference")
-        prompt_parts.append(base)
-        
-        # Body type
-        if filters.get("body_type"):
-            prompt_parts.append(f"{filters['body_type']} body type")
-        
-        # Pose
-        if filters.get("pose"):
-            prompt_parts.append(f"in {filters['pose']} pose")
-        
-        # Clothing
-        if filters.get("clothing"):
-            prompt_parts.append(f"wearing {filters['clothing']}")
-        
-        # Lighting
-        if filters.get("lighting"):
-            prompt_parts.append(f"with {filters['lighting']} lighting")
+        values = tuple(filters.get(key) for key, _, _ in _PROMPT_PARTS)
         
-        # Background
-        if filters.get("background"):
-            prompt_parts.append(f"{filters['background']} background")
-        else:
-            prompt_parts.append("simple neutral background")
-        
-        # Style modifiers
-        style_parts = [
-            "professional reference photo",
-            "full body visible",
-            "clear details",
-            "suitable for figure drawing practice"
-        ]
-        
-        # Combine all parts
-        full_prompt = ", ".join(prompt_parts) + ". " + ", ".join(style_parts)
-        
-        # Add negative prompt guidance
-        full_prompt += " --no nsfw, nude, explicit, inappropriate"
-        
-        return full_prompt
+        # Batches repeat the same filters, so identical prompts come from the cache
+        try:
+            return _compose_prompt(base, values)
+        except TypeError:
+            # Unhashable filter values can't be cached
+            return _compose_prompt.__wrapped__(base, values)
     
-    def _get_image_size(self, aspect_ratio: str) -> str:
+    @staticmethod
+    def _get_image_size(aspect_ratio: str) -> str:
         """Convert aspect ratio to fal.ai image size parameter"""
-        size_map = {
-            "square": "square",
-            "portrait": "portrait_4_3", 
-            "landscape": "landscape_4_3",
-            "wide": "landscape_16_9",
-            "tall": "portrait_16_9"
-        }
-        return size_map.get(aspect_ratio, "square")
+        return IMAGE_SIZE_MAP.get(aspect_ratio, "square")
     
     def estimate_cost(self, batch_size: int, model_key: str = "flux_dev") -> int:
         """Estimate cost in cents for a batch of images"""
-        model_config = self.models.get(model_key, self.models["flux_dev"])
-        return batch_size * model_config["cost_cents"]
+        return batch_size * self._costs.get(model_key, self._costs["flux_dev"])
+    
+    def estimate_costs(self, batch_sizes: List[int], model_keys: List[str]) -> List[int]:
+        """Estimate cost in cents for several (batch size, model) pairs"""
+        costs = self._costs
+        default = costs["flux_dev"]
+        return [size * costs.get(key, default) for size, key in zip(batch_sizes, model_keys)]
     
     def generate_batch(self, filters: Dict[str, Any], batch_size: int,
                       model_key: str = "flux_dev") -> List[Dict]:
         """Generate a batch of images with variations"""
-        images = []
+        # Model, prompt and shared parameters are the same for every image in the batch
+        model_config, prompt, parameters = self._prepare_generation(filters, model_key)
         
         # Generate each image with a different seed if not specified
         base_seed = filters.get("seed")
+        prepared = [
+            (model_config, prompt, {**parameters, "seed": base_seed + i} if base_seed is not None else parameters)
+            for i in range(batch_size)
+        ]
         
-        for i in range(batch_size):
-            # Vary the seed for each image
-            if base_seed is not None:
-                filters["seed"] = base_seed + i
-            
+        submitted = self._submit_batch(prepared)
+        return self._collect_batch(prepared, submitted)
+    
+    def _submit_batch(self, prepared: List[Tuple[Dict, str, Dict]]) -> List[Any]:
+        """Start every generation up front, returning each submission response or its exception"""
+        if len(prepared) == 1:
+            # A single image gains nothing from a pool hand-off, so submit it inline
+            model_config, prompt, parameters = prepared[0]
+            try:
+                return [self.client.start_generation(prompt, model_config["id"], parameters)]
+            except Exception as e:
+                return [e]
+        
+        # Submitting concurrently lets fal.ai work on the whole batch at once
+        futures = [
+            _BATCH_POOL.submit(self.client.start_generation, prompt, model_config["id"], parameters)
+            for model_config, prompt, parameters in prepared
+        ]
+        submitted = []
+        for future in futures:
             try:
-                batch_images = self.generate_from_filters(filters, model_key)
-                images.extend(batch_images)
+                submitted.append(future.result())
             except Exception as e:
+                submitted.append(e)
+        return submitted
+    
+    def _collect_batch(self, prepared: List[Tuple[Dict, str, Dict]], submitted: List[Any]) -> List[Dict]:
+        """Poll the still-running requests and build image records for every successful one"""
+        # Requests still running are polled together on one schedule
+        pending = [
+            response["request_id"] for response in submitted
+            if not isinstance(response, Exception) and "images" not in response
+        ]
+        polled = self.client.poll_batch(pending) if pending else {}
+        
+        # Collect in submission order so results follow the seed sequence
+        images = []
+        for i, ((model_config, prompt, parameters), response) in enumerate(zip(prepared, submitted)):
+            result = response
+            if not isinstance(response, Exception) and "images" not in response:
+                result = polled[response["request_id"]]
+            
+            if isinstance(result, Exception):
                 # Log error but continue with other images
-                print(f"Failed to generate image {i+1}: {str(e)}")
+                logger.warning("Failed to generate image %d: Image generation failed: %s", i + 1, result)
+                continue
+            images.extend(self._build_images(result, model_config, prompt, parameters))
         
         return images
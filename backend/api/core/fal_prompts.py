@@ -0,0 +1,47 @@
+"""
+fal.ai prompt building
+Turns generation filters into prompts and image size parameters
+"""
+
+from functools import lru_cache
+from typing import Tuple
+
+
+# Style modifiers and negative prompt guidance appended to every prompt
+PROMPT_STYLE_SUFFIX = (
+    ". professional reference photo, full body visible, clear details, "
+    "suitable for figure drawing practice"
+    " --no nsfw, nude, explicit, inappropriate"
+)
+
+# Prompt fragments in prompt order: (filter key, format, text used when the filter is unset)
+_PROMPT_PARTS = (
+    ("body_type", "{} body type", None),
+    ("pose", "in {} pose", None),
+    ("clothing", "wearing {}", None),
+    ("lighting", "with {} lighting", None),
+    ("background", "{} background", "simple neutral background")
+)
+
+# Aspect ratio to fal.ai image size parameter
+IMAGE_SIZE_MAP = {
+    "square": "square",
+    "portrait": "portrait_4_3",
+    "landscape": "landscape_4_3",
+    "wide": "landscape_16_9",
+    "tall": "portrait_16_9"
+}
+
+
+@lru_cache(maxsize=256)
+def _compose_prompt(base: str, values: Tuple) -> str:
+    """Join the base description and filter fragments into a full prompt"""
+    parts = [base]
+    for (_, fmt, default), value in zip(_PROMPT_PARTS, values):
+        if value:
+            parts.append(fmt.format(value))
+        elif default:
+            parts.append(default)
+    
+    # Combine all parts with the fixed style modifiers and negative prompt
+    return ", ".join(parts) + PROMPT_STYLE_SUFFIX
@@ -0,0 +1,102 @@
+"""
+fal.ai request pacing
+Token bucket shared by every fal.ai client in the process, tuned by the
+X-RateLimit-* headers the API reports
+"""
+
+import threading
+import time
+from typing import Optional
+
+
+# Default pacing for fal.ai requests (per second, and burst size) until the API
+# reports its own limits through X-RateLimit-* headers
+RATE_LIMIT_PER_SECOND = 10
+RATE_LIMIT_BURST = 10
+
+# Reported limits never slow requests below this fraction of the default pace, and
+# no single wait for a token lasts longer than RATE_LIMIT_MAX_WAIT seconds
+RATE_LIMIT_MIN_FRACTION = 0.1
+RATE_LIMIT_MAX_WAIT = 2.0
+
+# X-RateLimit-Reset values above this are epoch timestamps rather than seconds
+_EPOCH_THRESHOLD = 1e9
+
+_rate_limiter = None
+
+
+def _parse_number_header(value: Optional[str]) -> Optional[float]:
+    """Read a numeric header such as Retry-After in seconds, ignoring other forms"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class _RateLimiter:
+    """Thread-safe token bucket pacing requests across every client in the process"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.default_rate = rate
+        self.min_rate = rate * RATE_LIMIT_MIN_FRACTION
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        # Monotonic time at which a reported rate lapses back to the default
+        self.reset_at = None
+        self._lock = threading.Lock()
+    
+    def _refill(self) -> None:
+        """Add the tokens accrued since the last refill; callers hold the lock"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+        if self.reset_at is not None and now >= self.reset_at:
+            self.rate = self.default_rate
+            self.reset_at = None
+    
+    def acquire(self) -> None:
+        """Block until a request may be sent"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                # Short waits let a lapsed reset window restore the rate promptly
+                wait = min((1 - self.tokens) / self.rate, RATE_LIMIT_MAX_WAIT)
+            time.sleep(wait)
+    
+    def update(self, headers) -> None:
+        """Adopt the limits reported by X-RateLimit-* response headers, if any"""
+        limit = _parse_number_header(headers.get("X-RateLimit-Limit"))
+        remaining = _parse_number_header(headers.get("X-RateLimit-Remaining"))
+        reset = _parse_number_header(headers.get("X-RateLimit-Reset"))
+        if reset and reset > _EPOCH_THRESHOLD:
+            reset = max(0.0, reset - time.time())
+        
+        with self._lock:
+            self._refill()
+            if limit:
+                self.capacity = limit
+            if remaining is not None:
+                self.tokens = min(self.tokens, remaining)
+                # Spread what is left of the window's quota evenly until it resets
+                if reset:
+                    self._set_rate(max(remaining, 1) / reset, reset)
+            elif limit and reset:
+                self._set_rate(limit / reset, reset)
+    
+    def _set_rate(self, rate: float, reset: float) -> None:
+        """Pace requests at a reported rate until the window resets; callers hold the lock"""
+        self.rate = max(rate, self.min_rate)
+        self.reset_at = self.last_refill + reset
+
+
+def _get_rate_limiter() -> _RateLimiter:
+    """Return the process-wide rate limiter shared by fal.ai requests"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = _RateLimiter(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST)
+    return _rate_limiter
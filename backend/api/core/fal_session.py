@@ -0,0 +1,48 @@
+"""
+fal.ai connection pooling
+Shares one keep-alive HTTP session and one batch worker pool across every
+fal.ai client in the process
+"""
+
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# Upper bound on concurrent fal.ai requests issued by one batch
+MAX_BATCH_WORKERS = 8
+
+# Keep-alive connections held open to fal.ai: one per batch worker plus headroom for
+# requests made outside a batch, so concurrent polls never open throwaway connections
+SESSION_POOL_SIZE = MAX_BATCH_WORKERS + 4
+
+# (connect, read) timeouts in seconds; a stalled pooled connection otherwise blocks
+# its worker indefinitely. Reads allow for generations that complete synchronously
+REQUEST_TIMEOUT = (3.05, 60)
+
+# Session call for each supported HTTP method
+_METHOD_FUNCS = {
+    "GET": lambda session, url, headers, data: session.get(url, headers=headers, timeout=REQUEST_TIMEOUT),
+    "POST": lambda session, url, headers, data: session.post(url, headers=headers, json=data,
+                                                             timeout=REQUEST_TIMEOUT)
+}
+
+_session = None
+
+# Batch generations share one pool, so warm workers reuse threads rather than
+# spawning fresh ones for every batch
+_BATCH_POOL = ThreadPoolExecutor(max_workers=MAX_BATCH_WORKERS, thread_name_prefix='fal-batch')
+
+
+def _get_session() -> requests.Session:
+    """Return the process-wide keep-alive session for fal.ai requests"""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        # Retry transient failures on idempotent requests only (POST is not retried)
+        retries = Retry(total=3, backoff_factor=0.2, status_forcelist=[429, 500, 502, 503, 504])
+        # Every request goes to one host, so a single pool holds all the connections
+        _session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=SESSION_POOL_SIZE,
+                                               max_retries=retries))
+    return _session
@@ -0,0 +1,12 @@
+"""
+Repositories for the FigureForge entities stored in the DynamoDB table
+"""
+
+from api.core.repositories.images import ImageCreateRequest, ImageRepository
+from api.core.repositories.jobs import JobRepository
+from api.core.repositories.subscriptions import SubscriptionRepository
+from api.core.repositories.users import UserRepository
+
+__all__ = [
+    'ImageCreateRequest', 'ImageRepository', 'JobRepository', 'SubscriptionRepository', 'UserRepository'
+]
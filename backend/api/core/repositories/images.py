@@ -0,0 +1,246 @@
+"""
+Image repository
+Stores image records with their tag and user index entries
+"""
+
+import copy
+import uuid
+from dataclasses import dataclass, field
+from functools import partial
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Any, Tuple, Union
+from api.core.cache import TTLCache
+from api.core.dynamodb_encoding import decode_prompt, encode_prompt, epoch_now
+from api.core.dynamodb_utils import TRANSACT_WRITE_LIMIT, get_dynamodb_client
+
+
+@dataclass(slots=True)
+class ImageCreateRequest:
+    """Typed input for ImageRepository.create_image"""
+    url: str
+    image_id: Optional[str] = None
+    user_id: Optional[str] = None
+    tags: List[str] = field(default_factory=list)
+    prompt_json: Dict[str, Any] = field(default_factory=dict)
+    provider: str = 'fal.ai'
+    provider_model_id: Optional[str] = None
+    cost_cents: int = 0
+    public: bool = True
+    private_gallery_ids: List[str] = field(default_factory=list)
+
+
+class ImageRepository:
+    """Repository for Image entity operations"""
+    
+    # Image fields copied onto tag/user index items so listings need no second read
+    SUMMARY_FIELDS = ['image_id', 'user_id', 'url', 'tags', 'favorited_count', 'public', 'flag_status', 'deleted_at']
+    INDEX_PROJECTION = ['pk', 'sk', 'created_at'] + SUMMARY_FIELDS
+    
+    # Fields left off the stored item while None; NULL attributes still bill for their names
+    NULLABLE_FIELDS = ['user_id', 'provider_model_id', 'deleted_at']
+    
+    # Short-lived per-process cache of image items, keyed by image_id
+    _cache = TTLCache(maxsize=10_000, ttl=30)
+    
+    def __init__(self):
+        self.db = get_dynamodb_client()
+    
+    def create_image(self, image_data: Union[ImageCreateRequest, Dict[str, Any]]) -> Dict[str, Any]:
+        """Create a new image record"""
+        image = self._new_image(image_data)
+        
+        # Store the prompt as a JSON string (or compressed blob) rather than a nested map
+        stored_image = {k: v for k, v in image.items() if v is not None}
+        stored_image['prompt_json'] = encode_prompt(image['prompt_json'])
+        
+        # A retried create returns the existing record instead of rewriting it and its indexes
+        if not self._write_new_image(stored_image, self._build_index_items(image)):
+            return self.get_image(image['image_id'])
+        return image
+    
+    @staticmethod
+    def _new_image(image_data: Union[ImageCreateRequest, Dict[str, Any]]) -> Dict[str, Any]:
+        """Build a new image record from a typed request or a plain dict"""
+        # Slotted requests are read by attribute and plain dicts by key; getattr takes the same defaults
+        if type(image_data) is ImageCreateRequest:
+            get = partial(getattr, image_data)
+            url = image_data.url
+        else:
+            get = image_data.get
+            url = image_data['url']
+        
+        # Callers may supply the ID (e.g. the S3 key's) so that retries are idempotent
+        image_id = get('image_id') or uuid.uuid4().hex
+        return {
+            'pk': f'IMG#{image_id}',
+            'sk': 'META',
+            'image_id': image_id,
+            'user_id': get('user_id'),
+            'url': url,
+            'tags': get('tags', []),
+            'prompt_json': get('prompt_json', {}),
+            'provider': get('provider', 'fal.ai'),
+            'provider_model_id': get('provider_model_id'),
+            'cost_cents': get('cost_cents', 0),
+            'favorited_count': 0,
+            'public': get('public', True),
+            'private_gallery_ids': get('private_gallery_ids', []),
+            'flag_status': 'clean',
+            'created_at': epoch_now(),
+            'deleted_at': None
+        }
+    
+    def _write_new_image(self, stored_image: Dict[str, Any], index_items: List[Dict[str, Any]]) -> bool:
+        """Write a new image record and its index entries, or return False if the record exists"""
+        if not index_items:
+            return self.db.put_item(stored_image, condition='attribute_not_exists(pk)') is not None
+        
+        # The record and its index entries go out in one round trip
+        in_transaction = index_items[:TRANSACT_WRITE_LIMIT - 1]
+        created = self.db.transact_write(
+            [{'Put': {'Item': stored_image, 'ConditionExpression': 'attribute_not_exists(pk)'}}]
+            + [{'Put': {'Item': index_item}} for index_item in in_transaction],
+            ignore_condition_failure=True
+        )
+        if created and len(index_items) > len(in_transaction):
+            self.db.batch_put(index_items[len(in_transaction):])
+        return created
+    
+    def _decode_image(self, image: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Parse the stored prompt_json back into a dict and restore omitted fields"""
+        if image:
+            if 'prompt_json' in image:
+                image['prompt_json'] = decode_prompt(image['prompt_json'])
+            for field in self.NULLABLE_FIELDS:
+                image.setdefault(field, None)
+        return image
+    
+    def update_image(self, image_id: str, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Update image fields in place, returning None if the image does not exist"""
+        if 'prompt_json' in updates:
+            updates = {**updates, 'prompt_json': encode_prompt(updates['prompt_json'])}
+        self._cache.pop(image_id)
+        return self._decode_image(self.db.update_fields(f'IMG#{image_id}', 'META', updates))
+    
+    def _build_index_items(self, image: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Build the tag and user index entries for an image"""
+        summary = {field: image[field] for field in self.SUMMARY_FIELDS if image.get(field) is not None}
+        image_sk = f'IMG#{image["image_id"]}'
+        
+        # Create tag index entries, one per distinct tag; a repeated key would fail the whole write
+        items = [
+            {'pk': f'TAG#{tag}', 'sk': image_sk, 'created_at': image['created_at'], **summary}
+            for tag in dict.fromkeys(image['tags'])
+        ]
+        
+        # Create user image index entry if user_id exists
+        if image['user_id']:
+            items.append({
+                'pk': f'USER#{image["user_id"]}',
+                'sk': image_sk,
+                'created_at': image['created_at'],
+                **summary
+            })
+        
+        return items
+    
+    def save_image_indexes(self, image: Dict[str, Any], previous_tags: Optional[List[str]] = None) -> None:
+        """Rewrite index entries so their summary matches the image, dropping those of removed tags"""
+        # Removed tags' entries would otherwise keep serving the old summary (visibility included)
+        current_tags = set(image['tags'])
+        removed_tags = [tag for tag in dict.fromkeys(previous_tags or []) if tag not in current_tags]
+        if removed_tags:
+            self.db.batch_delete([(f'TAG#{tag}', f'IMG#{image["image_id"]}') for tag in removed_tags])
+        
+        index_items = self._build_index_items(image)
+        if index_items:
+            self.db.batch_put(index_items)
+    
+    def delete_image(self, image: Dict[str, Any]) -> bool:
+        """Soft delete an image and its index entries"""
+        self._cache.pop(image['image_id'])
+        keys = [(image['pk'], image['sk'])]
+        keys.extend((index_item['pk'], index_item['sk']) for index_item in self._build_index_items(image))
+        return self.db.delete_items(keys)
+    
+    def get_image(self, image_id: str) -> Optional[Dict[str, Any]]:
+        """Get image by ID"""
+        image = self._cache.get(image_id)
+        if image is None:
+            image = self._decode_image(self.db.get_item_fast(f'IMG#{image_id}', 'META'))
+            if image is None:
+                return None
+            self._cache.set(image_id, image)
+        
+        # Callers mutate the result (signed URLs, removed fields, tag lists), so hand out a deep copy
+        return copy.deepcopy(image)
+    
+    def get_images(self, image_ids: List[str]) -> List[Dict[str, Any]]:
+        """Get several images by ID in a single batched read"""
+        cached = {}
+        for image_id in image_ids:
+            image = self._cache.get(image_id)
+            if image is not None:
+                cached[image_id] = image
+        
+        missing_ids = [image_id for image_id in image_ids if image_id not in cached]
+        if missing_ids:
+            for image in self.db.batch_get([(f'IMG#{image_id}', 'META') for image_id in missing_ids]):
+                image = self._decode_image(image)
+                self._cache.set(image['image_id'], image)
+                cached[image['image_id']] = image
+        
+        return [copy.deepcopy(cached[image_id]) for image_id in image_ids if image_id in cached]
+    
+    def _resolve_index_items(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Turn index entries into image summaries, skipping deleted images"""
+        image_items = [item for item in items if item['sk'].startswith('IMG#')]
+        
+        # Entries written before summaries were denormalized still need the full record
+        missing_ids = [item['sk'].partition('#')[2] for item in image_items if 'url' not in item]
+        full_images = {image['image_id']: image for image in self.get_images(missing_ids)} if missing_ids else {}
+        
+        images = []
+        for item in image_items:
+            if 'url' in item:
+                if item.get('deleted_at'):
+                    continue
+                # Summaries omit None fields on write; hand them back in the full shape
+                for field in self.SUMMARY_FIELDS:
+                    item.setdefault(field, None)
+                images.append(item)
+                continue
+            image = full_images.get(item['sk'].partition('#')[2])
+            if image and not image.get('deleted_at'):
+                images.append(image)
+        return images
+    
+    def _page_index_images(self, items: Iterator[Dict[str, Any]], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Fill a page of images from streamed index entries, reading on past deleted ones"""
+        images = []
+        last_sk = None
+        while len(images) < limit:
+            # Never take more entries than images still needed, so the cursor cannot skip any
+            chunk = list(islice(items, limit - len(images)))
+            if not chunk:
+                return images, None
+            images.extend(self._resolve_index_items(chunk))
+            last_sk = chunk[-1]['sk']
+        
+        return images, last_sk
+    
+    def get_images_by_tag(self, tag: str, limit: int = 20, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Get images by tag"""
+        last_key = {'pk': f'TAG#{tag}', 'sk': cursor} if cursor else None
+        
+        items = self.db.iter_query(f'TAG#{tag}', last_evaluated_key=last_key,
+                                   projection=self.INDEX_PROJECTION, page_size=limit)
+        return self._page_index_images(items, limit)
+    
+    def get_user_images(self, user_id: str, limit: int = 20, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Get images by user"""
+        last_key = {'pk': f'USER#{user_id}', 'sk': cursor} if cursor else None
+        
+        items = self.db.iter_query(f'USER#{user_id}', last_evaluated_key=last_key, projection=self.INDEX_PROJECTION,
+                                   index_name='imagesByUser', page_size=limit)
+        return self._page_index_images(items, limit)
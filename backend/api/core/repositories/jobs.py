@@ -0,0 +1,108 @@
+"""
+Generation job repository
+Tracks generation jobs and their status index entries
+"""
+
+import uuid
+from typing import Dict, List, Optional, Any
+from api.core.dynamodb_encoding import build_update_params, epoch_now
+from api.core.dynamodb_utils import EXPIRED_ITEM_RETENTION_SECONDS, get_dynamodb_client
+
+
+class JobRepository:
+    """Repository for GenerationJob entity operations"""
+    
+    # Jobs in these statuses never change again, so their status index entries expire
+    TERMINAL_STATUSES = ('completed', 'failed')
+    
+    def __init__(self):
+        self.db = get_dynamodb_client()
+    
+    def create_job(self, user_id: str, filters: Dict[str, Any], batch_size: int) -> Dict[str, Any]:
+        """Create a new generation job"""
+        job_id = str(uuid.uuid4())
+        now = epoch_now()
+        status_sk = self._status_sort_key(now, job_id)
+        job = {
+            'pk': f'USER#{user_id}',
+            'sk': f'JOB#{job_id}',
+            'job_id': job_id,
+            'user_id': user_id,
+            'status': 'queued',
+            'filters': filters,
+            'batch_size': batch_size,
+            'image_ids': [],
+            'error': None,
+            'status_sk': status_sk,
+            'created_at': now,
+            'updated_at': now
+        }
+        
+        # Also create job status index entry
+        status_index = {
+            'pk': f'JOBSTATUS#{job["status"]}',
+            'sk': status_sk,
+            'job_id': job_id,
+            'user_id': user_id
+        }
+        self.db.batch_put([job, status_index])
+        
+        return job
+    
+    @staticmethod
+    def _status_sort_key(created_at: int, job_id: str) -> str:
+        """Sort key of a job's status index entry; the job_id keeps jobs created in the same second apart"""
+        return f'{created_at}#{job_id}'
+    
+    def get_job(self, user_id: str, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get job by ID"""
+        return self.db.get_item(f'USER#{user_id}', f'JOB#{job_id}')
+    
+    def update_job_status(self, user_id: str, job_id: str, status: str, 
+                         image_ids: Optional[List[str]] = None, error: Optional[str] = None) -> Dict[str, Any]:
+        """Update job status"""
+        job = self.get_job(user_id, job_id)
+        if not job:
+            raise ValueError(f"Job {job_id} not found")
+        
+        old_status = job['status']
+        updates = {'status': status, 'updated_at': epoch_now()}
+        if image_ids:
+            updates['image_ids'] = image_ids
+        if error:
+            updates['error'] = error
+        
+        # Jobs written before status_sk was stored are indexed under their bare created_at;
+        # their entry moves to the current key format on the next status change
+        old_status_sk = job.get('status_sk', str(job['created_at']))
+        status_sk = self._status_sort_key(job['created_at'], job_id)
+        if old_status != status and old_status_sk != status_sk:
+            updates['status_sk'] = status_sk
+        
+        # Update job, guarding against a concurrent status change since the read
+        job_update = build_update_params(updates)
+        job_update['ConditionExpression'] = '#status = :old_status'
+        job_update['ExpressionAttributeNames']['#status'] = 'status'
+        job_update['ExpressionAttributeValues'][':old_status'] = old_status
+        operations = [{'Update': {'Key': {'pk': job['pk'], 'sk': job['sk']}, **job_update}}]
+        
+        if old_status != status:
+            # Remove old status index entry outright; a tombstone would linger in its status partition
+            operations.append({'Delete': {'Key': {'pk': f'JOBSTATUS#{old_status}', 'sk': old_status_sk}}})
+            
+            # Create new status index entry
+            status_index = {
+                'pk': f'JOBSTATUS#{status}',
+                'sk': status_sk,
+                'job_id': job_id,
+                'user_id': user_id,
+                'created_at': updates['updated_at']
+            }
+            if status in self.TERMINAL_STATUSES:
+                status_index['expires_at'] = updates['updated_at'] + EXPIRED_ITEM_RETENTION_SECONDS
+            operations.append({'Put': {'Item': status_index}})
+        
+        self.db.transact_write(operations)
+        
+        job.update(updates)
+        return job
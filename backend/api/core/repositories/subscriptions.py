@@ -0,0 +1,134 @@
+"""
+Subscription repository
+Stores Stripe subscriptions and their index entries
+"""
+
+from typing import Dict, List, Optional, Any
+from api.core.dynamodb_encoding import build_update_params, epoch_now
+from api.core.dynamodb_utils import get_dynamodb_client
+
+
+class SubscriptionRepository:
+    """Repository for Subscription entity operations"""
+    
+    # Statuses kept in the sparse subsByStatus index; others carry no status_pk
+    INDEXED_STATUSES = ('active',)
+    
+    def __init__(self):
+        self.db = get_dynamodb_client()
+    
+    def create_subscription(self, user_id: str, stripe_sub_id: str, plan_id: str, 
+                          status: str, current_period_end: int,
+                          user_updates: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Create a new subscription, applying any user profile updates in the same transaction"""
+        now = epoch_now()
+        subscription = {
+            'pk': f'USER#{user_id}',
+            'sk': f'SUB#{stripe_sub_id}',
+            'subscription_id': stripe_sub_id,
+            'user_id': user_id,
+            'plan_id': plan_id,
+            'status': status,
+            'current_period_end': current_period_end,
+            'created_at': now,
+            'updated_at': now
+        }
+        if status in self.INDEXED_STATUSES:
+            subscription['status_pk'] = self._status_key(user_id, status)
+        
+        # Also create Stripe subscription index
+        stripe_index = {
+            'pk': f'SUB#{stripe_sub_id}',
+            'sk': f'USER#{user_id}',
+            'created_at': now
+        }
+        
+        if user_updates:
+            self.db.transact_write([
+                {'Put': {'Item': subscription}},
+                {'Put': {'Item': stripe_index}},
+                self._user_update_operation(user_id, user_updates)
+            ])
+        else:
+            self.db.batch_put([subscription, stripe_index])
+        
+        return subscription
+    
+    @staticmethod
+    def _status_key(user_id: str, status: str) -> str:
+        """Partition key of the subsByStatus index"""
+        return f'USER#{user_id}#STATUS#{status}'
+    
+    @staticmethod
+    def _user_update_operation(user_id: str, user_updates: Dict[str, Any]) -> Dict[str, Any]:
+        """Transaction operation updating an existing user profile"""
+        update_params = build_update_params(user_updates)
+        update_params['ConditionExpression'] = 'attribute_exists(pk)'
+        return {'Update': {'Key': {'pk': f'USER#{user_id}', 'sk': 'PROFILE'}, **update_params}}
+    
+    def get_subscription(self, user_id: str, stripe_sub_id: str) -> Optional[Dict[str, Any]]:
+        """Get subscription by ID"""
+        return self.db.get_item(f'USER#{user_id}', f'SUB#{stripe_sub_id}')
+    
+    def get_user_subscriptions(self, user_id: str) -> List[Dict[str, Any]]:
+        """Get all subscriptions for a user"""
+        # Read every page; a single query stops at 1MB of items
+        items = self.db.iter_query(f'USER#{user_id}', sk_prefix='SUB#')
+        return [item for item in items if item.get('subscription_id')]
+    
+    def get_active_subscription(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get the active subscription for a user"""
+        items, _ = self.db.query_gsi(
+            'subsByStatus',
+            self._status_key(user_id, 'active'),
+            limit=1,
+            pk_attr='status_pk'
+        )
+        if items:
+            return items[0]
+        
+        # Subscriptions activated before status_pk existed are missing from the index,
+        # so look through the user's subscriptions and index any active one found
+        for subscription in self.get_user_subscriptions(user_id):
+            if subscription.get('status') != 'active':
+                continue
+            if 'status_pk' not in subscription:
+                status_pk = self._status_key(user_id, 'active')
+                subscription = self.db.update_fields(subscription['pk'], subscription['sk'],
+                                                     {'status_pk': status_pk}) or subscription
+            return subscription
+        return None
+    
+    def update_subscription(self, user_id: str, stripe_sub_id: str, updates: Dict[str, Any],
+                            user_updates: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Update subscription, applying any user profile updates in the same transaction"""
+        updates = {**updates, 'updated_at': epoch_now()}
+        remove = None
+        if 'status' in updates:
+            # Keep the subsByStatus index key in step with the status, dropping the
+            # subscription from the index once it leaves the indexed statuses
+            if updates['status'] in self.INDEXED_STATUSES:
+                updates['status_pk'] = self._status_key(user_id, updates['status'])
+            else:
+                remove = ['status_pk']
+        
+        if user_updates:
+            update_params = build_update_params(updates, remove)
+            update_params['ConditionExpression'] = 'attribute_exists(pk)'
+            updated = self.db.transact_write([
+                {'Update': {'Key': {'pk': f'USER#{user_id}', 'sk': f'SUB#{stripe_sub_id}'}, **update_params}},
+                self._user_update_operation(user_id, user_updates)
+            ], ignore_condition_failure=True)
+            
+            # Transactions return no attributes, so read back the full item
+            subscription = self.db.get_item(f'USER#{user_id}', f'SUB#{stripe_sub_id}', consistent=True)
+            if not updated and subscription:
+                # The subscription exists, so the failed condition was the user profile's
+                raise ValueError(f"User {user_id} not found")
+        else:
+            subscription = self.db.update_fields(f'USER#{user_id}', f'SUB#{stripe_sub_id}', updates, remove=remove)
+        
+        if not subscription:
+            raise ValueError(f"Subscription {stripe_sub_id} not found")
+        
+        return subscription
@@ -0,0 +1,86 @@
+"""
+User repository
+Reads and writes user profiles and their email index entries
+"""
+
+from typing import Dict, Optional, Any
+from api.core.dynamodb_encoding import epoch_now
+from api.core.dynamodb_utils import get_dynamodb_client
+
+
+class UserRepository:
+    """Repository for User entity operations"""
+    
+    def __init__(self):
+        self.db = get_dynamodb_client()
+    
+    def create_user(self, user_id: str, email: str, username: Optional[str] = None) -> Dict[str, Any]:
+        """Create a new user"""
+        now = epoch_now()
+        user = {
+            'pk': f'USER#{user_id}',
+            'sk': 'PROFILE',
+            'user_id': user_id,
+            'email': email,
+            'username': username or f'user_{user_id[:8]}',
+            'role': 'user',
+            'quota_used': 0,
+            'quota_limit': 0,  # Will be set based on subscription
+            'created_at': now
+        }
+        
+        # Also create email index entry
+        email_index = {
+            'pk': f'EMAIL#{email}',
+            'sk': f'USER#{user_id}',
+            'created_at': now
+        }
+        
+        # Write both in one round trip; a retried create must not overwrite the user or rewrite its index
+        created = self.db.transact_write([
+            {'Put': {'Item': user, 'ConditionExpression': 'attribute_not_exists(pk)'}},
+            {'Put': {'Item': email_index}}
+        ], ignore_condition_failure=True)
+        if not created:
+            return self.get_user(user_id)
+        
+        return user
+    
+    def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get user by ID"""
+        return self.db.get_item_fast(f'USER#{user_id}', 'PROFILE')
+    
+    def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        """Get user by email using GSI"""
+        items, _ = self.db.query_gsi('byEmail', f'EMAIL#{email}', limit=1)
+        if items:
+            user_id = items[0]['sk'].partition('#')[2]
+            return self.get_user(user_id)
+        return None
+    
+    def get_user_id_by_stripe_customer(self, customer_id: str) -> Optional[str]:
+        """Get the user ID linked to a Stripe customer using GSI"""
+        items, _ = self.db.query_gsi('byStripeCustomer', customer_id, limit=1,
+                                     projection=['user_id'], pk_attr='stripe_customer_id')
+        if items:
+            return items[0]['user_id']
+        return None
+    
+    def update_user(self, user_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
+        """Update user profile"""
+        user = self.db.update_fields(f'USER#{user_id}', 'PROFILE', updates)
+        if not user:
+            raise ValueError(f"User {user_id} not found")
+        
+        return user
+    
+    def adjust_quota_used(self, user_id: str, delta: int) -> Dict[str, Any]:
+        """Add to (or refund from) the user's used quota server-side, never going below zero"""
+        user = self.db.increment_field(f'USER#{user_id}', 'PROFILE', 'quota_used', delta)
+        if user is None and delta < 0:
+            # Refunding more than was used clamps the counter at zero
+            user = self.db.update_fields(f'USER#{user_id}', 'PROFILE', {'quota_used': 0})
+        if not user:
+            raise ValueError(f"User {user_id} not found")
+        
+        return user
@@ -4,57 +4,193 @@ Handles uploading images and generating secure access URLs
 """
 
 import boto3
+import io
+import os
 import uuid
-import mimetypes
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, Optional, Tuple
+from functools import lru_cache
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple, Union
 from django.conf import settings
+from boto3.exceptions import S3UploadFailedError
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.backends import default_backend
+from api.core.cache import TTLCache
 import base64
 
 
-class S3Client:
-    """Wrapper for S3 operations"""
+# Shared connection settings: keep-alive sockets, a pool large enough for the
+# parallel multipart threads, and adaptive retries with backoff
+_S3_CONFIG = Config(
+    max_pool_connections=50,
+    retries={'max_attempts': 5, 'mode': 'adaptive'},
+    tcp_keepalive=True,
+    connect_timeout=2
+)
+
+_s3_client = None
+
+# Default size at which uploads switch to parallel multipart parts; smaller
+# objects go in a single PutObject to skip the multipart round trips.
+# Tunable through settings.S3_MULTIPART_THRESHOLD
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+
+# Server-side copies above this size are split into parallel UploadPartCopy ranges
+COPY_MULTIPART_THRESHOLD = 100 * 1024 * 1024
+COPY_MULTIPART_CHUNKSIZE = 16 * 1024 * 1024
+
+# RSA signing releases the GIL, so batches of URLs are signed across all cores
+SIGNING_WORKERS = os.cpu_count() or 1
+
+# Canned policy with no whitespace; resources are our own CloudFront URLs,
+# which never contain characters that need JSON escaping
+_POLICY_TEMPLATE = b'{"Statement":[{"Resource":"%s","Condition":{"DateLessThan":{"AWS:EpochTime":%d}}}]}'
+
+# CloudFront canned policies are signed with RSA-SHA1; the scheme objects are stateless
+_SIGNATURE_PADDING = padding.PKCS1v15()
+_SIGNATURE_HASH = hashes.SHA1()
+
+# CloudFront's URL-safe variant of standard base64
+_CLOUDFRONT_B64_TABLE = bytes.maketrans(b'+=/', b'-_~')
+
+
+@lru_cache(maxsize=4)
+def _load_private_key(private_key_pem: str):
+    """Parse a PEM private key once per process"""
+    return serialization.load_pem_private_key(
+        private_key_pem.encode('utf-8'),
+        password=None,
+        backend=default_backend()
+    )
+
+
+def _source_size(image_source: Union[bytes, memoryview, BinaryIO]) -> Optional[int]:
+    """Bytes left to read from an upload source, or None if it cannot be measured"""
+    if isinstance(image_source, (bytes, bytearray, memoryview)):
+        return memoryview(image_source).nbytes
     
-    def __init__(self):
-        self.s3 = boto3.client(
+    try:
+        position = image_source.tell()
+        end = image_source.seek(0, io.SEEK_END)
+        image_source.seek(position)
+        return end - position
+    except (AttributeError, OSError):
+        return None
+
+
+class _BufferReader(io.RawIOBase):
+    """Seekable file object over a memoryview, so uploads stream it without copying it whole"""
+    
+    def __init__(self, view: memoryview):
+        self._view = view.cast('B')
+        self._position = 0
+    
+    def readable(self) -> bool:
+        return True
+    
+    def seekable(self) -> bool:
+        return True
+    
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), len(self._view) - self._position)
+        buffer[:size] = self._view[self._position:self._position + size]
+        self._position += size
+        return size
+    
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+    
+    def tell(self) -> int:
+        return self._position
+
+
+def _get_s3_client():
+    """Return the process-wide S3 client, creating it on first use"""
+    global _s3_client
+    if _s3_client is None:
+        _s3_client = boto3.client(
             's3',
             region_name=settings.AWS_REGION,
             aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            config=_S3_CONFIG
         )
+    return _s3_client
+
+
+class S3Client:
+    """Wrapper for S3 operations"""
+    
+    def __init__(self):
+        self.s3 = _get_s3_client()
         self.bucket_name = settings.AWS_S3_BUCKET_NAME
+        threshold = getattr(settings, 'S3_MULTIPART_THRESHOLD', MULTIPART_THRESHOLD)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=threshold,
+            multipart_chunksize=threshold,
+            max_concurrency=10,
+            use_threads=True
+        )
+        self.copy_config = TransferConfig(
+            multipart_threshold=COPY_MULTIPART_THRESHOLD,
+            multipart_chunksize=COPY_MULTIPART_CHUNKSIZE,
+            max_concurrency=10,
+            use_threads=True
+        )
     
     def generate_image_key(self, user_id: str, image_id: str, extension: str = 'png') -> str:
         """Generate S3 key for an image"""
         return f"images/{user_id}/{image_id}.{extension}"
     
-    def upload_image(self, image_data: bytes, user_id: str, image_id: str, 
+    def _object_args(self, content_type: str, user_id: str, image_id: str) -> Dict:
+        """Headers and metadata written with every stored image"""
+        return {
+            'ContentType': content_type,
+            'CacheControl': 'max-age=31536000',  # 1 year cache
+            'Metadata': {
+                'user_id': user_id,
+                'image_id': image_id
+            }
+        }
+    
+    def upload_image(self, image_source: Union[bytes, memoryview, BinaryIO], user_id: str, image_id: str, 
                     content_type: str = 'image/png') -> str:
-        """Upload an image to S3"""
+        """Upload an image to S3 from bytes or a readable file-like object"""
         key = self.generate_image_key(user_id, image_id)
+        extra_args = self._object_args(content_type, user_id, image_id)
+        size = _source_size(image_source)
         
         try:
-            self.s3.put_object(
-                Bucket=self.bucket_name,
-                Key=key,
-                Body=image_data,
-                ContentType=content_type,
-                CacheControl='max-age=31536000',  # 1 year cache
-                Metadata={
-                    'user_id': user_id,
-                    'image_id': image_id
-                }
-            )
+            # boto3 takes bytes or file objects, so memoryviews are read in place
+            if isinstance(image_source, memoryview):
+                image_source = _BufferReader(image_source)
+            
+            if size is not None and size < self.transfer_config.multipart_threshold:
+                self.s3.put_object(Bucket=self.bucket_name, Key=key, Body=image_source, **extra_args)
+            else:
+                # Large or unsized sources are streamed in parts uploaded concurrently
+                fileobj = image_source if hasattr(image_source, 'read') else io.BytesIO(image_source)
+                self.s3.upload_fileobj(
+                    fileobj,
+                    self.bucket_name,
+                    key,
+                    ExtraArgs=extra_args,
+                    Config=self.transfer_config
+                )
             
             # Return the S3 URL (will be accessed via CloudFront)
             return f"s3://{self.bucket_name}/{key}"
             
         except ClientError as e:
             raise Exception(f"Error uploading image to S3: {e.response['Error']['Message']}")
+        except S3UploadFailedError as e:
+            raise Exception(f"Error uploading image to S3: {e}")
     
     def get_presigned_upload_url(self, user_id: str, image_id: str, 
                                 content_type: str = 'image/png', 
@@ -103,18 +239,31 @@ class S3Client:
         """Copy an image to a new location"""
         source_key = self.generate_image_key(source_user_id, source_image_id)
         dest_key = self.generate_image_key(dest_user_id, dest_image_id)
+        copy_source = {'Bucket': self.bucket_name, 'Key': source_key}
         
         try:
-            self.s3.copy_object(
-                Bucket=self.bucket_name,
-                CopySource={'Bucket': self.bucket_name, 'Key': source_key},
-                Key=dest_key,
-                MetadataDirective='REPLACE',
-                Metadata={
-                    'user_id': dest_user_id,
-                    'image_id': dest_image_id
-                }
-            )
+            head = self.s3.head_object(Bucket=self.bucket_name, Key=source_key)
+            
+            # REPLACE drops the source headers, so carry the content type and cache policy over
+            copy_args = self._object_args(head.get('ContentType', 'image/png'), dest_user_id, dest_image_id)
+            copy_args['MetadataDirective'] = 'REPLACE'
+            
+            if head['ContentLength'] < self.copy_config.multipart_threshold:
+                self.s3.copy_object(
+                    Bucket=self.bucket_name,
+                    CopySource=copy_source,
+                    Key=dest_key,
+                    **copy_args
+                )
+            else:
+                # Managed copy issues the UploadPartCopy ranges concurrently
+                self.s3.copy(
+                    copy_source,
+                    self.bucket_name,
+                    dest_key,
+                    ExtraArgs=copy_args,
+                    Config=self.copy_config
+                )
             
             return f"s3://{self.bucket_name}/{dest_key}"
             
@@ -125,105 +274,151 @@ class S3Client:
 class CloudFrontSigner:
     """Generate CloudFront signed URLs for secure image access"""
     
+    # Signed URLs shared across requests; keys include the expiry, and each entry is
+    # kept only for its half-TTL bucket, so a served URL always has at least half
+    # its signing TTL left
+    _signed_urls = TTLCache(maxsize=10_000, ttl=300)
+    
     def __init__(self):
         self.cloudfront_domain = settings.CLOUDFRONT_DOMAIN
         self.key_pair_id = settings.CLOUDFRONT_KEY_PAIR_ID
         
-        # Load private key for signing
+        # URL prefixes are fixed for the process, so build them once
+        self._bucket = settings.AWS_S3_BUCKET_NAME
+        self._s3_prefix = f"s3://{self._bucket}/"
+        self._cf_base = f"https://{self.cloudfront_domain}/"
+        self._s3_public_base = f"https://{self._bucket}.s3.amazonaws.com/"
+        
+        # Load private key for signing, shared by every signer in the process
         if settings.CLOUDFRONT_PRIVATE_KEY:
-            self.private_key = serialization.load_pem_private_key(
-                settings.CLOUDFRONT_PRIVATE_KEY.encode('utf-8'),
-                password=None,
-                backend=default_backend()
-            )
+            self.private_key = _load_private_key(settings.CLOUDFRONT_PRIVATE_KEY)
         else:
             self.private_key = None
     
-    def _create_policy(self, resource: str, expire_time: int) -> str:
-        """Create a CloudFront canned policy"""
-        policy = {
-            "Statement": [{
-                "Resource": resource,
-                "Condition": {
-                    "DateLessThan": {
-                        "AWS:EpochTime": expire_time
-                    }
-                }
-            }]
-        }
-        
-        # Remove whitespace
-        import json
-        return json.dumps(policy, separators=(',', ':'))
+    def _create_policy(self, resource: str, expire_time: int) -> bytes:
+        """Create a CloudFront canned policy, encoded ready for signing"""
+        return _POLICY_TEMPLATE % (resource.encode('utf-8'), expire_time)
     
-    def _sign_policy(self, policy: str) -> str:
-        """Sign the policy with RSA private key"""
+    def _sign_policy(self, policy: bytes) -> str:
+        """Sign the encoded policy with RSA private key"""
         if not self.private_key:
             raise ValueError("CloudFront private key not configured")
         
-        # Sign the policy
-        signature = self.private_key.sign(
-            policy.encode('utf-8'),
-            padding.PKCS1v15(),
-            hashes.SHA1()
-        )
+        signature = self.private_key.sign(policy, _SIGNATURE_PADDING, _SIGNATURE_HASH)
         
-        # Base64 encode and make URL-safe
-        encoded = base64.b64encode(signature).decode('utf-8')
-        return encoded.replace('+', '-').replace('=', '_').replace('/', '~')
+        # Base64 encode and make URL-safe in a single pass
+        return base64.b64encode(signature).translate(_CLOUDFRONT_B64_TABLE).decode('ascii')
+    
+    def _to_cloudfront_url(self, s3_url: str) -> str:
+        """Convert an S3 URL to its CloudFront URL"""
+        if s3_url.startswith(self._s3_prefix):
+            return self._cf_base + s3_url[len(self._s3_prefix):]
+        return self._cf_base + s3_url
+    
+    def _to_public_s3_url(self, s3_url: str) -> str:
+        """Convert an S3 URL to its public S3 HTTPS URL"""
+        if s3_url.startswith(self._s3_prefix):
+            return self._s3_public_base + s3_url[len(self._s3_prefix):]
+        if s3_url.startswith('s3://'):
+            bucket, _, key = s3_url[len('s3://'):].partition('/')
+            return f"https://{bucket}.s3.amazonaws.com/{key}"
+        return s3_url
+    
+    def _build_signed_url(self, cloudfront_url: str, expire_time: int, signature: str) -> str:
+        """Append the canned-policy signature parameters to a CloudFront URL"""
+        return f"{cloudfront_url}?Expires={expire_time}&Signature={signature}&Key-Pair-Id={self.key_pair_id}"
+    
+    def _expire_time(self, expires_in_seconds: int) -> int:
+        """Expiry rounded down to a half-TTL bucket so repeat requests reuse cached signatures"""
+        expire_time = int((datetime.utcnow() + timedelta(seconds=expires_in_seconds)).timestamp())
+        bucket = max(1, expires_in_seconds // 2)
+        return expire_time - expire_time % bucket
     
     def generate_signed_url(self, s3_url: str, expires_in_seconds: int = 600) -> str:
         """Generate a CloudFront signed URL for an S3 object"""
         if not self.cloudfront_domain:
             # Return unsigned URL if CloudFront not configured
-            return s3_url.replace(f"s3://{settings.AWS_S3_BUCKET_NAME}/", 
-                                f"https://{settings.AWS_S3_BUCKET_NAME}.s3.amazonaws.com/")
-        
-        # Convert S3 URL to CloudFront URL
-        key = s3_url.replace(f"s3://{settings.AWS_S3_BUCKET_NAME}/", "")
-        cloudfront_url = f"https://{self.cloudfront_domain}/{key}"
+            return self._to_public_s3_url(s3_url)
         
         if not self.private_key:
             # Return unsigned CloudFront URL if signing not configured
-            return cloudfront_url
+            return self._to_cloudfront_url(s3_url)
         
-        # Calculate expiration time
-        expire_time = int((datetime.utcnow() + timedelta(seconds=expires_in_seconds)).timestamp())
+        return self.generate_signed_urls([s3_url], expires_in_seconds)[0]
+    
+    def generate_signed_urls(self, s3_urls: List[str], expires_in_seconds: int = 600) -> List[str]:
+        """Generate CloudFront signed URLs for several S3 objects, signing them in parallel"""
+        if not self.cloudfront_domain or not self.private_key:
+            return [self.generate_signed_url(s3_url, expires_in_seconds) for s3_url in s3_urls]
         
-        # Create and sign policy
-        policy = self._create_policy(cloudfront_url, expire_time)
-        signature = self._sign_policy(policy)
+        # One expiry for the whole batch
+        expire_time = self._expire_time(expires_in_seconds)
+        cache_ttl = max(1, expires_in_seconds // 2)
+        cloudfront_urls = [self._to_cloudfront_url(s3_url) for s3_url in s3_urls]
         
-        # Build signed URL
-        signed_url = f"{cloudfront_url}?Expires={expire_time}&Signature={signature}&Key-Pair-Id={self.key_pair_id}"
+        # Reuse URLs already signed for this expiry bucket
+        signed = {}
+        missing = []
+        for url in dict.fromkeys(cloudfront_urls):
+            cached = self._signed_urls.get((self.key_pair_id, url, expire_time))
+            if cached is None:
+                missing.append(url)
+            else:
+                signed[url] = cached
         
-        return signed_url
+        if missing:
+            policies = [self._create_policy(url, expire_time) for url in missing]
+            if len(policies) == 1:
+                signatures = [self._sign_policy(policies[0])]
+            else:
+                with ThreadPoolExecutor(max_workers=min(len(policies), SIGNING_WORKERS)) as executor:
+                    signatures = list(executor.map(self._sign_policy, policies))
+            
+            for url, signature in zip(missing, signatures):
+                signed[url] = self._build_signed_url(url, expire_time, signature)
+                self._signed_urls.set((self.key_pair_id, url, expire_time), signed[url], ttl=cache_ttl)
+        
+        return [signed[url] for url in cloudfront_urls]
+
+
+def _new_image_id() -> str:
+    """Generate a random image ID"""
+    return uuid.uuid4().hex
 
 
 class ImageStorage:
     """High-level interface for image storage operations"""
     
-    def __init__(self):
+    def __init__(self, id_factory: Callable[[], str] = _new_image_id):
+        self.id_factory = id_factory
         self.s3 = S3Client()
         self.cloudfront = CloudFrontSigner()
+        self.signed_url_ttl = settings.SIGNED_URL_TTL
     
-    def store_image(self, image_data: bytes, user_id: str, 
+    def store_image(self, image_data: Union[bytes, memoryview, BinaryIO], user_id: str, 
                    content_type: str = 'image/png') -> Tuple[str, str]:
         """Store an image and return (image_id, s3_url)"""
-        image_id = str(uuid.uuid4())
+        image_id = self.id_factory()
         s3_url = self.s3.upload_image(image_data, user_id, image_id, content_type)
         return image_id, s3_url
     
     def get_signed_url(self, s3_url: str, expires_in: int = None) -> str:
         """Get a signed URL for accessing an image"""
         if expires_in is None:
-            expires_in = settings.SIGNED_URL_TTL
+            expires_in = self.signed_url_ttl
         
         return self.cloudfront.generate_signed_url(s3_url, expires_in)
     
+    def get_signed_urls_batch(self, s3_urls: List[str], expires_in: int = None) -> List[str]:
+        """Get signed URLs for several images at once"""
+        if expires_in is None:
+            expires_in = self.signed_url_ttl
+        
+        return self.cloudfront.generate_signed_urls(s3_urls, expires_in)
+    
     def get_upload_url(self, user_id: str) -> Dict[str, str]:
         """Get a presigned URL for direct upload"""
-        image_id = str(uuid.uuid4())
+        image_id = self.id_factory()
         upload_data = self.s3.get_presigned_upload_url(user_id, image_id)
         upload_data['image_id'] = image_id
         return upload_data
@@ -235,7 +430,7 @@ class ImageStorage:
     def copy_image(self, source_user_id: str, source_image_id: str,
                    dest_user_id: str) -> Tuple[str, str]:
         """Copy an image to a new user's storage"""
-        dest_image_id = str(uuid.uuid4())
+        dest_image_id = self.id_factory()
         s3_url = self.s3.copy_image(
             source_user_id, source_image_id,
             dest_user_id, dest_image_id
@@ -3,37 +3,96 @@ SQS utilities for managing job queues
 Handles sending and receiving messages for image generation jobs
 """
 
-import json
+import orjson
 import boto3
+from collections import deque
 from typing import Dict, List, Optional
 from django.conf import settings
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 
-class SQSClient:
-    """Wrapper for SQS operations"""
-    
-    def __init__(self):
-        self.sqs = boto3.client(
+# SendMessageBatch and ReceiveMessage handle at most 10 messages per call
+SQS_BATCH_LIMIT = 10
+MAX_BATCH_SEND_ATTEMPTS = 3
+
+# Shared connection settings: keep-alive sockets and adaptive retries with backoff
+_SQS_CONFIG = Config(
+    max_pool_connections=SQS_BATCH_LIMIT,
+    retries={'max_attempts': 5, 'mode': 'adaptive'},
+    tcp_keepalive=True,
+    connect_timeout=2  # read timeout stays above the 20s long-poll wait
+)
+
+_sqs_client = None
+
+
+def _get_sqs_client():
+    """Return the process-wide SQS client, creating it on first use"""
+    global _sqs_client
+    if _sqs_client is None:
+        _sqs_client = boto3.client(
             'sqs',
             region_name=settings.AWS_REGION,
             aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            config=_SQS_CONFIG
         )
-        self.queue_url = settings.AWS_SQS_QUEUE_URL
+    return _sqs_client
+
+
+class SQSClient:
+    """Wrapper for SQS operations"""
+    
+    def __init__(self, queue_url: Optional[str] = None):
+        self.sqs = _get_sqs_client()
+        self.queue_url = queue_url or settings.AWS_SQS_QUEUE_URL
     
     def send_message(self, message_body: Dict, delay_seconds: int = 0) -> str:
         """Send a message to the SQS queue"""
         try:
             response = self.sqs.send_message(
                 QueueUrl=self.queue_url,
-                MessageBody=json.dumps(message_body),
+                MessageBody=orjson.dumps(message_body).decode(),
                 DelaySeconds=delay_seconds
             )
             return response['MessageId']
         except ClientError as e:
             raise Exception(f"Error sending SQS message: {e.response['Error']['Message']}")
     
+    def send_message_batch(self, message_bodies: List[Dict], delay_seconds: int = 0) -> List[str]:
+        """Send several messages in batches of 10, returning their message IDs in order"""
+        message_ids = [None] * len(message_bodies)
+        
+        try:
+            for start in range(0, len(message_bodies), SQS_BATCH_LIMIT):
+                pending = {
+                    str(i): {'Id': str(i), 'MessageBody': orjson.dumps(body).decode(), 'DelaySeconds': delay_seconds}
+                    for i, body in enumerate(message_bodies[start:start + SQS_BATCH_LIMIT], start)
+                }
+                
+                # Resend entries that failed on the server side; sender faults would fail again
+                for _ in range(MAX_BATCH_SEND_ATTEMPTS):
+                    response = self.sqs.send_message_batch(
+                        QueueUrl=self.queue_url,
+                        Entries=list(pending.values())
+                    )
+                    for entry in response.get('Successful', []):
+                        message_ids[int(entry['Id'])] = entry['MessageId']
+                        del pending[entry['Id']]
+                    
+                    failed = response.get('Failed', [])
+                    if not pending or any(entry['SenderFault'] for entry in failed):
+                        break
+                
+                if pending:
+                    failure = failed[0]
+                    raise Exception(f"Error sending SQS message batch: {failure.get('Message', failure['Code'])}")
+        except ClientError as e:
+            raise Exception(f"Error sending SQS message batch: {e.response['Error']['Message']}")
+        
+        return message_ids
+    
     def receive_messages(self, max_messages: int = 1, wait_time_seconds: int = 20) -> List[Dict]:
         """Receive messages from the SQS queue"""
         try:
@@ -49,7 +108,7 @@ class SQSClient:
                 messages.append({
                     'message_id': message['MessageId'],
                     'receipt_handle': message['ReceiptHandle'],
-                    'body': json.loads(message['Body']),
+                    'body': orjson.loads(message['Body']),
                     'attributes': message.get('Attributes', {})
                 })
             
@@ -86,10 +145,12 @@ class JobQueue:
     
     def __init__(self):
         self.sqs = SQSClient()
+        # Jobs received but not yet handed out; their visibility timeout is already running
+        self._prefetch = deque()
     
-    def enqueue_generation_job(self, job_data: Dict) -> str:
-        """Enqueue an image generation job"""
-        message = {
+    def _build_generation_message(self, job_data: Dict) -> Dict:
+        """Build the queue message for an image generation job"""
+        return {
             'type': 'image_generation',
             'job_id': job_data['job_id'],
             'user_id': job_data['user_id'],
@@ -97,17 +158,32 @@ class JobQueue:
             'batch_size': job_data['batch_size'],
             'timestamp': job_data['created_at']
         }
-        
-        return self.sqs.send_message(message)
+    
+    def enqueue_generation_job(self, job_data: Dict) -> str:
+        """Enqueue an image generation job"""
+        return self.sqs.send_message(self._build_generation_message(job_data))
+    
+    def enqueue_generation_jobs(self, jobs: List[Dict]) -> List[str]:
+        """Enqueue several image generation jobs with batched sends"""
+        return self.sqs.send_message_batch([self._build_generation_message(job_data) for job_data in jobs])
     
     def get_next_job(self) -> Optional[Dict]:
-        """Get the next job from the queue"""
-        messages = self.sqs.receive_messages(max_messages=1)
+        """Get the next job from the queue, receiving up to 10 at a time"""
+        if not self._prefetch:
+            self._prefetch.extend(self.sqs.receive_messages(max_messages=SQS_BATCH_LIMIT))
         
-        if messages:
-            return messages[0]
+        if self._prefetch:
+            return self._prefetch.popleft()
         return None
     
+    def return_prefetched_jobs(self) -> int:
+        """Make buffered jobs visible on the queue again, e.g. on shutdown"""
+        returned = 0
+        while self._prefetch:
+            self.sqs.change_message_visibility(self._prefetch.popleft()['receipt_handle'], 0)
+            returned += 1
+        return returned
+    
     def complete_job(self, receipt_handle: str) -> bool:
         """Mark a job as completed by deleting it from the queue"""
         return self.sqs.delete_message(receipt_handle)
@@ -115,3 +191,14 @@ class JobQueue:
     def extend_job_timeout(self, receipt_handle: str, additional_seconds: int = 300) -> bool:
         """Extend the processing timeout for a job"""
         return self.sqs.change_message_visibility(receipt_handle, additional_seconds)
+
+
+class WebhookQueue:
+    """Queue of verified webhook events awaiting processing by the worker"""
+    
+    def __init__(self):
+        self.sqs = SQSClient(settings.AWS_SQS_WEBHOOK_QUEUE_URL)
+    
+    def enqueue_stripe_event(self, event: Dict) -> str:
+        """Enqueue a verified Stripe event"""
+        return self.sqs.send_message({'source': 'stripe', 'event': event})
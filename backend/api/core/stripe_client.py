@@ -3,11 +3,19 @@ Stripe client for subscription management
 Handles subscription creation, updates, and webhook processing
 """
 
+import json
 import stripe
 import time
 from typing import Dict, List, Optional, Any
 from django.conf import settings
-from api.core.dynamodb_utils import SubscriptionRepository, UserRepository
+from api.core.cache import TTLCache
+from api.core.repositories import SubscriptionRepository, UserRepository
+from api.core.sqs_utils import WebhookQueue
+
+
+# stripe.api_key is a module-level global, so configure it once per process
+if settings.STRIPE_SECRET_KEY:
+    stripe.api_key = settings.STRIPE_SECRET_KEY
 
 
 class StripeClient:
@@ -16,7 +24,6 @@ class StripeClient:
     def __init__(self):
         self.subscription_repo = SubscriptionRepository()
         self.user_repo = UserRepository()
-        self._stripe_configured = False
         
         # Define subscription plans
         self.plans = {
@@ -60,16 +67,12 @@ class StripeClient:
                 ]
             }
         }
-    
-    def _ensure_stripe_configured(self):
-        """Configure Stripe API key if not already done"""
-        if not self._stripe_configured:
-            stripe.api_key = settings.STRIPE_SECRET_KEY
-            self._stripe_configured = True
+        
+        # Reverse lookup used by webhooks to resolve a Stripe price to its plan
+        self.price_id_to_plan = {plan["price_id"]: (key, plan) for key, plan in self.plans.items()}
     
     def create_customer(self, user_id: str, email: str) -> str:
         """Create a Stripe customer for a user"""
-        self._ensure_stripe_configured()
         try:
             customer = stripe.Customer.create(
                 email=email,
@@ -91,7 +94,6 @@ class StripeClient:
     def create_checkout_session(self, user_id: str, plan_key: str, 
                               success_url: str, cancel_url: str) -> str:
         """Create a Stripe checkout session for subscription"""
-        self._ensure_stripe_configured()
         user = self.user_repo.get_user(user_id)
         if not user:
             raise ValueError("User not found")
@@ -129,7 +131,6 @@ class StripeClient:
     
     def create_billing_portal_session(self, user_id: str, return_url: str) -> str:
         """Create a Stripe billing portal session"""
-        self._ensure_stripe_configured()
         user = self.user_repo.get_user(user_id)
         if not user or not user.get("stripe_customer_id"):
             raise ValueError("User has no Stripe customer")
@@ -148,7 +149,6 @@ class StripeClient:
     def cancel_subscription(self, user_id: str, subscription_id: str, 
                           at_period_end: bool = True) -> Dict:
         """Cancel a subscription"""
-        self._ensure_stripe_configured()
         try:
             if at_period_end:
                 # Cancel at end of billing period
@@ -182,7 +182,6 @@ class StripeClient:
     
     def get_subscription_details(self, subscription_id: str) -> Dict:
         """Get subscription details from Stripe"""
-        self._ensure_stripe_configured()
         try:
             subscription = stripe.Subscription.retrieve(subscription_id)
             
@@ -205,32 +204,53 @@ class StripeClient:
 class StripeWebhookHandler:
     """Handle Stripe webhook events"""
     
+    # A customer's user never changes, so lookups are shared across deliveries
+    _customer_user_ids = TTLCache(maxsize=10_000, ttl=24 * 60 * 60)
+    
     def __init__(self):
         self.client = StripeClient()
         self.subscription_repo = SubscriptionRepository()
         self.user_repo = UserRepository()
-        self._stripe_configured = False
     
-    def _ensure_stripe_configured(self):
-        """Configure Stripe API key if not already done"""
-        if not self._stripe_configured:
-            stripe.api_key = settings.STRIPE_SECRET_KEY
-            self._stripe_configured = True
+    def _get_user_id(self, customer_id: str) -> Optional[str]:
+        """Resolve a Stripe customer to our user ID, calling Stripe only as a last resort"""
+        user_id = self._customer_user_ids.get(customer_id)
+        if user_id is None:
+            user_id = self.user_repo.get_user_id_by_stripe_customer(customer_id)
+            if not user_id:
+                customer = stripe.Customer.retrieve(customer_id)
+                user_id = customer.metadata.get("user_id")
+            if user_id:
+                self._customer_user_ids.set(customer_id, user_id)
+        return user_id
     
-    def handle_webhook(self, payload: str, signature: str) -> Dict:
-        """Process a Stripe webhook"""
-        self._ensure_stripe_configured()
+    def _verify_event(self, payload: str, signature: str):
+        """Verify the webhook signature and parse the event"""
         try:
-            # Verify webhook signature
-            event = stripe.Webhook.construct_event(
+            return stripe.Webhook.construct_event(
                 payload, signature, settings.STRIPE_WEBHOOK_SECRET
             )
         except ValueError:
             raise Exception("Invalid payload")
         except stripe.error.SignatureVerificationError:
             raise Exception("Invalid signature")
+    
+    def handle_webhook(self, payload: str, signature: str) -> Dict:
+        """Process a Stripe webhook"""
+        return self.process_event(self._verify_event(payload, signature))
+    
+    def enqueue_webhook(self, payload: str, signature: str) -> Dict:
+        """Verify a Stripe webhook and queue it for the worker, processing inline if no queue is configured"""
+        event = self._verify_event(payload, signature)
+        if not settings.AWS_SQS_WEBHOOK_QUEUE_URL:
+            return self.process_event(event)
         
-        # Handle different event types
+        # The signed payload is the event JSON, so queue it as-is rather than the StripeObject
+        message_id = WebhookQueue().enqueue_stripe_event(json.loads(payload))
+        return {"status": "queued", "event_type": event["type"], "message_id": message_id}
+    
+    def process_event(self, event: Dict) -> Dict:
+        """Dispatch a verified Stripe event to its handler"""
         handlers = {
             "checkout.session.completed": self._handle_checkout_completed,
             "customer.subscription.created": self._handle_subscription_created,
@@ -262,60 +282,59 @@ class StripeWebhookHandler:
     
     def _handle_subscription_created(self, event: Dict) -> Dict:
         """Handle new subscription creation"""
-        self._ensure_stripe_configured()
         subscription = event["data"]["object"]
         
         # Get user from customer
         customer_id = subscription["customer"]
-        customer = stripe.Customer.retrieve(customer_id)
-        user_id = customer.metadata.get("user_id")
+        user_id = self._get_user_id(customer_id)
         
         if not user_id:
             return {"status": "error", "message": "No user_id in customer metadata"}
         
         # Determine plan from price ID
         price_id = subscription["items"]["data"][0]["price"]["id"]
-        plan_key = None
-        for key, plan in self.client.plans.items():
-            if plan["price_id"] == price_id:
-                plan_key = key
-                break
+        plan_key, plan = self.client.price_id_to_plan.get(price_id, (None, None))
         
         if not plan_key:
             return {"status": "error", "message": "Unknown price ID"}
         
-        # Create subscription record
+        # Create subscription record and update user quota in one transaction
         self.subscription_repo.create_subscription(
             user_id=user_id,
             stripe_sub_id=subscription["id"],
             plan_id=plan_key,
             status=subscription["status"],
-            current_period_end=subscription["current_period_end"]
+            current_period_end=subscription["current_period_end"],
+            user_updates={
+                "quota_limit": plan["quota"],
+                "subscription_plan": plan_key
+            }
         )
         
-        # Update user quota
-        plan = self.client.plans[plan_key]
-        self.user_repo.update_user(user_id, {
-            "quota_limit": plan["quota"],
-            "subscription_plan": plan_key
-        })
-        
         return {"status": "success", "action": "subscription_created"}
     
     def _handle_subscription_updated(self, event: Dict) -> Dict:
         """Handle subscription updates"""
-        self._ensure_stripe_configured()
         subscription = event["data"]["object"]
         
         # Get user from customer
         customer_id = subscription["customer"]
-        customer = stripe.Customer.retrieve(customer_id)
-        user_id = customer.metadata.get("user_id")
+        user_id = self._get_user_id(customer_id)
         
         if not user_id:
             return {"status": "error", "message": "No user_id in customer metadata"}
         
-        # Update subscription record
+        # Update user quota if plan changed
+        price_id = subscription["items"]["data"][0]["price"]["id"]
+        plan_key, plan = self.client.price_id_to_plan.get(price_id, (None, None))
+        user_updates = None
+        if plan_key:
+            user_updates = {
+                "quota_limit": plan["quota"],
+                "subscription_plan": plan_key
+            }
+        
+        # Update subscription record, together with the user quota when known
         self.subscription_repo.update_subscription(
             user_id=user_id,
             stripe_sub_id=subscription["id"],
@@ -323,62 +342,47 @@ class StripeWebhookHandler:
                 "status": subscription["status"],
                 "current_period_end": subscription["current_period_end"],
                 "cancel_at_period_end": subscription.get("cancel_at_period_end", False)
-            }
+            },
+            user_updates=user_updates
         )
         
-        # Update user quota if plan changed
-        price_id = subscription["items"]["data"][0]["price"]["id"]
-        for key, plan in self.client.plans.items():
-            if plan["price_id"] == price_id:
-                self.user_repo.update_user(user_id, {
-                    "quota_limit": plan["quota"],
-                    "subscription_plan": key
-                })
-                break
-        
         return {"status": "success", "action": "subscription_updated"}
     
     def _handle_subscription_deleted(self, event: Dict) -> Dict:
         """Handle subscription cancellation"""
-        self._ensure_stripe_configured()
         subscription = event["data"]["object"]
         
         # Get user from customer
         customer_id = subscription["customer"]
-        customer = stripe.Customer.retrieve(customer_id)
-        user_id = customer.metadata.get("user_id")
+        user_id = self._get_user_id(customer_id)
         
         if not user_id:
             return {"status": "error", "message": "No user_id in customer metadata"}
         
-        # Update subscription status
+        # Update subscription status and reset user quota in one transaction
         self.subscription_repo.update_subscription(
             user_id=user_id,
             stripe_sub_id=subscription["id"],
             updates={
                 "status": "canceled",
                 "canceled_at": int(time.time())
+            },
+            user_updates={
+                "quota_limit": 0,
+                "subscription_plan": None
             }
         )
         
-        # Reset user quota
-        self.user_repo.update_user(user_id, {
-            "quota_limit": 0,
-            "subscription_plan": None
-        })
-        
         return {"status": "success", "action": "subscription_deleted"}
     
     def _handle_payment_succeeded(self, event: Dict) -> Dict:
         """Handle successful payment"""
-        self._ensure_stripe_configured()
         invoice = event["data"]["object"]
         
         # Reset monthly quota on successful payment
         if invoice.get("billing_reason") == "subscription_cycle":
             customer_id = invoice["customer"]
-            customer = stripe.Customer.retrieve(customer_id)
-            user_id = customer.metadata.get("user_id")
+            user_id = self._get_user_id(customer_id)
             
             if user_id:
                 self.user_repo.update_user(user_id, {
@@ -0,0 +1,66 @@
+"""
+Test cases for in-process caching utilities
+"""
+
+from unittest.mock import patch
+
+from api.core.cache import TTLCache
+
+
+class TestTTLCache:
+    """Test cases for TTLCache class"""
+    
+    def test_get_returns_cached_value(self):
+        """Test a stored value is returned before it expires"""
+        cache = TTLCache(maxsize=10, ttl=30)
+        cache.set('a', 1)
+        
+        assert cache.get('a') == 1
+        assert cache.get('missing') is None
+    
+    def test_entries_expire_after_ttl(self):
+        """Test values are dropped once the TTL has elapsed"""
+        cache = TTLCache(maxsize=10, ttl=30)
+        
+        with patch('api.core.cache.time.monotonic', return_value=100):
+            cache.set('a', 1)
+        with patch('api.core.cache.time.monotonic', return_value=129):
+            assert cache.get('a') == 1
+        with patch('api.core.cache.time.monotonic', return_value=131):
+            assert cache.get('a') is None
+    
+    def test_set_accepts_per_entry_ttl(self):
+        """Test an entry stored with its own TTL expires on that TTL"""
+        cache = TTLCache(maxsize=10, ttl=30)
+        
+        with patch('api.core.cache.time.monotonic', return_value=100):
+            cache.set('a', 1, ttl=5)
+        with patch('api.core.cache.time.monotonic', return_value=104):
+            assert cache.get('a') == 1
+        with patch('api.core.cache.time.monotonic', return_value=106):
+            assert cache.get('a') is None
+    
+    def test_evicts_least_recently_used(self):
+        """Test the oldest unused entry is evicted when full"""
+        cache = TTLCache(maxsize=2, ttl=30)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+        assert cache.get('c') == 3
+    
+    def test_pop_and_clear(self):
+        """Test entries can be invalidated individually or all at once"""
+        cache = TTLCache(maxsize=10, ttl=30)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        
+        cache.pop('a')
+        cache.pop('missing')
+        assert cache.get('a') is None
+        
+        cache.clear()
+        assert cache.get('b') is None
@@ -35,11 +35,21 @@ if not settings.configured:
     )
 
 from api.core.dynamodb_utils import (
-    DynamoDBClient, UserRepository, ImageRepository, 
-    JobRepository, SubscriptionRepository
+    DynamoDBClient, BATCH_GET_LIMIT, UNPROCESSED_RETRY_BASE_DELAY, UNPROCESSED_RETRY_MAX_DELAY,
+    EXPIRED_ITEM_RETENTION_SECONDS
 )
 
 
+@pytest.fixture(scope='module', autouse=True)
+def _patch_boto3():
+    """Swap out boto3 once for the module so client construction never reaches AWS"""
+    # The shared singletons are reset on exit so mocks never leak into other modules
+    with patch('api.core.dynamodb_utils.boto3') as mock_boto3, \
+         patch.multiple('api.core.dynamodb_utils', _dynamodb_resource=None,
+                        _dynamodb_low_level_client=None, _dynamodb_client=None):
+        yield mock_boto3
+
+
 class TestDynamoDBClient:
     """Test cases for DynamoDBClient class"""
     
@@ -51,11 +61,32 @@ class TestDynamoDBClient:
     @pytest.fixture
     def client(self, mock_table):
         """Create DynamoDBClient instance with mocked table"""
-        with patch('api.core.dynamodb_utils.boto3.resource') as mock_resource:
-            mock_resource.return_value.Table.return_value = mock_table
-            client = DynamoDBClient()
-            client.table = mock_table
-            return client
+        DynamoDBClient._item_cache.clear()
+        client = DynamoDBClient()
+        # Fresh mocks per test; the module-wide boto3 mock hands out shared singletons
+        client.dynamodb = Mock()
+        client.client = Mock()
+        client.table = mock_table
+        return client
+    
+    def test_clients_share_pooled_resource(self, monkeypatch):
+        """Test the boto3 resource is created once with keep-alive pooling"""
+        monkeypatch.setattr('api.core.dynamodb_utils._dynamodb_resource', None)
+        monkeypatch.setattr('api.core.dynamodb_utils._dynamodb_low_level_client', None)
+        
+        with patch('api.core.dynamodb_utils.boto3.resource') as mock_resource, \
+             patch('api.core.dynamodb_utils.boto3.client') as mock_client:
+            first = DynamoDBClient()
+            second = DynamoDBClient()
+        
+        mock_resource.assert_called_once()
+        mock_client.assert_called_once()
+        config = mock_resource.call_args[1]['config']
+        assert config.tcp_keepalive is True
+        assert config.max_pool_connections == 64
+        assert mock_client.call_args[1]['config'] is config
+        assert first.table is second.table
+        assert first.client is second.client
     
     def test_serialize_item_converts_floats_to_decimal(self, client):
         """Test that floats are properly converted to Decimals"""
@@ -86,6 +117,50 @@ class TestDynamoDBClient:
         assert all(isinstance(p, Decimal) for p in result['prices'])
         assert isinstance(result['mixed'][0]['val'], Decimal)
     
+    def test_serialize_item_handles_nested_lists(self, client):
+        """Test floats inside nested lists are converted and other values kept"""
+        item = {'matrix': [[0.5, 1], [True, None]]}
+        
+        result = client._serialize_item(item)
+        
+        assert result['matrix'] == [[Decimal('0.5'), 1], [True, None]]
+        assert result['matrix'][1][0] is True
+    
+    def test_serialize_item_returns_flat_items_unchanged(self, client):
+        """Test items with only plain scalar values skip the copy"""
+        item = {'pk': 'TAG#portrait', 'sk': 'IMG#1', 'created_at': 123, 'deleted_at': None}
+        
+        assert client._serialize_item(item) is item
+    
+    def test_serialize_item_copies_only_changed_containers(self, client):
+        """Test float-free nested values are shared rather than copied"""
+        tags = ['portrait', 'digital']
+        item = {'tags': tags, 'prompt': {'steps': 28}, 'params': {'guidance_scale': 3.5}}
+        
+        result = client._serialize_item(item)
+        
+        assert result is not item
+        assert result['tags'] is tags
+        assert result['prompt'] is item['prompt']
+        assert result['params'] == {'guidance_scale': Decimal('3.5')}
+        assert item['params']['guidance_scale'] == 3.5
+    
+    def test_serialize_item_reuses_cached_decimals(self, client):
+        """Test repeated float values share one cached Decimal"""
+        first = client._serialize_item({'guidance_scale': 3.5})
+        second = client._serialize_item({'guidance_scale': 3.5})
+        
+        assert first['guidance_scale'] is second['guidance_scale']
+        assert first['guidance_scale'] == Decimal('3.5')
+    
+    def test_serialize_item_rejects_non_finite_floats(self, client):
+        """Test NaN and infinity fail before reaching DynamoDB"""
+        for value in (float('nan'), float('inf'), float('-inf')):
+            with pytest.raises(ValueError) as exc_info:
+                client._serialize_item({'score': value})
+            
+            assert 'non-finite' in str(exc_info.value)
+    
     def test_deserialize_item_converts_decimal_to_float(self, client):
         """Test that Decimals are converted back to floats"""
         item = {
@@ -94,13 +169,22 @@ class TestDynamoDBClient:
             'nested': {'value': Decimal('1.5')}
         }
         
-        result = client._deserialize_item(item)
+        result = client._deserialize_item(item, decode_floats=True)
         
         assert isinstance(result['price'], float)
         assert result['price'] == 9.99
         assert result['quantity'] == 5
         assert isinstance(result['nested']['value'], float)
     
+    def test_deserialize_item_keeps_decimals_by_default(self, client):
+        """Test that items are returned untouched unless floats are requested"""
+        item = {'price': Decimal('9.99'), 'nested': {'value': Decimal('1.5')}}
+        
+        result = client._deserialize_item(item)
+        
+        assert result is item
+        assert result['price'] == Decimal('9.99')
+    
     def test_put_item_adds_timestamp(self, client, mock_table):
         """Test put_item adds created_at timestamp if not present"""
         item = {'pk': 'USER#123', 'sk': 'PROFILE'}
@@ -108,9 +192,9 @@ class TestDynamoDBClient:
         with patch('time.time', return_value=1234567890):
             result = client.put_item(item)
         
-        mock_table.put_item.assert_called_once()
-        call_args = mock_table.put_item.call_args[1]['Item']
-        assert call_args['created_at'] == 1234567890
+        client.client.put_item.assert_called_once()
+        call_args = client.client.put_item.call_args[1]['Item']
+        assert call_args['created_at'] == {'N': '1234567890'}
     
     def test_put_item_preserves_existing_timestamp(self, client, mock_table):
         """Test put_item preserves existing created_at timestamp"""
@@ -118,12 +202,47 @@ class TestDynamoDBClient:
         
         result = client.put_item(item)
         
-        call_args = mock_table.put_item.call_args[1]['Item']
-        assert call_args['created_at'] == 9999
+        call_args = client.client.put_item.call_args[1]['Item']
+        assert call_args['created_at'] == {'N': '9999'}
+    
+    def test_put_item_returns_original_item(self, client, mock_table):
+        """Test put_item hands back the caller's item rather than a converted copy"""
+        item = {'pk': 'USER#123', 'sk': 'PROFILE', 'created_at': 9999, 'score': 0.5}
+        
+        result = client.put_item(item)
+        
+        assert result is item
+        assert client.client.put_item.call_args[1]['Item']['score'] == {'N': '0.5'}
+    
+    def test_put_item_encodes_wire_types(self, client, mock_table):
+        """Test put_item encodes values directly as typed attribute values"""
+        mock_table.name = 'test-table'
+        item = {
+            'pk': 'IMG#1', 'sk': 'META', 'created_at': 5, 'public': True, 'deleted_at': None,
+            'price': Decimal('9.99'), 'tags': ['a', 'b'], 'filters': {'guidance_scale': 3.5, 'steps': 30}
+        }
+        
+        client.put_item(item)
+        
+        call_kwargs = client.client.put_item.call_args[1]
+        assert call_kwargs['TableName'] == 'test-table'
+        assert call_kwargs['Item'] == {
+            'pk': {'S': 'IMG#1'}, 'sk': {'S': 'META'}, 'created_at': {'N': '5'},
+            'public': {'BOOL': True}, 'deleted_at': {'NULL': True}, 'price': {'N': '9.99'},
+            'tags': {'L': [{'S': 'a'}, {'S': 'b'}]},
+            'filters': {'M': {'guidance_scale': {'N': '3.5'}, 'steps': {'N': '30'}}}
+        }
+    
+    def test_put_item_rejects_non_finite_floats(self, client):
+        """Test put_item refuses NaN before sending anything"""
+        with pytest.raises(ValueError):
+            client.put_item({'pk': 'TEST', 'sk': 'TEST', 'score': float('nan')})
+        
+        client.client.put_item.assert_not_called()
     
     def test_put_item_handles_client_error(self, client, mock_table):
         """Test put_item raises exception on ClientError"""
-        mock_table.put_item.side_effect = ClientError(
+        client.client.put_item.side_effect = ClientError(
             {'Error': {'Message': 'Item size exceeded'}}, 
             'PutItem'
         )
@@ -133,6 +252,63 @@ class TestDynamoDBClient:
         
         assert 'Error putting item: Item size exceeded' in str(exc_info.value)
     
+    def test_put_item_returns_none_when_condition_fails(self, client, mock_table):
+        """Test a conditional put that fails returns None instead of raising"""
+        client.client.put_item.side_effect = ClientError(
+            {'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'Condition failed'}},
+            'PutItem'
+        )
+        
+        result = client.put_item({'pk': 'TEST', 'sk': 'TEST'}, condition='attribute_not_exists(pk)')
+        
+        assert result is None
+        assert client.client.put_item.call_args[1]['ConditionExpression'] == 'attribute_not_exists(pk)'
+    
+    def test_batch_put_uses_batch_writer(self, client, mock_table):
+        """Test batch_put writes all items through a single batch writer"""
+        mock_table.batch_writer.return_value = MagicMock()
+        writer = mock_table.batch_writer.return_value.__enter__.return_value
+        items = [
+            {'pk': 'USER#123', 'sk': 'PROFILE', 'score': 1.5},
+            {'pk': 'EMAIL#a@b.com', 'sk': 'USER#123', 'created_at': 9999}
+        ]
+        
+        with patch('time.time', return_value=1234567890):
+            result = client.batch_put(items)
+        
+        mock_table.batch_writer.assert_called_once_with(overwrite_by_pkeys=['pk', 'sk'])
+        assert writer.put_item.call_count == 2
+        first = writer.put_item.call_args_list[0][1]['Item']
+        assert first['score'] == Decimal('1.5')
+        assert first['created_at'] == 1234567890
+        assert writer.put_item.call_args_list[1][1]['Item']['created_at'] == 9999
+        assert result[0]['score'] == 1.5
+    
+    def test_batch_put_handles_client_error(self, client, mock_table):
+        """Test batch_put raises exception on ClientError"""
+        mock_table.batch_writer.return_value = MagicMock()
+        mock_table.batch_writer.return_value.__exit__.side_effect = ClientError(
+            {'Error': {'Message': 'Throughput exceeded'}},
+            'BatchWriteItem'
+        )
+        
+        with pytest.raises(Exception) as exc_info:
+            client.batch_put([{'pk': 'TEST', 'sk': 'TEST'}])
+        
+        assert 'Error batch putting items: Throughput exceeded' in str(exc_info.value)
+    
+    def test_batch_delete_uses_batch_writer(self, client, mock_table):
+        """Test batch_delete removes every key through a single batch writer"""
+        mock_table.batch_writer.return_value = MagicMock()
+        writer = mock_table.batch_writer.return_value.__enter__.return_value
+        
+        assert client.batch_delete([('TAG#a', 'IMG#1'), ('TAG#b', 'IMG#1')]) is True
+        
+        mock_table.batch_writer.assert_called_once_with(overwrite_by_pkeys=['pk', 'sk'])
+        assert [call[1]['Key'] for call in writer.delete_item.call_args_list] == [
+            {'pk': 'TAG#a', 'sk': 'IMG#1'}, {'pk': 'TAG#b', 'sk': 'IMG#1'}
+        ]
+    
     def test_get_item_returns_item(self, client, mock_table):
         """Test get_item returns deserialized item"""
         mock_table.get_item.return_value = {
@@ -142,8 +318,88 @@ class TestDynamoDBClient:
         result = client.get_item('USER#123', 'PROFILE')
         
         assert result['pk'] == 'USER#123'
+        assert result['price'] == Decimal('9.99')
+        
+        result = client.get_item('USER#123', 'PROFILE', decode_floats=True)
+        
         assert result['price'] == 9.99
     
+    def test_get_item_caches_until_written(self, client, mock_table):
+        """Test repeated get_item calls are served from cache until the item is written"""
+        mock_table.get_item.return_value = {'Item': {'pk': 'USER#1', 'sk': 'JOB#1', 'status': 'queued',
+                                                     'filters': {'pose': 'standing'}, 'image_ids': []}}
+        
+        first = client.get_item('USER#1', 'JOB#1')
+        first['status'] = 'mutated'
+        first['filters']['pose'] = 'sitting'
+        first['image_ids'].append('image1')
+        second = client.get_item('USER#1', 'JOB#1')
+        
+        assert mock_table.get_item.call_count == 1
+        assert second['status'] == 'queued'
+        assert second['filters'] == {'pose': 'standing'}
+        assert second['image_ids'] == []
+        
+        mock_table.update_item.return_value = {'Attributes': {'pk': 'USER#1', 'sk': 'JOB#1'}}
+        client.update_fields('USER#1', 'JOB#1', {'status': 'completed'})
+        client.get_item('USER#1', 'JOB#1')
+        
+        assert mock_table.get_item.call_count == 2
+    
+    def test_get_item_cache_is_invalidated_by_transactions(self, client, mock_table):
+        """Test items written in a transaction are re-read afterwards"""
+        mock_table.get_item.return_value = {'Item': {'pk': 'USER#1', 'sk': 'JOB#1'}}
+        client.get_item('USER#1', 'JOB#1')
+        
+        client.transact_write([{'Update': {
+            'Key': {'pk': 'USER#1', 'sk': 'JOB#1'},
+            'UpdateExpression': 'SET #s = :s',
+            'ExpressionAttributeValues': {':s': 'done'}
+        }}])
+        client.get_item('USER#1', 'JOB#1')
+        
+        assert mock_table.get_item.call_count == 2
+    
+    def test_get_item_consistent_read_skips_cache(self, client, mock_table):
+        """Test a consistent get_item always reads the table with ConsistentRead"""
+        mock_table.get_item.return_value = {'Item': {'pk': 'USER#1', 'sk': 'SUB#1'}}
+        client.get_item('USER#1', 'SUB#1')
+        
+        client.get_item('USER#1', 'SUB#1', consistent=True)
+        
+        assert mock_table.get_item.call_count == 2
+        assert mock_table.get_item.call_args[1] == {'Key': {'pk': 'USER#1', 'sk': 'SUB#1'}, 'ConsistentRead': True}
+    
+    def test_get_item_does_not_cache_misses(self, client, mock_table):
+        """Test a missing item is looked up again on the next call"""
+        mock_table.get_item.return_value = {}
+        
+        client.get_item('USER#1', 'JOB#1')
+        client.get_item('USER#1', 'JOB#1')
+        
+        assert mock_table.get_item.call_count == 2
+    
+    def test_get_item_fast_uses_low_level_client(self, client, mock_table):
+        """Test get_item_fast sends typed keys and deserializes the typed response"""
+        mock_table.name = 'test-table'
+        client.client.get_item.return_value = {
+            'Item': {'pk': {'S': 'USER#123'}, 'quota_used': {'N': '3'}, 'tags': {'L': [{'S': 'a'}]}}
+        }
+        
+        result = client.get_item_fast('USER#123', 'PROFILE')
+        
+        client.client.get_item.assert_called_once_with(
+            TableName='test-table',
+            Key={'pk': {'S': 'USER#123'}, 'sk': {'S': 'PROFILE'}}
+        )
+        assert result == {'pk': 'USER#123', 'quota_used': Decimal('3'), 'tags': ['a']}
+    
+    def test_get_item_fast_returns_none_when_not_found(self, client):
+        """Test get_item_fast returns None when item not found"""
+        client.client.get_item.return_value = {}
+        
+        assert client.get_item_fast('USER#123', 'PROFILE') is None
+    
     def test_get_item_returns_none_when_not_found(self, client, mock_table):
         """Test get_item returns None when item not found"""
         mock_table.get_item.return_value = {}
@@ -152,6 +408,77 @@ class TestDynamoDBClient:
         
         assert result is None
     
+    def test_batch_get_preserves_key_order(self, client, mock_table):
+        """Test batch_get issues one request and returns items in key order"""
+        mock_table.name = 'test-table'
+        client.dynamodb.batch_get_item.return_value = {
+            'Responses': {'test-table': [
+                {'pk': 'IMG#2', 'sk': 'META', 'score': Decimal('1.5')},
+                {'pk': 'IMG#1', 'sk': 'META'}
+            ]}
+        }
+        
+        result = client.batch_get([('IMG#1', 'META'), ('IMG#2', 'META'), ('IMG#3', 'META')])
+        
+        client.dynamodb.batch_get_item.assert_called_once_with(RequestItems={
+            'test-table': {'Keys': [
+                {'pk': 'IMG#1', 'sk': 'META'},
+                {'pk': 'IMG#2', 'sk': 'META'},
+                {'pk': 'IMG#3', 'sk': 'META'}
+            ]}
+        })
+        assert [item['pk'] for item in result] == ['IMG#1', 'IMG#2']
+        assert result[1]['score'] == 1.5
+    
+    def test_batch_get_retries_unprocessed_keys(self, client, mock_table):
+        """Test batch_get re-requests keys DynamoDB left unprocessed"""
+        mock_table.name = 'test-table'
+        unprocessed = {'test-table': {'Keys': [{'pk': 'IMG#2', 'sk': 'META'}]}}
+        client.dynamodb.batch_get_item.side_effect = [
+            {'Responses': {'test-table': [{'pk': 'IMG#1', 'sk': 'META'}]},
+             'UnprocessedKeys': unprocessed},
+            {'Responses': {'test-table': [{'pk': 'IMG#2', 'sk': 'META'}]},
+             'UnprocessedKeys': {}}
+        ]
+        
+        with patch('time.sleep') as mock_sleep:
+            result = client.batch_get([('IMG#1', 'META'), ('IMG#2', 'META')])
+        
+        assert client.dynamodb.batch_get_item.call_count == 2
+        assert client.dynamodb.batch_get_item.call_args[1]['RequestItems'] == unprocessed
+        mock_sleep.assert_called_once_with(UNPROCESSED_RETRY_BASE_DELAY)
+        assert len(result) == 2
+    
+    def test_batch_get_backs_off_exponentially(self, client, mock_table):
+        """Test repeated unprocessed rounds wait longer each time, up to the cap"""
+        mock_table.name = 'test-table'
+        unprocessed = {'test-table': {'Keys': [{'pk': 'IMG#1', 'sk': 'META'}]}}
+        client.dynamodb.batch_get_item.side_effect = [
+            {'Responses': {'test-table': []}, 'UnprocessedKeys': unprocessed}
+        ] * 7 + [{'Responses': {'test-table': [{'pk': 'IMG#1', 'sk': 'META'}]}}]
+        
+        with patch('time.sleep') as mock_sleep:
+            result = client.batch_get([('IMG#1', 'META')])
+        
+        delays = [call[0][0] for call in mock_sleep.call_args_list]
+        assert delays == [0.05, 0.1, 0.2, 0.4, 0.8, UNPROCESSED_RETRY_MAX_DELAY, UNPROCESSED_RETRY_MAX_DELAY]
+        assert len(result) == 1
+    
+    def test_batch_get_chunks_by_limit(self, client, mock_table):
+        """Test keys beyond the BatchGetItem limit go in a second request"""
+        mock_table.name = 'test-table'
+        client.dynamodb.batch_get_item.return_value = {'Responses': {'test-table': []}}
+        
+        client.batch_get([(f'IMG#{i}', 'META') for i in range(BATCH_GET_LIMIT + 1)])
+        
+        requests = client.dynamodb.batch_get_item.call_args_list
+        assert [len(call[1]['RequestItems']['test-table']['Keys']) for call in requests] == [BATCH_GET_LIMIT, 1]
+    
+    def test_batch_get_empty_keys(self, client):
+        """Test batch_get makes no request for an empty key list"""
+        assert client.batch_get([]) == []
+        client.dynamodb.batch_get_item.assert_not_called()
+    
     def test_query_items_basic(self, client, mock_table):
         """Test basic query by partition key"""
         mock_table.query.return_value = {
@@ -194,6 +521,36 @@ class TestDynamoDBClient:
         assert next_key == {'pk': 'USER#123', 'sk': 'IMG#1'}
         assert 'Limit' in mock_table.query.call_args[1]
     
+    def test_query_items_with_projection(self, client, mock_table):
+        """Test query projection aliases attribute names"""
+        mock_table.query.return_value = {'Items': []}
+        
+        client.query_items('TAG#portrait', projection=['sk', 'url'])
+        
+        call_kwargs = mock_table.query.call_args[1]
+        assert call_kwargs['ProjectionExpression'] == '#p0,#p1'
+        assert call_kwargs['ExpressionAttributeNames'] == {'#p0': 'sk', '#p1': 'url'}
+    
+    def test_iter_query_follows_pages_lazily(self, client, mock_table):
+        """Test iter_query only requests the next page once the current one is consumed"""
+        mock_table.query.side_effect = [
+            {'Items': [{'pk': 'TAG#a', 'sk': 'IMG#1'}], 'LastEvaluatedKey': {'pk': 'TAG#a', 'sk': 'IMG#1'}},
+            {'Items': [{'pk': 'TAG#a', 'sk': 'IMG#2'}]}
+        ]
+        
+        items = client.iter_query('TAG#a', index_name='byTag', page_size=1)
+        
+        assert next(items)['sk'] == 'IMG#1'
+        assert mock_table.query.call_count == 1
+        assert next(items)['sk'] == 'IMG#2'
+        assert list(items) == []
+        
+        first_call, second_call = mock_table.query.call_args_list
+        assert first_call[1]['IndexName'] == 'byTag'
+        assert first_call[1]['Limit'] == 1
+        assert 'ExclusiveStartKey' not in first_call[1]
+        assert second_call[1]['ExclusiveStartKey'] == {'pk': 'TAG#a', 'sk': 'IMG#1'}
+    
     def test_delete_item_soft_delete(self, client, mock_table):
         """Test delete_item performs soft delete"""
         with patch('time.time', return_value=1234567890):
@@ -202,479 +559,146 @@ class TestDynamoDBClient:
         assert result is True
         mock_table.update_item.assert_called_with(
             Key={'pk': 'USER#123', 'sk': 'PROFILE'},
-            UpdateExpression='SET deleted_at = :timestamp',
-            ExpressionAttributeValues={':timestamp': 1234567890}
+            UpdateExpression='SET deleted_at = :timestamp, expires_at = :expires_at',
+            ExpressionAttributeValues={
+                ':timestamp': 1234567890,
+                ':expires_at': 1234567890 + EXPIRED_ITEM_RETENTION_SECONDS
+            }
         )
+        assert EXPIRED_ITEM_RETENTION_SECONDS == 7 * 24 * 60 * 60
     
-    def test_query_gsi_basic(self, client, mock_table):
-        """Test querying Global Secondary Index"""
-        mock_table.query.return_value = {
-            'Items': [{'pk': 'EMAIL#test@example.com', 'sk': 'USER#123'}]
-        }
-        
-        items, next_key = client.query_gsi('byEmail', 'EMAIL#test@example.com')
+    def test_delete_items_soft_deletes_each_key(self, client, mock_table):
+        """Test delete_items soft deletes every key through the low-level client"""
+        mock_table.name = 'test-table'
+        keys = [('IMG#1', 'META'), ('TAG#a', 'IMG#1'), ('USER#1', 'IMG#1')]
         
-        assert len(items) == 1
-        mock_table.query.assert_called_with(
-            IndexName='byEmail',
-            KeyConditionExpression='pk = :pk',
-            ExpressionAttributeValues={':pk': 'EMAIL#test@example.com'}
-        )
-
-
-class TestUserRepository:
-    """Test cases for UserRepository"""
-    
-    @pytest.fixture
-    def mock_db_client(self):
-        """Mock DynamoDBClient"""
-        return Mock(spec=DynamoDBClient)
-    
-    @pytest.fixture
-    def repo(self, mock_db_client):
-        """Create UserRepository with mocked client"""
-        with patch('api.core.dynamodb_utils.DynamoDBClient', return_value=mock_db_client):
-            repo = UserRepository()
-            repo.db = mock_db_client
-            return repo
-    
-    def test_create_user(self, repo, mock_db_client):
-        """Test creating a new user"""
         with patch('time.time', return_value=1234567890):
-            result = repo.create_user('user123', 'test@example.com', 'testuser')
-        
-        # Should create two items: user and email index
-        assert mock_db_client.put_item.call_count == 2
-        
-        # Check user item
-        user_call = mock_db_client.put_item.call_args_list[0][0][0]
-        assert user_call['pk'] == 'USER#user123'
-        assert user_call['sk'] == 'PROFILE'
-        assert user_call['email'] == 'test@example.com'
-        assert user_call['username'] == 'testuser'
-        assert user_call['role'] == 'user'
-        assert user_call['quota_used'] == 0
-        
-        # Check email index
-        email_call = mock_db_client.put_item.call_args_list[1][0][0]
-        assert email_call['pk'] == 'EMAIL#test@example.com'
-        assert email_call['sk'] == 'USER#user123'
-    
-    def test_create_user_auto_username(self, repo, mock_db_client):
-        """Test creating user with auto-generated username"""
-        result = repo.create_user('user123456', 'test@example.com')
-        
-        user_call = mock_db_client.put_item.call_args_list[0][0][0]
-        assert user_call['username'] == 'user_user1234'
-    
-    def test_get_user(self, repo, mock_db_client):
-        """Test getting user by ID"""
-        mock_db_client.get_item.return_value = {'user_id': 'user123'}
-        
-        result = repo.get_user('user123')
-        
-        mock_db_client.get_item.assert_called_with('USER#user123', 'PROFILE')
-        assert result == {'user_id': 'user123'}
-    
-    def test_get_user_by_email(self, repo, mock_db_client):
-        """Test getting user by email"""
-        mock_db_client.query_gsi.return_value = (
-            [{'pk': 'EMAIL#test@example.com', 'sk': 'USER#user123'}], 
-            None
-        )
-        mock_db_client.get_item.return_value = {'user_id': 'user123'}
-        
-        result = repo.get_user_by_email('test@example.com')
-        
-        mock_db_client.query_gsi.assert_called_with('byEmail', 'EMAIL#test@example.com', limit=1)
-        mock_db_client.get_item.assert_called_with('USER#user123', 'PROFILE')
-        assert result == {'user_id': 'user123'}
-    
-    def test_get_user_by_email_not_found(self, repo, mock_db_client):
-        """Test getting user by email when not found"""
-        mock_db_client.query_gsi.return_value = ([], None)
-        
-        result = repo.get_user_by_email('notfound@example.com')
-        
-        assert result is None
-    
-    def test_update_user(self, repo, mock_db_client):
-        """Test updating user profile"""
-        mock_db_client.get_item.return_value = {
-            'pk': 'USER#user123',
-            'sk': 'PROFILE',
-            'username': 'oldname'
+            assert client.delete_items(keys) is True
+        
+        calls = client.client.update_item.call_args_list
+        assert sorted((c[1]['Key']['pk']['S'], c[1]['Key']['sk']['S']) for c in calls) == sorted(keys)
+        assert all(c[1]['TableName'] == 'test-table' for c in calls)
+        assert calls[0][1]['ExpressionAttributeValues'] == {
+            ':timestamp': {'N': '1234567890'},
+            ':expires_at': {'N': str(1234567890 + EXPIRED_ITEM_RETENTION_SECONDS)}
         }
-        
-        result = repo.update_user('user123', {'username': 'newname'})
-        
-        mock_db_client.get_item.assert_called_with('USER#user123', 'PROFILE')
-        updated_item = mock_db_client.put_item.call_args[0][0]
-        assert updated_item['username'] == 'newname'
-    
-    def test_update_user_not_found(self, repo, mock_db_client):
-        """Test updating non-existent user raises error"""
-        mock_db_client.get_item.return_value = None
-        
-        with pytest.raises(ValueError) as exc_info:
-            repo.update_user('user123', {'username': 'newname'})
-        
-        assert 'User user123 not found' in str(exc_info.value)
-
-
-class TestImageRepository:
-    """Test cases for ImageRepository"""
-    
-    @pytest.fixture
-    def mock_db_client(self):
-        """Mock DynamoDBClient"""
-        return Mock(spec=DynamoDBClient)
-    
-    @pytest.fixture
-    def repo(self, mock_db_client):
-        """Create ImageRepository with mocked client"""
-        with patch('api.core.dynamodb_utils.DynamoDBClient', return_value=mock_db_client):
-            repo = ImageRepository()
-            repo.db = mock_db_client
-            return repo
-    
-    def test_create_image(self, repo, mock_db_client):
-        """Test creating a new image record"""
-        with patch('api.core.dynamodb_utils.uuid.uuid4', return_value='image123'), \
-             patch('time.time', return_value=1234567890):
-            
-            image_data = {
-                'user_id': 'user123',
-                'url': 'https://example.com/image.jpg',
-                'tags': ['portrait', 'digital'],
-                'prompt_json': {'style': 'realistic'},
-                'cost_cents': 50
-            }
-            
-            result = repo.create_image(image_data)
-        
-        # Should create: main image + 2 tag indexes + 1 user index
-        assert mock_db_client.put_item.call_count == 4
-        
-        # Check main image
-        image_call = mock_db_client.put_item.call_args_list[0][0][0]
-        assert image_call['pk'] == 'IMG#image123'
-        assert image_call['sk'] == 'META'
-        assert image_call['url'] == 'https://example.com/image.jpg'
-        assert image_call['tags'] == ['portrait', 'digital']
-        assert image_call['favorited_count'] == 0
-        assert image_call['public'] is True
-        
-        # Check tag indexes
-        tag_calls = [call[0][0] for call in mock_db_client.put_item.call_args_list[1:3]]
-        tag_pks = sorted([call['pk'] for call in tag_calls])
-        assert tag_pks == ['TAG#digital', 'TAG#portrait']
-        
-        # Check user index
-        user_index = mock_db_client.put_item.call_args_list[3][0][0]
-        assert user_index['pk'] == 'USER#user123'
-        assert user_index['sk'] == 'IMG#image123'
-    
-    def test_create_image_without_user(self, repo, mock_db_client):
-        """Test creating image without user_id"""
-        with patch('api.core.dynamodb_utils.uuid.uuid4', return_value='image123'):
-            image_data = {
-                'url': 'https://example.com/image.jpg',
-                'tags': []
-            }
-            
-            result = repo.create_image(image_data)
-        
-        # Should only create main image (no tags or user index)
-        assert mock_db_client.put_item.call_count == 1
-    
-    def test_get_image(self, repo, mock_db_client):
-        """Test getting image by ID"""
-        mock_db_client.get_item.return_value = {'image_id': 'image123'}
-        
-        result = repo.get_image('image123')
-        
-        mock_db_client.get_item.assert_called_with('IMG#image123', 'META')
-        assert result == {'image_id': 'image123'}
-    
-    def test_get_images_by_tag(self, repo, mock_db_client):
-        """Test getting images by tag"""
-        mock_db_client.query_items.return_value = (
-            [{'sk': 'IMG#image1'}, {'sk': 'IMG#image2'}],
-            None
-        )
-        mock_db_client.get_item.side_effect = [
-            {'image_id': 'image1', 'url': 'url1'},
-            {'image_id': 'image2', 'url': 'url2', 'deleted_at': 123},  # Deleted
-        ]
-        
-        images, cursor = repo.get_images_by_tag('portrait', limit=10)
-        
-        # Should only return non-deleted image
-        assert len(images) == 1
-        assert images[0]['image_id'] == 'image1'
-        assert cursor is None
     
-    def test_get_images_by_tag_with_pagination(self, repo, mock_db_client):
-        """Test getting images by tag with pagination"""
-        mock_db_client.query_items.return_value = (
-            [{'sk': 'IMG#image1'}],
-            {'pk': 'TAG#portrait', 'sk': 'IMG#image1'}
+    def test_delete_items_handles_client_error(self, client):
+        """Test delete_items raises exception on ClientError"""
+        client.client.update_item.side_effect = ClientError(
+            {'Error': {'Message': 'Throttled'}},
+            'UpdateItem'
         )
-        mock_db_client.get_item.return_value = {'image_id': 'image1'}
         
-        images, cursor = repo.get_images_by_tag('portrait', cursor='IMG#prev')
+        with pytest.raises(Exception) as exc_info:
+            client.delete_items([('IMG#1', 'META')])
         
-        assert cursor == 'IMG#image1'
-        mock_db_client.query_items.assert_called_with(
-            'TAG#portrait',
-            limit=20,
-            last_evaluated_key={'pk': 'TAG#portrait', 'sk': 'IMG#prev'}
-        )
+        assert 'Error deleting items: Throttled' in str(exc_info.value)
     
-    def test_get_user_images(self, repo, mock_db_client):
-        """Test getting images by user"""
-        mock_db_client.query_gsi.return_value = (
-            [
-                {'sk': 'IMG#image1'}, 
-                {'sk': 'PROFILE'},  # Non-image item
-                {'sk': 'IMG#image2'}
-            ],
-            None
-        )
-        mock_db_client.get_item.side_effect = [
-            {'image_id': 'image1'},
-            {'image_id': 'image2'}
-        ]
+    def test_update_fields_uses_single_update_item(self, client, mock_table):
+        """Test update_fields issues one conditional UpdateItem"""
+        mock_table.update_item.return_value = {
+            'Attributes': {'pk': 'USER#123', 'sk': 'PROFILE', 'score': Decimal('2.5')}
+        }
         
-        images, cursor = repo.get_user_images('user123')
+        result = client.update_fields('USER#123', 'PROFILE', {'score': 2.5, 'role': 'admin'})
         
-        assert len(images) == 2
-        mock_db_client.query_gsi.assert_called_with(
-            'imagesByUser', 
-            'USER#user123', 
-            limit=20, 
-            last_evaluated_key=None
+        mock_table.update_item.assert_called_once_with(
+            Key={'pk': 'USER#123', 'sk': 'PROFILE'},
+            ReturnValues='ALL_NEW',
+            UpdateExpression='SET #f0 = :v0, #f1 = :v1',
+            ExpressionAttributeNames={'#f0': 'score', '#f1': 'role'},
+            ExpressionAttributeValues={':v0': Decimal('2.5'), ':v1': 'admin'},
+            ConditionExpression='attribute_exists(pk)'
         )
-
-
-class TestJobRepository:
-    """Test cases for JobRepository"""
+        assert result['score'] == 2.5
     
-    @pytest.fixture
-    def mock_db_client(self):
-        """Mock DynamoDBClient"""
-        return Mock(spec=DynamoDBClient)
-    
-    @pytest.fixture
-    def repo(self, mock_db_client):
-        """Create JobRepository with mocked client"""
-        with patch('api.core.dynamodb_utils.DynamoDBClient', return_value=mock_db_client):
-            repo = JobRepository()
-            repo.db = mock_db_client
-            return repo
-    
-    def test_create_job(self, repo, mock_db_client):
-        """Test creating a new generation job"""
-        with patch('api.core.dynamodb_utils.uuid.uuid4', return_value='job123'), \
-             patch('time.time', return_value=1234567890):
-            
-            filters = {'style': 'portrait', 'mood': 'happy'}
-            result = repo.create_job('user123', filters, batch_size=5)
-        
-        # Should create job and status index
-        assert mock_db_client.put_item.call_count == 2
-        
-        # Check job item
-        job_call = mock_db_client.put_item.call_args_list[0][0][0]
-        assert job_call['pk'] == 'USER#user123'
-        assert job_call['sk'] == 'JOB#job123'
-        assert job_call['status'] == 'queued'
-        assert job_call['batch_size'] == 5
-        assert job_call['image_ids'] == []
-        
-        # Check status index
-        status_call = mock_db_client.put_item.call_args_list[1][0][0]
-        assert status_call['pk'] == 'JOBSTATUS#queued'
-        assert status_call['sk'] == '1234567890'
-    
-    def test_get_job(self, repo, mock_db_client):
-        """Test getting job by ID"""
-        mock_db_client.get_item.return_value = {'job_id': 'job123'}
-        
-        result = repo.get_job('user123', 'job123')
-        
-        mock_db_client.get_item.assert_called_with('USER#user123', 'JOB#job123')
-        assert result == {'job_id': 'job123'}
-    
-    def test_update_job_status(self, repo, mock_db_client):
-        """Test updating job status"""
-        mock_db_client.get_item.return_value = {
-            'pk': 'USER#user123',
-            'sk': 'JOB#job123',
-            'job_id': 'job123',
-            'status': 'queued',
-            'created_at': 1234567890
-        }
-        
-        with patch('time.time', return_value=1234567900):
-            result = repo.update_job_status(
-                'user123', 
-                'job123', 
-                'completed',
-                image_ids=['img1', 'img2']
-            )
-        
-        # Should delete old status index, update job, create new status index
-        assert mock_db_client.delete_item.call_count == 1
-        assert mock_db_client.put_item.call_count == 2
-        
-        # Check delete call
-        mock_db_client.delete_item.assert_called_with(
-            'JOBSTATUS#queued', 
-            '1234567890'
+    def test_update_fields_returns_none_when_missing(self, client, mock_table):
+        """Test update_fields returns None when the item does not exist"""
+        mock_table.update_item.side_effect = ClientError(
+            {'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'failed'}},
+            'UpdateItem'
         )
         
-        # Check updated job
-        job_update = mock_db_client.put_item.call_args_list[0][0][0]
-        assert job_update['status'] == 'completed'
-        assert job_update['image_ids'] == ['img1', 'img2']
-        assert job_update['updated_at'] == 1234567900
+        assert client.update_fields('USER#123', 'PROFILE', {'role': 'admin'}) is None
     
-    def test_update_job_status_not_found(self, repo, mock_db_client):
-        """Test updating non-existent job raises error"""
-        mock_db_client.get_item.return_value = None
+    def test_increment_field(self, client, mock_table):
+        """Test increments use a server-side ADD on an existing item"""
+        mock_table.update_item.return_value = {'Attributes': {'pk': 'USER#123', 'quota_used': 5}}
         
-        with pytest.raises(ValueError) as exc_info:
-            repo.update_job_status('user123', 'job123', 'completed')
+        result = client.increment_field('USER#123', 'PROFILE', 'quota_used', 2)
         
-        assert 'Job job123 not found' in str(exc_info.value)
-
-
-class TestSubscriptionRepository:
-    """Test cases for SubscriptionRepository"""
-    
-    @pytest.fixture
-    def mock_db_client(self):
-        """Mock DynamoDBClient"""
-        return Mock(spec=DynamoDBClient)
-    
-    @pytest.fixture
-    def repo(self, mock_db_client):
-        """Create SubscriptionRepository with mocked client"""
-        with patch('api.core.dynamodb_utils.DynamoDBClient', return_value=mock_db_client):
-            repo = SubscriptionRepository()
-            repo.db = mock_db_client
-            return repo
-    
-    def test_create_subscription(self, repo, mock_db_client):
-        """Test creating a new subscription"""
-        with patch('time.time', return_value=1234567890):
-            result = repo.create_subscription(
-                'user123',
-                'sub_stripe123',
-                'pro',
-                'active',
-                1234567890
-            )
-        
-        # Should create subscription and Stripe index
-        assert mock_db_client.put_item.call_count == 2
-        
-        # Check subscription item
-        sub_call = mock_db_client.put_item.call_args_list[0][0][0]
-        assert sub_call['pk'] == 'USER#user123'
-        assert sub_call['sk'] == 'SUB#sub_stripe123'
-        assert sub_call['plan_id'] == 'pro'
-        assert sub_call['status'] == 'active'
-        
-        # Check Stripe index
-        index_call = mock_db_client.put_item.call_args_list[1][0][0]
-        assert index_call['pk'] == 'SUB#sub_stripe123'
-        assert index_call['sk'] == 'USER#user123'
-    
-    def test_get_subscription(self, repo, mock_db_client):
-        """Test getting subscription by ID"""
-        mock_db_client.get_item.return_value = {'subscription_id': 'sub123'}
-        
-        result = repo.get_subscription('user123', 'sub123')
-        
-        mock_db_client.get_item.assert_called_with('USER#user123', 'SUB#sub123')
-        assert result == {'subscription_id': 'sub123'}
-    
-    def test_get_user_subscriptions(self, repo, mock_db_client):
-        """Test getting all subscriptions for a user"""
-        mock_db_client.query_items.return_value = (
-            [
-                {'subscription_id': 'sub1', 'status': 'active'},
-                {'subscription_id': 'sub2', 'status': 'canceled'},
-                {'sk': 'SUB#sub3'}  # Item without subscription_id
-            ],
-            None
+        mock_table.update_item.assert_called_once_with(
+            Key={'pk': 'USER#123', 'sk': 'PROFILE'},
+            ReturnValues='ALL_NEW',
+            UpdateExpression='ADD #f :amount',
+            ConditionExpression='attribute_exists(pk)',
+            ExpressionAttributeNames={'#f': 'quota_used'},
+            ExpressionAttributeValues={':amount': 2}
         )
-        
-        result = repo.get_user_subscriptions('user123')
-        
-        assert len(result) == 2
-        assert all('subscription_id' in sub for sub in result)
-    
-    def test_get_active_subscription(self, repo, mock_db_client):
-        """Test getting the active subscription for a user"""
-        mock_db_client.query_items.return_value = (
-            [
-                {'subscription_id': 'sub1', 'status': 'canceled'},
-                {'subscription_id': 'sub2', 'status': 'active'},
-                {'subscription_id': 'sub3', 'status': 'past_due'}
-            ],
-            None
+        assert result['quota_used'] == 5
+    
+    def test_increment_field_negative_guards_floor(self, client, mock_table):
+        """Test decrements are conditional on the field staying non-negative"""
+        mock_table.update_item.side_effect = ClientError(
+            {'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'Condition failed'}},
+            'UpdateItem'
         )
         
-        result = repo.get_active_subscription('user123')
-        
-        assert result['subscription_id'] == 'sub2'
-        assert result['status'] == 'active'
-    
-    def test_get_active_subscription_none_active(self, repo, mock_db_client):
-        """Test getting active subscription when none are active"""
-        mock_db_client.query_items.return_value = (
-            [
-                {'subscription_id': 'sub1', 'status': 'canceled'},
-                {'subscription_id': 'sub2', 'status': 'past_due'}
-            ],
-            None
+        assert client.increment_field('USER#123', 'PROFILE', 'quota_used', -3) is None
+        call_kwargs = mock_table.update_item.call_args[1]
+        assert call_kwargs['ConditionExpression'] == 'attribute_exists(pk) AND #f >= :floor'
+        assert call_kwargs['ExpressionAttributeValues'] == {':amount': -3, ':floor': 3}
+    
+    def test_transact_write_serializes_operations(self, client, mock_table):
+        """Test transact_write sends typed values to the low-level client"""
+        mock_table.name = 'test-table'
+        
+        client.transact_write([
+            {'Put': {'Item': {'pk': 'JOBSTATUS#done', 'sk': '1', 'created_at': 5}}},
+            {'Update': {
+                'Key': {'pk': 'USER#1', 'sk': 'JOB#1'},
+                'UpdateExpression': 'SET deleted_at = :t',
+                'ExpressionAttributeValues': {':t': 5}
+            }}
+        ])
+        
+        transact_items = client.client.transact_write_items.call_args[1]['TransactItems']
+        assert transact_items[0] == {'Put': {
+            'TableName': 'test-table',
+            'Item': {'pk': {'S': 'JOBSTATUS#done'}, 'sk': {'S': '1'}, 'created_at': {'N': '5'}}
+        }}
+        assert transact_items[1]['Update']['Key'] == {'pk': {'S': 'USER#1'}, 'sk': {'S': 'JOB#1'}}
+        assert transact_items[1]['Update']['UpdateExpression'] == 'SET deleted_at = :t'
+    
+    def test_transact_write_ignores_condition_failure_when_asked(self, client, mock_table):
+        """Test a cancelled transaction returns False only for tolerated condition failures"""
+        mock_table.name = 'test-table'
+        error = ClientError(
+            {'Error': {'Code': 'TransactionCanceledException', 'Message': 'Transaction cancelled'},
+             'CancellationReasons': [{'Code': 'ConditionalCheckFailed'}, {'Code': 'None'}]},
+            'TransactWriteItems'
         )
+        client.client.transact_write_items.side_effect = error
+        operations = [{'Put': {'Item': {'pk': 'USER#1', 'sk': 'PROFILE'}, 'ConditionExpression': 'attribute_not_exists(pk)'}}]
         
-        result = repo.get_active_subscription('user123')
+        assert client.transact_write(operations, ignore_condition_failure=True) is False
+        with pytest.raises(Exception) as exc_info:
+            client.transact_write(operations)
         
-        assert result is None
+        assert 'Error in write transaction' in str(exc_info.value)
     
-    def test_update_subscription(self, repo, mock_db_client):
-        """Test updating subscription"""
-        mock_db_client.get_item.return_value = {
-            'pk': 'USER#user123',
-            'sk': 'SUB#sub123',
-            'subscription_id': 'sub123',
-            'status': 'active',
-            'plan_id': 'hobby'
+    def test_query_gsi_basic(self, client, mock_table):
+        """Test querying Global Secondary Index"""
+        mock_table.query.return_value = {
+            'Items': [{'pk': 'EMAIL#test@example.com', 'sk': 'USER#123'}]
         }
         
-        with patch('time.time', return_value=1234567900):
-            result = repo.update_subscription(
-                'user123',
-                'sub123',
-                {'status': 'canceled', 'plan_id': 'pro'}
-            )
-        
-        updated_item = mock_db_client.put_item.call_args[0][0]
-        assert updated_item['status'] == 'canceled'
-        assert updated_item['plan_id'] == 'pro'
-        assert updated_item['updated_at'] == 1234567900
-    
-    def test_update_subscription_not_found(self, repo, mock_db_client):
-        """Test updating non-existent subscription raises error"""
-        mock_db_client.get_item.return_value = None
-        
-        with pytest.raises(ValueError) as exc_info:
-            repo.update_subscription('user123', 'sub123', {'status': 'canceled'})
+        items, next_key = client.query_gsi('byEmail', 'EMAIL#test@example.com')
         
-        assert 'Subscription sub123 not found' in str(exc_info.value)
\ No newline at end of file
+        assert len(items) == 1
+        mock_table.query.assert_called_with(
+            IndexName='byEmail',
+            KeyConditionExpression='pk = :pk',
+            ExpressionAttributeValues={':pk': 'EMAIL#test@example.com'}
+        )
@@ -12,12 +12,48 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'figureforge.settings')
 django.setup()
 
 import pytest
+import threading
 import time
 import requests
+from types import SimpleNamespace
 from unittest.mock import Mock, patch, MagicMock
 from requests.exceptions import RequestException, HTTPError
 
-from api.core.fal_client import FalAIClient, ImageGenerator
+from api.core.fal_client import FalAIClient, ImageGenerator, LONG_POLL_SECONDS, POLL_JITTER, POLL_TIMEOUT
+from api.core.fal_prompts import _compose_prompt
+from api.core.fal_rate_limit import _RateLimiter
+from api.core.fal_session import MAX_BATCH_WORKERS, REQUEST_TIMEOUT
+
+
+def fake_response(content: bytes = b'{}', status_code: int = 200, headers=None, error=None):
+    """Build a minimal stand-in for a requests.Response"""
+    def raise_for_status():
+        if error is not None:
+            raise error
+    
+    return SimpleNamespace(content=content, status_code=status_code, headers=headers or {},
+                           raise_for_status=raise_for_status)
+
+
+class FakeSession:
+    """Plain stand-in for the pooled session that replays queued responses"""
+    
+    def __init__(self):
+        self.responses = []
+        self.calls = []
+    
+    def _send(self, method, url, kwargs):
+        self.calls.append((method, url, kwargs))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+    
+    def get(self, url, **kwargs):
+        return self._send('GET', url, kwargs)
+    
+    def post(self, url, **kwargs):
+        return self._send('POST', url, kwargs)
 
 
 class TestFalAIClient:
@@ -26,9 +62,17 @@ class TestFalAIClient:
     @pytest.fixture
     def client(self):
         """Create FalAIClient instance"""
+        FalAIClient._model_info_cache.clear()
+        FalAIClient._result_cache.clear()
         with patch('api.core.fal_client.settings.FAL_API_KEY', 'test-api-key'):
             return FalAIClient()
     
+    @pytest.fixture
+    def fake_session(self, client):
+        """Route the client's HTTP calls through a FakeSession"""
+        client.session = FakeSession()
+        return client.session
+    
     def test_init_sets_headers(self, client):
         """Test client initialization sets proper headers"""
         assert client.api_key == 'test-api-key'
@@ -36,39 +80,63 @@ class TestFalAIClient:
         assert client.headers['Authorization'] == 'Bearer test-api-key'
         assert client.headers['Content-Type'] == 'application/json'
     
-    def test_make_request_get(self, client):
+    def test_clients_share_pooled_session(self, client):
+        """Test clients reuse one keep-alive session with a retrying adapter"""
+        with patch('api.core.fal_client.settings.FAL_API_KEY', 'other-key'):
+            other = FalAIClient()
+        
+        assert other.session is client.session
+        adapter = client.session.get_adapter('https://api.fal.ai/v1')
+        assert adapter.max_retries.total == 3
+        assert 503 in adapter.max_retries.status_forcelist
+        assert adapter._pool_maxsize >= MAX_BATCH_WORKERS
+    
+    def test_make_request_get(self, client, fake_session):
         """Test making GET request"""
-        with patch('requests.get') as mock_get:
-            mock_response = Mock()
-            mock_response.json.return_value = {'status': 'success'}
-            mock_response.raise_for_status = Mock()
-            mock_get.return_value = mock_response
-            
-            result = client._make_request('GET', '/test')
-            
-            mock_get.assert_called_once_with(
-                'https://api.fal.ai/v1/test',
-                headers=client.headers
-            )
-            assert result == {'status': 'success'}
+        fake_session.responses.append(fake_response(b'{"status": "success"}'))
+        
+        result = client._make_request('GET', '/test')
+        
+        assert fake_session.calls == [
+            ('GET', 'https://api.fal.ai/v1/test', {'headers': client.headers, 'timeout': REQUEST_TIMEOUT})
+        ]
+        assert result == {'status': 'success'}
     
-    def test_make_request_post(self, client):
+    def test_make_request_post(self, client, fake_session):
         """Test making POST request"""
-        with patch('requests.post') as mock_post:
-            mock_response = Mock()
-            mock_response.json.return_value = {'status': 'success'}
-            mock_response.raise_for_status = Mock()
-            mock_post.return_value = mock_response
-            
-            data = {'prompt': 'test'}
-            result = client._make_request('POST', '/generate', data)
-            
-            mock_post.assert_called_once_with(
-                'https://api.fal.ai/v1/generate',
-                headers=client.headers,
-                json=data
-            )
-            assert result == {'status': 'success'}
+        fake_session.responses.append(fake_response(b'{"status": "success"}'))
+        
+        data = {'prompt': 'test'}
+        result = client._make_request('POST', '/generate', data)
+        
+        assert fake_session.calls == [
+            ('POST', 'https://api.fal.ai/v1/generate',
+             {'headers': client.headers, 'json': data, 'timeout': REQUEST_TIMEOUT})
+        ]
+        assert result == {'status': 'success'}
+    
+    def test_make_request_invalid_json(self, client, fake_session):
+        """Test a malformed response body is reported as a failed request"""
+        fake_session.responses.append(fake_response(b'<html>Bad Gateway</html>'))
+        
+        with pytest.raises(Exception) as exc_info:
+            client._make_request('GET', '/test')
+        
+        assert 'fal.ai API request failed' in str(exc_info.value)
+    
+    def test_make_request_retries_rate_limited_post(self, client, fake_session):
+        """Test a 429 on POST is resent after waiting out Retry-After"""
+        fake_session.responses.extend([
+            fake_response(status_code=429, headers={'Retry-After': '3'}),
+            fake_response(b'{"request_id": "req123"}')
+        ])
+        
+        with patch.object(client._cancelled, 'wait', return_value=False) as mock_wait:
+            result = client._make_request('POST', '/generate', {'prompt': 'test'})
+        
+        assert result == {'request_id': 'req123'}
+        assert len(fake_session.calls) == 2
+        mock_wait.assert_called_once_with(3.0)
     
     def test_make_request_unsupported_method(self, client):
         """Test making request with unsupported method"""
@@ -77,27 +145,23 @@ class TestFalAIClient:
         
         assert 'Unsupported method: DELETE' in str(exc_info.value)
     
-    def test_make_request_http_error(self, client):
+    def test_make_request_http_error(self, client, fake_session):
         """Test handling HTTP errors"""
-        with patch('requests.post') as mock_post:
-            mock_response = Mock()
-            mock_response.raise_for_status.side_effect = HTTPError('404 Not Found')
-            mock_post.return_value = mock_response
-            
-            with pytest.raises(Exception) as exc_info:
-                client._make_request('POST', '/test')
-            
-            assert 'fal.ai API request failed' in str(exc_info.value)
+        fake_session.responses.append(fake_response(status_code=404, error=HTTPError('404 Not Found')))
+        
+        with pytest.raises(Exception) as exc_info:
+            client._make_request('POST', '/test')
+        
+        assert 'fal.ai API request failed' in str(exc_info.value)
     
-    def test_make_request_connection_error(self, client):
+    def test_make_request_connection_error(self, client, fake_session):
         """Test handling connection errors"""
-        with patch('requests.get') as mock_get:
-            mock_get.side_effect = RequestException('Connection error')
-            
-            with pytest.raises(Exception) as exc_info:
-                client._make_request('GET', '/test')
-            
-            assert 'fal.ai API request failed' in str(exc_info.value)
+        fake_session.responses.append(RequestException('Connection error'))
+        
+        with pytest.raises(Exception) as exc_info:
+            client._make_request('GET', '/test')
+        
+        assert 'fal.ai API request failed' in str(exc_info.value)
     
     def test_generate_image_immediate_result(self, client):
         """Test generate_image with immediate result"""
@@ -174,11 +238,172 @@ class TestFalAIClient:
                 {'status': 'completed', 'result': {'images': [{'url': 'test.png'}]}}
             ]
             
-            with patch('time.sleep'):  # Mock sleep to speed up test
+            with patch.object(client._cancelled, 'wait', return_value=False):  # Skip waiting
                 result = client._poll_for_results('req123')
             
             assert result == {'images': [{'url': 'test.png'}]}
             assert mock_request.call_count == 3
+            mock_request.assert_called_with('GET', f'/requests/req123?wait={LONG_POLL_SECONDS}',
+                                            response_headers={})
+    
+    def test_completed_results_are_not_fetched_again(self, client):
+        """Test a completed request is served from cache by later polls"""
+        completed = {'status': 'completed', 'result': {'images': [{'url': 'test.png'}]}}
+        
+        with patch.object(client, '_make_request', return_value=completed) as mock_request:
+            first = client._poll_for_results('req123')
+            second = client._poll_for_results('req123')
+            batch = client.poll_batch(['req123'])
+        
+        assert first == second == batch['req123'] == {'images': [{'url': 'test.png'}]}
+        assert mock_request.call_count == 1
+    
+    def test_poll_for_results_backs_off_exponentially(self, client):
+        """Test polling delay doubles from the initial interval up to the cap"""
+        with patch.object(client, '_make_request') as mock_request:
+            mock_request.return_value = {'status': 'processing'}
+            
+            with patch('api.core.fal_client.random.uniform', return_value=0), \
+                 patch.object(client._cancelled, 'wait', return_value=False) as mock_wait:
+                with pytest.raises(Exception):
+                    client._poll_for_results('req123', max_attempts=6, interval=2)
+            
+            delays = [call[0][0] for call in mock_wait.call_args_list]
+            assert delays == [0.25, 0.5, 1, 2, 2, 2]
+    
+    def test_poll_for_results_adds_jitter(self, client):
+        """Test each poll delay gets a bounded random jitter"""
+        with patch.object(client, '_make_request') as mock_request:
+            mock_request.return_value = {'status': 'processing'}
+            
+            with patch('api.core.fal_client.random.uniform', return_value=0.05) as mock_uniform, \
+                 patch.object(client._cancelled, 'wait', return_value=False) as mock_wait:
+                with pytest.raises(Exception):
+                    client._poll_for_results('req123', max_attempts=2)
+            
+            mock_uniform.assert_called_with(0, POLL_JITTER)
+            delays = [call[0][0] for call in mock_wait.call_args_list]
+            assert delays == [0.3, 0.55]
+    
+    def test_poll_for_results_honors_retry_after(self, client):
+        """Test a Retry-After header on the status response stretches the next delay"""
+        def make_request(method, endpoint, response_headers=None):
+            response_headers['Retry-After'] = '5'
+            return {'status': 'processing'}
+        
+        with patch.object(client, '_make_request', side_effect=make_request), \
+             patch('api.core.fal_client.random.uniform', return_value=0), \
+             patch.object(client._cancelled, 'wait', return_value=False) as mock_wait:
+            with pytest.raises(Exception):
+                client._poll_for_results('req123', max_attempts=1)
+        
+        mock_wait.assert_called_once_with(5.0)
+    
+    def test_poll_for_results_stops_at_deadline(self, client):
+        """Test polling gives up once the overall timeout has elapsed"""
+        with patch.object(client, '_make_request') as mock_request:
+            mock_request.return_value = {'status': 'processing'}
+            
+            with patch('api.core.fal_client.time.monotonic', side_effect=[100, 100.1, 130]), \
+                 patch('api.core.fal_client.random.uniform', return_value=0), \
+                 patch.object(client._cancelled, 'wait', return_value=False) as mock_wait:
+                with pytest.raises(Exception) as exc_info:
+                    client._poll_for_results('req123', timeout=20)
+            
+            assert 'Generation timed out' in str(exc_info.value)
+            assert mock_request.call_count == 2
+            mock_wait.assert_called_once_with(0.25)
+            
+            # Long polls are bounded by the time left before the deadline
+            endpoints = [call[0][1] for call in mock_request.call_args_list]
+            assert endpoints == ['/requests/req123?wait=20', '/requests/req123?wait=19']
+    
+    def test_poll_for_results_is_bounded_by_default(self, client):
+        """Test polling without an explicit timeout still stops after POLL_TIMEOUT"""
+        with patch.object(client, '_make_request', return_value={'status': 'processing'}) as mock_request, \
+             patch('api.core.fal_client.time.monotonic', side_effect=[0, POLL_TIMEOUT]), \
+             patch.object(client._cancelled, 'wait', return_value=False) as mock_wait:
+            with pytest.raises(Exception) as exc_info:
+                client._poll_for_results('req123')
+        
+        assert 'Generation timed out' in str(exc_info.value)
+        assert mock_request.call_count == 1
+        mock_wait.assert_not_called()
+    
+    def test_cancel_aborts_polling(self, client):
+        """Test cancel() stops polling without waiting out the interval"""
+        with patch.object(client, '_make_request') as mock_request:
+            mock_request.return_value = {'status': 'processing'}
+            client.cancel()
+            
+            with pytest.raises(Exception) as exc_info:
+                client._poll_for_results('req123', interval=60, initial_interval=60)
+            
+            assert 'Generation cancelled' in str(exc_info.value)
+            assert mock_request.call_count == 1
+    
+    def test_poll_batch_checks_pending_requests_each_tick(self, client):
+        """Test poll_batch re-checks only unfinished requests and reports each outcome"""
+        responses = {
+            'req1': [{'status': 'completed', 'result': {'images': [{'url': 'a.png'}]}}],
+            'req2': [{'status': 'processing'}, {'status': 'failed', 'error': 'Safety check failed'}],
+            'req3': [{'status': 'processing'}, {'status': 'completed', 'result': {'images': []}}]
+        }
+        checked = []
+        
+        def make_request(method, endpoint):
+            request_id = endpoint.rsplit('/', 1)[1].split('?')[0]
+            checked.append(request_id)
+            return responses[request_id].pop(0)
+        
+        with patch.object(client, '_make_request', side_effect=make_request), \
+             patch('api.core.fal_client.random.uniform', return_value=0), \
+             patch.object(client._cancelled, 'wait', return_value=False) as mock_wait:
+            results = client.poll_batch(['req1', 'req2', 'req3'])
+        
+        assert results['req1'] == {'images': [{'url': 'a.png'}]}
+        assert 'Safety check failed' in str(results['req2'])
+        assert results['req3'] == {'images': []}
+        assert sorted(checked) == ['req1', 'req2', 'req2', 'req3', 'req3']
+        mock_wait.assert_called_once_with(0.25)
+    
+    def test_poll_batch_long_polls_until_deadline(self, client):
+        """Test poll_batch holds each check open, adds jitter and stops at the overall timeout"""
+        with patch.object(client, '_make_request', return_value={'status': 'processing'}) as mock_request, \
+             patch('api.core.fal_client.time.monotonic', side_effect=[100, 100.1, 130]), \
+             patch('api.core.fal_client.random.uniform', return_value=0.05) as mock_uniform, \
+             patch.object(client._cancelled, 'wait', return_value=False) as mock_wait:
+            results = client.poll_batch(['req1'], timeout=20)
+        
+        assert 'Generation timed out' in str(results['req1'])
+        mock_uniform.assert_called_with(0, POLL_JITTER)
+        mock_wait.assert_called_once_with(0.3)
+        endpoints = [call[0][1] for call in mock_request.call_args_list]
+        assert endpoints == ['/requests/req1?wait=20', '/requests/req1?wait=19']
+    
+    def test_poll_batch_skips_long_poll_beyond_worker_count(self, client):
+        """Test checks are not held open when pending requests outnumber the batch workers"""
+        request_ids = [f'req{i}' for i in range(MAX_BATCH_WORKERS + 1)]
+        
+        with patch.object(client, '_make_request', return_value={'status': 'processing'}) as mock_request, \
+             patch.object(client._cancelled, 'wait', return_value=False):
+            client.poll_batch(request_ids, max_attempts=1)
+        
+        assert all('?wait=' not in call[0][1] for call in mock_request.call_args_list)
+    
+    def test_poll_batch_times_out_and_cancels(self, client):
+        """Test unfinished requests are reported as timed out, or cancelled"""
+        with patch.object(client, '_make_request', return_value={'status': 'processing'}), \
+             patch.object(client._cancelled, 'wait', return_value=False):
+            results = client.poll_batch(['req1'], max_attempts=3)
+        
+        assert 'Generation timed out' in str(results['req1'])
+        
+        client.cancel()
+        with patch.object(client, '_make_request', return_value={'status': 'processing'}):
+            results = client.poll_batch(['req1'], interval=60, initial_interval=60)
+        
+        assert 'Generation cancelled' in str(results['req1'])
     
     def test_poll_for_results_failed(self, client):
         """Test polling when generation fails"""
@@ -198,7 +423,7 @@ class TestFalAIClient:
         with patch.object(client, '_make_request') as mock_request:
             mock_request.return_value = {'status': 'processing'}
             
-            with patch('time.sleep'):
+            with patch.object(client._cancelled, 'wait', return_value=False):
                 with pytest.raises(Exception) as exc_info:
                     client._poll_for_results('req123', max_attempts=2, interval=0)
             
@@ -217,6 +442,94 @@ class TestFalAIClient:
             
             mock_request.assert_called_once_with('GET', '/models/flux/dev')
             assert result['name'] == 'FLUX.1 Dev'
+    
+    def test_get_model_info_is_cached(self, client):
+        """Test repeat lookups for a model reuse the first response"""
+        with patch.object(client, '_make_request') as mock_request:
+            mock_request.return_value = {'id': 'flux/dev', 'name': 'FLUX.1 Dev'}
+            
+            first = client.get_model_info('flux/dev')
+            first['name'] = 'changed'
+            second = client.get_model_info('flux/dev')
+            client.get_model_info('flux/schnell')
+            
+            assert second['name'] == 'FLUX.1 Dev'
+            assert mock_request.call_count == 2
+    
+    def test_get_model_info_copies_nested_values(self, client):
+        """Test mutating a nested value of the result leaves the cached info intact"""
+        with patch.object(client, '_make_request') as mock_request:
+            mock_request.return_value = {'id': 'flux/dev', 'sizes': {'default': [1024, 1024]}}
+            
+            first = client.get_model_info('flux/dev')
+            first['sizes']['default'].append(512)
+            first['sizes']['square'] = [512, 512]
+            second = client.get_model_info('flux/dev')
+            
+            assert second['sizes'] == {'default': [1024, 1024]}
+            assert mock_request.call_count == 1
+
+
+class TestRateLimiter:
+    """Test cases for the token bucket pacing fal.ai requests"""
+    
+    def test_acquire_waits_once_burst_is_spent(self):
+        """Test requests beyond the burst wait for a token to refill"""
+        with patch('api.core.fal_rate_limit.time.monotonic', return_value=100):
+            limiter = _RateLimiter(rate=4, capacity=2)
+            
+            with patch('api.core.fal_rate_limit.time.sleep') as mock_sleep:
+                limiter.acquire()
+                limiter.acquire()
+                mock_sleep.assert_not_called()
+                
+                # The clock is frozen, so the sleep stands in for the refill
+                mock_sleep.side_effect = lambda seconds: setattr(limiter, 'tokens', 1)
+                limiter.acquire()
+        
+        mock_sleep.assert_called_once_with(0.25)
+    
+    def test_update_adopts_rate_limit_headers(self):
+        """Test X-RateLimit-* headers set the burst, remaining tokens and refill rate"""
+        limiter = _RateLimiter(rate=10, capacity=10)
+        
+        limiter.update({'X-RateLimit-Limit': '60', 'X-RateLimit-Remaining': '20', 'X-RateLimit-Reset': '10'})
+        
+        assert limiter.capacity == 60
+        assert limiter.tokens <= 20
+        assert limiter.rate == 2
+        
+        limiter.update({})
+        assert limiter.rate == 2
+    
+    def test_update_reads_epoch_reset_and_floors_rate(self):
+        """Test an epoch X-RateLimit-Reset is read as an absolute time and the rate has a floor"""
+        limiter = _RateLimiter(rate=10, capacity=10)
+        
+        with patch('api.core.fal_rate_limit.time.time', return_value=1_700_000_000):
+            limiter.update({'X-RateLimit-Remaining': '30', 'X-RateLimit-Reset': '1700000010'})
+        assert limiter.rate == 3
+        
+        limiter.update({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '3600'})
+        assert limiter.rate == 1
+    
+    def test_reported_rate_lapses_when_window_resets(self):
+        """Test the default rate returns once the reset window passes, with waits capped meanwhile"""
+        with patch('api.core.fal_rate_limit.time.monotonic', return_value=100):
+            limiter = _RateLimiter(rate=10, capacity=10)
+            limiter.update({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '5'})
+            
+            assert limiter.rate == 1
+            assert limiter.reset_at == 105
+        
+        clock = iter([100, 106, 106])
+        with patch('api.core.fal_rate_limit.time.monotonic', side_effect=lambda: next(clock)), \
+                patch('api.core.fal_rate_limit.time.sleep') as mock_sleep:
+            limiter.acquire()
+        
+        mock_sleep.assert_called_once_with(1.0)
+        assert limiter.rate == 10
+        assert limiter.reset_at is None
 
 
 class TestImageGenerator:
@@ -283,6 +596,28 @@ class TestImageGenerator:
         assert 'simple neutral background' in prompt
         assert 'professional reference photo' in prompt
     
+    def test_build_prompt_exact_output(self, generator):
+        """Test the full prompt layout including style suffix"""
+        prompt = generator._build_prompt({'pose': 'standing'})
+        
+        assert prompt == (
+            'A human figure reference, in standing pose, simple neutral background. '
+            'professional reference photo, full body visible, clear details, '
+            'suitable for figure drawing practice --no nsfw, nude, explicit, inappropriate'
+        )
+    
+    def test_build_prompt_reuses_cached_prompt(self, generator):
+        """Test filters differing only in seed share a cached prompt"""
+        _compose_prompt.cache_clear()
+        
+        first = generator._build_prompt({'pose': 'standing', 'seed': 1})
+        second = generator._build_prompt({'pose': 'standing', 'seed': 2})
+        unhashable = generator._build_prompt({'pose': ['standing']})
+        
+        assert first == second
+        assert _compose_prompt.cache_info().hits == 1
+        assert "in ['standing'] pose" in unhashable
+    
     def test_get_image_size(self, generator):
         """Test converting aspect ratio to image size"""
         assert generator._get_image_size('square') == 'square'
@@ -299,6 +634,14 @@ class TestImageGenerator:
         assert generator.estimate_cost(10, 'flux_schnell') == 100
         assert generator.estimate_cost(3, 'stable_diffusion') == 45
     
+    def test_estimate_costs(self, generator):
+        """Test batched cost estimation matches per-pair estimates"""
+        sizes = [1, 5, 10, 3]
+        keys = ['flux_dev', 'flux_schnell', 'stable_diffusion', 'unknown']
+        
+        assert generator.estimate_costs(sizes, keys) == [25, 50, 150, 75]
+        assert generator.estimate_cost(2, 'unknown') == 50
+    
     def test_generate_from_filters_success(self, generator):
         """Test successful image generation from filters"""
         mock_client = Mock()
@@ -327,6 +670,19 @@ class TestImageGenerator:
         assert 'athletic body type' in call_args[1]['prompt']
         assert call_args[1]['parameters']['image_size'] == 'portrait_4_3'
     
+    def test_prepare_generation_uses_baked_model_parameters(self, generator):
+        """Test per-model parameters are merged into a fresh dict each call"""
+        model_config, _, parameters = generator._prepare_generation({'seed': 5}, 'flux_schnell')
+        _, _, fallback = generator._prepare_generation({}, 'unknown')
+        
+        assert model_config['id'] == 'flux/schnell'
+        assert parameters == {'num_inference_steps': 4, 'num_images': 1, 'image_size': 'square', 'seed': 5}
+        assert fallback == {'num_inference_steps': 28, 'guidance_scale': 3.5, 'num_images': 1,
+                            'image_size': 'square'}
+        
+        parameters['seed'] = 6
+        assert 'seed' not in generator._model_params['flux_schnell']
+    
     def test_generate_from_filters_with_seed(self, generator):
         """Test generation with specific seed"""
         mock_client = Mock()
@@ -354,7 +710,7 @@ class TestImageGenerator:
     def test_generate_batch_success(self, generator):
         """Test batch generation"""
         mock_client = Mock()
-        mock_client.generate_image.return_value = {
+        mock_client.start_generation.return_value = {
             'images': [{'url': f'image.png'}],
             'seed': 1000
         }
@@ -364,42 +720,115 @@ class TestImageGenerator:
         result = generator.generate_batch(filters, batch_size=3)
         
         assert len(result) == 3
-        assert mock_client.generate_image.call_count == 3
+        assert mock_client.start_generation.call_count == 3
+        
+        # Immediate results leave nothing to poll
+        mock_client.poll_batch.assert_not_called()
+    
+    def test_generate_batch_polls_pending_requests_together(self, generator, caplog):
+        """Test requests that need polling are collected in one shared poll"""
+        mock_client = Mock()
+        mock_client.start_generation.side_effect = lambda prompt, model_id, parameters: (
+            {'request_id': f"req{parameters['seed']}"}
+        )
+        mock_client.poll_batch.return_value = {
+            'req1': {'images': [{'url': 'image1.png'}]},
+            'req2': Exception('Generation failed: Safety check failed'),
+            'req3': {'images': [{'url': 'image3.png'}]}
+        }
+        generator.client = mock_client
+        
+        with caplog.at_level('WARNING', logger='api.core.fal_client'):
+            result = generator.generate_batch({'seed': 1}, batch_size=3)
+        
+        mock_client.poll_batch.assert_called_once_with(['req1', 'req2', 'req3'])
+        assert [image['url'] for image in result] == ['image1.png', 'image3.png']
+        assert 'Failed to generate image 2' in caplog.text
     
     def test_generate_batch_with_seed_variation(self, generator):
         """Test batch generation with seed variation"""
         mock_client = Mock()
-        mock_client.generate_image.return_value = {'images': [{'url': 'test.png'}]}
+        mock_client.start_generation.return_value = {'images': [{'url': 'test.png'}]}
         generator.client = mock_client
         
         filters = {'seed': 1000}
         generator.generate_batch(filters, batch_size=3)
         
         # Check that seeds are incremented
-        calls = mock_client.generate_image.call_args_list
+        calls = mock_client.start_generation.call_args_list
         assert len(calls) == 3
         
         # Seeds should be 1000, 1001, 1002
-        for i, call in enumerate(calls):
-            prompt = call[1]['prompt']
-            params = call[1]['parameters']
-            # Note: seed is in filters, not parameters in the actual call
-            # The test shows filters are modified in place
+        seeds = sorted(call[0][2]['seed'] for call in calls)
+        assert seeds == [1000, 1001, 1002]
+        
+        # The caller's filters are not mutated
+        assert filters == {'seed': 1000}
+    
+    def test_generate_batch_prepares_generation_once(self, generator):
+        """Test the prompt and shared parameters are built once per batch"""
+        mock_client = Mock()
+        mock_client.start_generation.return_value = {'images': [{'url': 'test.png'}]}
+        generator.client = mock_client
+        
+        with patch.object(generator, '_prepare_generation', wraps=generator._prepare_generation) as mock_prepare:
+            generator.generate_batch({'seed': 7, 'pose': 'standing'}, batch_size=3)
+        
+        mock_prepare.assert_called_once()
+        parameters = [call[0][2] for call in mock_client.start_generation.call_args_list]
+        assert sorted(p['seed'] for p in parameters) == [7, 8, 9]
+        assert {p['image_size'] for p in parameters} == {'square'}
     
     def test_generate_batch_partial_failure(self, generator):
         """Test batch generation continues on partial failure"""
+        def start_generation(prompt, model_id, parameters):
+            # Fail the second image of the batch regardless of thread scheduling
+            if parameters['seed'] == 2:
+                raise Exception('Generation failed')
+            return {'images': [{'url': f"image{parameters['seed']}.png"}]}
+        
         mock_client = Mock()
-        mock_client.generate_image.side_effect = [
-            {'images': [{'url': 'image1.png'}]},
-            Exception('Generation failed'),
-            {'images': [{'url': 'image3.png'}]}
-        ]
+        mock_client.start_generation.side_effect = start_generation
         generator.client = mock_client
         
-        with patch('builtins.print'):  # Mock print to avoid test output
-            result = generator.generate_batch({}, batch_size=3)
+        result = generator.generate_batch({'seed': 1}, batch_size=3)
         
         # Should return 2 images despite one failure
         assert len(result) == 2
         assert result[0]['url'] == 'image1.png'
-        assert result[1]['url'] == 'image3.png'
\ No newline at end of file
+        assert result[1]['url'] == 'image3.png'
+    
+    def test_generate_batch_runs_on_shared_pool(self, generator):
+        """Test batch generations run on the module's reusable worker threads"""
+        thread_names = []
+        
+        def start_generation(prompt, model_id, parameters):
+            thread_names.append(threading.current_thread().name)
+            return {'images': [{'url': 'image.png'}]}
+        
+        mock_client = Mock()
+        mock_client.start_generation.side_effect = start_generation
+        generator.client = mock_client
+        
+        generator.generate_batch({}, batch_size=2)
+        generator.generate_batch({}, batch_size=2)
+        
+        assert len(thread_names) == 4
+        assert all(name.startswith('fal-batch') for name in thread_names)
+    
+    def test_generate_batch_single_image_runs_inline(self, generator):
+        """Test a one-image batch is submitted on the calling thread"""
+        thread_names = []
+        
+        def start_generation(prompt, model_id, parameters):
+            thread_names.append(threading.current_thread().name)
+            return {'images': [{'url': 'image.png'}]}
+        
+        mock_client = Mock()
+        mock_client.start_generation.side_effect = start_generation
+        generator.client = mock_client
+        
+        result = generator.generate_batch({}, batch_size=1)
+        
+        assert len(result) == 1
+        assert thread_names == [threading.current_thread().name]
\ No newline at end of file
@@ -0,0 +1,1009 @@
+"""
+Test cases for the DynamoDB entity repositories
+"""
+
+import pytest
+import time
+from unittest.mock import DEFAULT, Mock, patch
+import orjson
+from boto3.dynamodb.types import Binary
+from django.conf import settings
+
+# Configure Django settings for testing
+if not settings.configured:
+    settings.configure(
+        AWS_REGION='us-east-1',
+        AWS_ACCESS_KEY_ID='test-key-id',
+        AWS_SECRET_ACCESS_KEY='test-secret-key',
+        AWS_DYNAMODB_TABLE_NAME='test-table',
+        DEBUG=True,
+        DATABASES={
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': ':memory:',
+            }
+        },
+        INSTALLED_APPS=[
+            'django.contrib.auth',
+            'django.contrib.contenttypes',
+            'api',
+        ],
+        USE_TZ=True,
+    )
+
+from api.core.dynamodb_utils import DynamoDBClient, TRANSACT_WRITE_LIMIT, EXPIRED_ITEM_RETENTION_SECONDS
+from api.core.repositories import (
+    UserRepository, ImageRepository, JobRepository, SubscriptionRepository, ImageCreateRequest
+)
+
+
+@pytest.fixture(scope='module', autouse=True)
+def _patch_boto3():
+    """Swap out boto3 once for the module so client construction never reaches AWS"""
+    # The shared singletons are reset on exit so mocks never leak into other modules
+    with patch('api.core.dynamodb_utils.boto3') as mock_boto3, \
+         patch.multiple('api.core.dynamodb_utils', _dynamodb_resource=None,
+                        _dynamodb_low_level_client=None, _dynamodb_client=None):
+        yield mock_boto3
+
+
+@pytest.fixture
+def captured(mock_db_client):
+    """Record the first positional argument of each mocked write, keyed by method name"""
+    # Appending in a side_effect is cheaper and clearer than digging through call_args;
+    # returning DEFAULT keeps any return_value a test sets
+    captured = {}
+    for name in ('put_item', 'batch_put', 'transact_write'):
+        calls = captured[name] = []
+        getattr(mock_db_client, name).side_effect = lambda *args, _calls=calls, **kwargs: _calls.append(args[0]) or DEFAULT
+    return captured
+
+
+class TestRepositoryClient:
+    """Test cases for the client shared by repositories"""
+    
+    def test_repositories_share_client(self, monkeypatch):
+        """Test repositories reuse a single DynamoDBClient"""
+        monkeypatch.setattr('api.core.dynamodb_utils._dynamodb_client', None)
+        
+        with patch('api.core.dynamodb_utils.DynamoDBClient') as mock_client_cls:
+            user_repo = UserRepository()
+            image_repo = ImageRepository()
+        
+        mock_client_cls.assert_called_once()
+        assert user_repo.db is image_repo.db
+
+
+class TestUserRepository:
+    """Test cases for UserRepository"""
+    
+    @pytest.fixture
+    def mock_db_client(self):
+        """Mock DynamoDBClient"""
+        return Mock(spec=DynamoDBClient)
+    
+    @pytest.fixture
+    def repo(self, mock_db_client):
+        """Create UserRepository with mocked client"""
+        repo = UserRepository()
+        repo.db = mock_db_client
+        return repo
+    
+    def test_create_user(self, repo, mock_db_client, captured):
+        """Test creating a new user"""
+        with patch('time.time', return_value=1234567890):
+            result = repo.create_user('user123', 'test@example.com', 'testuser')
+        
+        # Should create both items in one transaction: a conditional user put and the email index
+        mock_db_client.transact_write.assert_called_once()
+        mock_db_client.put_item.assert_not_called()
+        operations = captured['transact_write'][-1]
+        assert mock_db_client.transact_write.call_args[1] == {'ignore_condition_failure': True}
+        assert operations[0]['Put']['ConditionExpression'] == 'attribute_not_exists(pk)'
+        items = [operation['Put']['Item'] for operation in operations]
+        
+        # Check user item
+        user_call = items[0]
+        assert user_call['pk'] == 'USER#user123'
+        assert user_call['sk'] == 'PROFILE'
+        assert user_call['email'] == 'test@example.com'
+        assert user_call['username'] == 'testuser'
+        assert user_call['role'] == 'user'
+        assert user_call['quota_used'] == 0
+        
+        # Check email index
+        email_call = items[1]
+        assert email_call['pk'] == 'EMAIL#test@example.com'
+        assert email_call['sk'] == 'USER#user123'
+    
+    def test_create_user_auto_username(self, repo, mock_db_client, captured):
+        """Test creating user with auto-generated username"""
+        result = repo.create_user('user123456', 'test@example.com')
+        
+        user_call = captured['transact_write'][-1][0]['Put']['Item']
+        assert user_call['username'] == 'user_user1234'
+    
+    def test_create_user_returns_existing_on_retry(self, repo, mock_db_client):
+        """Test a repeated create returns the stored user without writing the index"""
+        mock_db_client.transact_write.return_value = False
+        mock_db_client.get_item_fast.return_value = {'user_id': 'user123', 'quota_used': 3}
+        
+        result = repo.create_user('user123', 'test@example.com')
+        
+        mock_db_client.transact_write.assert_called_once()
+        mock_db_client.get_item_fast.assert_called_with('USER#user123', 'PROFILE')
+        assert result == {'user_id': 'user123', 'quota_used': 3}
+    
+    def test_get_user(self, repo, mock_db_client):
+        """Test getting user by ID"""
+        mock_db_client.get_item_fast.return_value = {'user_id': 'user123'}
+        
+        result = repo.get_user('user123')
+        
+        mock_db_client.get_item_fast.assert_called_with('USER#user123', 'PROFILE')
+        assert result == {'user_id': 'user123'}
+    
+    def test_get_user_by_email(self, repo, mock_db_client):
+        """Test getting user by email"""
+        mock_db_client.query_gsi.return_value = (
+            [{'pk': 'EMAIL#test@example.com', 'sk': 'USER#user123'}], 
+            None
+        )
+        mock_db_client.get_item_fast.return_value = {'user_id': 'user123'}
+        
+        result = repo.get_user_by_email('test@example.com')
+        
+        mock_db_client.query_gsi.assert_called_with('byEmail', 'EMAIL#test@example.com', limit=1)
+        mock_db_client.get_item_fast.assert_called_with('USER#user123', 'PROFILE')
+        assert result == {'user_id': 'user123'}
+    
+    def test_get_user_id_by_stripe_customer(self, repo, mock_db_client):
+        """Test resolving a Stripe customer through the sparse GSI"""
+        mock_db_client.query_gsi.return_value = ([{'user_id': 'user123'}], None)
+        
+        result = repo.get_user_id_by_stripe_customer('cus_123')
+        
+        mock_db_client.query_gsi.assert_called_with(
+            'byStripeCustomer', 'cus_123', limit=1,
+            projection=['user_id'], pk_attr='stripe_customer_id'
+        )
+        assert result == 'user123'
+        
+        mock_db_client.query_gsi.return_value = ([], None)
+        assert repo.get_user_id_by_stripe_customer('cus_unknown') is None
+    
+    def test_get_user_by_email_not_found(self, repo, mock_db_client):
+        """Test getting user by email when not found"""
+        mock_db_client.query_gsi.return_value = ([], None)
+        
+        result = repo.get_user_by_email('notfound@example.com')
+        
+        assert result is None
+    
+    def test_update_user(self, repo, mock_db_client):
+        """Test updating user profile"""
+        mock_db_client.update_fields.return_value = {
+            'pk': 'USER#user123',
+            'sk': 'PROFILE',
+            'username': 'newname'
+        }
+        
+        result = repo.update_user('user123', {'username': 'newname'})
+        
+        # Single UpdateItem round trip, no read-modify-write
+        mock_db_client.update_fields.assert_called_once_with(
+            'USER#user123', 'PROFILE', {'username': 'newname'}
+        )
+        mock_db_client.get_item.assert_not_called()
+        mock_db_client.put_item.assert_not_called()
+        assert result['username'] == 'newname'
+    
+    def test_update_user_not_found(self, repo, mock_db_client):
+        """Test updating non-existent user raises error"""
+        mock_db_client.update_fields.return_value = None
+        
+        with pytest.raises(ValueError) as exc_info:
+            repo.update_user('user123', {'username': 'newname'})
+        
+        assert 'User user123 not found' in str(exc_info.value)
+    
+    def test_adjust_quota_used(self, repo, mock_db_client):
+        """Test quota usage is incremented server-side"""
+        mock_db_client.increment_field.return_value = {'user_id': 'user123', 'quota_used': 7}
+        
+        result = repo.adjust_quota_used('user123', 4)
+        
+        mock_db_client.increment_field.assert_called_once_with('USER#user123', 'PROFILE', 'quota_used', 4)
+        mock_db_client.update_fields.assert_not_called()
+        assert result['quota_used'] == 7
+    
+    def test_adjust_quota_used_refund_clamps_at_zero(self, repo, mock_db_client):
+        """Test refunding more than was used resets the counter to zero"""
+        mock_db_client.increment_field.return_value = None
+        mock_db_client.update_fields.return_value = {'user_id': 'user123', 'quota_used': 0}
+        
+        result = repo.adjust_quota_used('user123', -4)
+        
+        mock_db_client.update_fields.assert_called_once_with('USER#user123', 'PROFILE', {'quota_used': 0})
+        assert result['quota_used'] == 0
+    
+    def test_adjust_quota_used_user_not_found(self, repo, mock_db_client):
+        """Test adjusting quota for a missing user raises error"""
+        mock_db_client.increment_field.return_value = None
+        
+        with pytest.raises(ValueError) as exc_info:
+            repo.adjust_quota_used('user123', 4)
+        
+        assert 'User user123 not found' in str(exc_info.value)
+
+
+class TestImageRepository:
+    """Test cases for ImageRepository"""
+    
+    @pytest.fixture
+    def mock_db_client(self):
+        """Mock DynamoDBClient"""
+        return Mock(spec=DynamoDBClient)
+    
+    @pytest.fixture
+    def repo(self, mock_db_client):
+        """Create ImageRepository with mocked client"""
+        ImageRepository._cache.clear()
+        repo = ImageRepository()
+        repo.db = mock_db_client
+        return repo
+    
+    def test_create_image(self, repo, mock_db_client, captured):
+        """Test creating a new image record"""
+        with patch('api.core.repositories.images.uuid.uuid4', return_value=Mock(hex='image123')), \
+             patch('time.time', return_value=1234567890):
+            
+            image_data = {
+                'user_id': 'user123',
+                'url': 'https://example.com/image.jpg',
+                'tags': ['portrait', 'digital'],
+                'prompt_json': {'style': 'realistic'},
+                'cost_cents': 50
+            }
+            
+            result = repo.create_image(image_data)
+        
+        # Should create the main image conditionally with 2 tag indexes + 1 user index in one transaction
+        mock_db_client.transact_write.assert_called_once()
+        mock_db_client.put_item.assert_not_called()
+        mock_db_client.batch_put.assert_not_called()
+        operations = captured['transact_write'][-1]
+        assert operations[0]['Put']['ConditionExpression'] == 'attribute_not_exists(pk)'
+        assert all('ConditionExpression' not in operation['Put'] for operation in operations[1:])
+        items = [operation['Put']['Item'] for operation in operations]
+        assert len(items) == 4
+        
+        # Check main image
+        image_call = items[0]
+        assert image_call['pk'] == 'IMG#image123'
+        assert image_call['sk'] == 'META'
+        assert image_call['url'] == 'https://example.com/image.jpg'
+        assert image_call['tags'] == ['portrait', 'digital']
+        assert image_call['favorited_count'] == 0
+        assert image_call['public'] is True
+        assert image_call['prompt_json'] == '{"style":"realistic"}'
+        assert result['prompt_json'] == {'style': 'realistic'}
+        
+        # Check tag indexes
+        tag_calls = items[1:3]
+        tag_pks = sorted([call['pk'] for call in tag_calls])
+        assert tag_pks == ['TAG#digital', 'TAG#portrait']
+        
+        # Check user index
+        user_index = items[3]
+        assert user_index['pk'] == 'USER#user123'
+        assert user_index['sk'] == 'IMG#image123'
+        
+        # Index entries carry the listing summary
+        for index_item in items[1:]:
+            assert index_item['url'] == 'https://example.com/image.jpg'
+            assert index_item['image_id'] == 'image123'
+            assert index_item['favorited_count'] == 0
+            assert index_item['public'] is True
+            assert 'deleted_at' not in index_item
+    
+    def test_create_image_compresses_large_prompts(self, repo, mock_db_client, captured):
+        """Test large prompts are stored gzip-compressed and decoded on read"""
+        prompt = {'prompt': 'a knight in ornate armor, ' * 40, 'negative_prompt': 'blurry'}
+        
+        result = repo.create_image({'image_id': 'image123', 'url': 'https://example.com/image.jpg',
+                                    'tags': [], 'prompt_json': prompt})
+        
+        stored = captured['put_item'][-1]['prompt_json']
+        assert type(stored) is bytes
+        assert len(stored) < len(orjson.dumps(prompt))
+        assert result['prompt_json'] == prompt
+        
+        # Reads come back as boto3 Binary values
+        mock_db_client.get_item_fast.return_value = {'image_id': 'image456', 'prompt_json': Binary(stored)}
+        assert repo.get_image('image456')['prompt_json'] == prompt
+    
+    def test_create_image_from_request_dataclass(self, repo, mock_db_client, captured):
+        """Test a typed ImageCreateRequest is written like the equivalent dict"""
+        request = ImageCreateRequest(url='https://example.com/image.jpg', image_id='image123',
+                                     user_id='user123', tags=['portrait'], cost_cents=50)
+        
+        with patch('time.time', return_value=1234567890):
+            result = repo.create_image(request)
+        
+        stored, tag_index, user_index = [op['Put']['Item'] for op in captured['transact_write'][-1]]
+        assert stored['pk'] == 'IMG#image123'
+        assert stored['user_id'] == 'user123'
+        assert stored['provider'] == 'fal.ai'
+        assert stored['cost_cents'] == 50
+        assert stored['prompt_json'] == '{}'
+        assert (tag_index['pk'], user_index['pk']) == ('TAG#portrait', 'USER#user123')
+        assert result['tags'] == ['portrait']
+        assert result['created_at'] == 1234567890
+        assert not hasattr(request, '__dict__')
+    
+    def test_create_image_without_user(self, repo, mock_db_client, captured):
+        """Test creating image without user_id"""
+        with patch('api.core.repositories.images.uuid.uuid4', return_value=Mock(hex='image123')):
+            image_data = {
+                'url': 'https://example.com/image.jpg',
+                'tags': []
+            }
+            
+            result = repo.create_image(image_data)
+        
+        # Should only create main image (no tags or user index), without a transaction
+        mock_db_client.put_item.assert_called_once()
+        assert mock_db_client.put_item.call_args[1] == {'condition': 'attribute_not_exists(pk)'}
+        
+        # None-valued fields are left off the stored item but kept in the returned one
+        stored = captured['put_item'][-1]
+        assert not {'user_id', 'provider_model_id', 'deleted_at'} & stored.keys()
+        assert result['user_id'] is None and result['deleted_at'] is None
+        mock_db_client.transact_write.assert_not_called()
+        mock_db_client.batch_put.assert_not_called()
+    
+    def test_create_image_overflows_transaction_into_batch(self, repo, mock_db_client, captured):
+        """Test index entries beyond the transaction limit are written in a batch"""
+        tags = [f'tag{i}' for i in range(TRANSACT_WRITE_LIMIT)]
+        
+        repo.create_image({'image_id': 'image123', 'user_id': 'user123',
+                           'url': 'https://example.com/image.jpg', 'tags': tags})
+        
+        assert len(captured['transact_write'][-1]) == TRANSACT_WRITE_LIMIT
+        overflow = captured['batch_put'][-1]
+        assert [item['pk'] for item in overflow] == ['TAG#tag99', 'USER#user123']
+    
+    def test_create_image_writes_one_index_entry_per_distinct_tag(self, repo, mock_db_client, captured):
+        """Test repeated tags never put two operations on the same key in the transaction"""
+        repo.create_image({'image_id': 'image123', 'user_id': 'user123',
+                           'url': 'https://example.com/image.jpg', 'tags': ['portrait', 'sketch', 'portrait']})
+        
+        keys = [(op['Put']['Item']['pk'], op['Put']['Item']['sk']) for op in captured['transact_write'][-1]]
+        assert len(keys) == len(set(keys))
+        assert [pk for pk, _ in keys[1:]] == ['TAG#portrait', 'TAG#sketch', 'USER#user123']
+    
+    def test_create_image_returns_existing_on_retry(self, repo, mock_db_client, captured):
+        """Test a repeated create with a caller-supplied ID skips the index writes"""
+        mock_db_client.transact_write.return_value = False
+        mock_db_client.get_item_fast.return_value = {'image_id': 'image123', 'prompt_json': '{}'}
+        
+        result = repo.create_image({'image_id': 'image123', 'url': 'https://example.com/image.jpg',
+                                    'tags': ['portrait']})
+        
+        assert captured['transact_write'][-1][0]['Put']['Item']['pk'] == 'IMG#image123'
+        mock_db_client.batch_put.assert_not_called()
+        assert result == {'image_id': 'image123', 'prompt_json': {},
+                          'user_id': None, 'provider_model_id': None, 'deleted_at': None}
+    
+    def test_get_image(self, repo, mock_db_client):
+        """Test getting image by ID"""
+        mock_db_client.get_item_fast.return_value = {'image_id': 'image123'}
+        
+        result = repo.get_image('image123')
+        
+        mock_db_client.get_item_fast.assert_called_with('IMG#image123', 'META')
+        assert result == {'image_id': 'image123', 'user_id': None, 'provider_model_id': None, 'deleted_at': None}
+    
+    def test_get_image_uses_cache(self, repo, mock_db_client):
+        """Test repeated reads are served from the in-process cache"""
+        mock_db_client.get_item_fast.return_value = {'image_id': 'image123', 'url': 'url1', 'tags': ['portrait']}
+        
+        first = repo.get_image('image123')
+        first['url'] = 'signed-url'
+        first['tags'].append('sketch')
+        second = repo.get_image('image123')
+        
+        mock_db_client.get_item_fast.assert_called_once()
+        assert second['url'] == 'url1'
+        assert second['tags'] == ['portrait']
+        
+        repo.get_images(['image123'])[0]['tags'].clear()
+        assert repo.get_image('image123')['tags'] == ['portrait']
+    
+    def test_update_image_invalidates_cache(self, repo, mock_db_client):
+        """Test updating an image drops its cached copy"""
+        mock_db_client.get_item_fast.return_value = {'image_id': 'image123', 'public': True}
+        mock_db_client.update_fields.return_value = {'image_id': 'image123', 'public': False}
+        
+        repo.get_image('image123')
+        repo.update_image('image123', {'public': False})
+        repo.get_image('image123')
+        
+        assert mock_db_client.get_item_fast.call_count == 2
+    
+    def test_get_images_only_fetches_uncached(self, repo, mock_db_client):
+        """Test batched reads skip images already in the cache"""
+        mock_db_client.get_item_fast.return_value = {'image_id': 'image1'}
+        mock_db_client.batch_get.return_value = [{'image_id': 'image2'}]
+        repo.get_image('image1')
+        
+        images = repo.get_images(['image1', 'image2'])
+        
+        mock_db_client.batch_get.assert_called_once_with([('IMG#image2', 'META')])
+        assert [image['image_id'] for image in images] == ['image1', 'image2']
+    
+    def test_get_image_decodes_prompt_json(self, repo, mock_db_client):
+        """Test the stored prompt_json string is parsed back into a dict"""
+        mock_db_client.get_item_fast.return_value = {
+            'image_id': 'image123',
+            'prompt_json': '{"style":"realistic","seed":7}'
+        }
+        
+        result = repo.get_image('image123')
+        
+        assert result['prompt_json'] == {'style': 'realistic', 'seed': 7}
+    
+    def test_update_image_encodes_prompt_json(self, repo, mock_db_client):
+        """Test updates store prompt_json as a string and return it decoded"""
+        mock_db_client.update_fields.return_value = {'image_id': 'image123', 'prompt_json': '{"a":1}'}
+        
+        result = repo.update_image('image123', {'prompt_json': {'a': 1}, 'public': False})
+        
+        mock_db_client.update_fields.assert_called_once_with(
+            'IMG#image123', 'META', {'prompt_json': '{"a":1}', 'public': False}
+        )
+        assert result['prompt_json'] == {'a': 1}
+    
+    def test_get_images_by_tag(self, repo, mock_db_client):
+        """Test getting images by tag"""
+        mock_db_client.iter_query.return_value = iter([{'sk': 'IMG#image1'}, {'sk': 'IMG#image2'}])
+        mock_db_client.batch_get.return_value = [
+            {'image_id': 'image1', 'url': 'url1'},
+            {'image_id': 'image2', 'url': 'url2', 'deleted_at': 123},  # Deleted
+        ]
+        
+        images, cursor = repo.get_images_by_tag('portrait', limit=10)
+        
+        # Should fetch all images in one batch and only return non-deleted image
+        mock_db_client.batch_get.assert_called_once_with(
+            [('IMG#image1', 'META'), ('IMG#image2', 'META')]
+        )
+        mock_db_client.get_item.assert_not_called()
+        assert len(images) == 1
+        assert images[0]['image_id'] == 'image1'
+        assert cursor is None
+    
+    def test_get_images_by_tag_with_pagination(self, repo, mock_db_client):
+        """Test getting images by tag with pagination"""
+        mock_db_client.iter_query.return_value = iter([
+            {'sk': 'IMG#image1', 'image_id': 'image1', 'url': 'url1'},
+            {'sk': 'IMG#image2', 'image_id': 'image2', 'url': 'url2'},
+            {'sk': 'IMG#image3', 'image_id': 'image3', 'url': 'url3'}
+        ])
+        
+        images, cursor = repo.get_images_by_tag('portrait', limit=2, cursor='IMG#prev')
+        
+        assert [image['image_id'] for image in images] == ['image1', 'image2']
+        assert cursor == 'IMG#image2'
+        mock_db_client.iter_query.assert_called_with(
+            'TAG#portrait',
+            last_evaluated_key={'pk': 'TAG#portrait', 'sk': 'IMG#prev'},
+            projection=ImageRepository.INDEX_PROJECTION,
+            page_size=2
+        )
+    
+    def test_get_images_by_tag_refills_page_past_deleted(self, repo, mock_db_client):
+        """Test deleted entries are skipped without returning a short page"""
+        mock_db_client.iter_query.return_value = iter([
+            {'sk': 'IMG#image1', 'image_id': 'image1', 'url': 'url1'},
+            {'sk': 'IMG#image2', 'image_id': 'image2', 'url': 'url2', 'deleted_at': 123},
+            {'sk': 'IMG#image3', 'image_id': 'image3', 'url': 'url3'},
+            {'sk': 'IMG#image4', 'image_id': 'image4', 'url': 'url4'}
+        ])
+        
+        images, cursor = repo.get_images_by_tag('portrait', limit=2)
+        
+        assert [image['image_id'] for image in images] == ['image1', 'image3']
+        assert cursor == 'IMG#image3'
+    
+    def test_get_user_images(self, repo, mock_db_client):
+        """Test getting images by user"""
+        mock_db_client.iter_query.return_value = iter([
+            {'sk': 'IMG#image1'},
+            {'sk': 'PROFILE'},  # Non-image item
+            {'sk': 'IMG#image2'}
+        ])
+        mock_db_client.batch_get.return_value = [
+            {'image_id': 'image1'},
+            {'image_id': 'image2'}
+        ]
+        
+        images, cursor = repo.get_user_images('user123')
+        
+        assert len(images) == 2
+        mock_db_client.batch_get.assert_called_once_with(
+            [('IMG#image1', 'META'), ('IMG#image2', 'META')]
+        )
+        mock_db_client.iter_query.assert_called_with(
+            'USER#user123',
+            last_evaluated_key=None,
+            projection=ImageRepository.INDEX_PROJECTION,
+            index_name='imagesByUser',
+            page_size=20
+        )
+    
+    def test_get_images_by_tag_uses_index_summaries(self, repo, mock_db_client):
+        """Test denormalized index entries are returned without a second read"""
+        mock_db_client.iter_query.return_value = iter([
+            {'sk': 'IMG#image1', 'image_id': 'image1', 'url': 'url1', 'public': True},
+            {'sk': 'IMG#image2', 'image_id': 'image2', 'url': 'url2', 'deleted_at': 123}
+        ])
+        
+        images, cursor = repo.get_images_by_tag('portrait')
+        
+        assert [image['image_id'] for image in images] == ['image1']
+        mock_db_client.batch_get.assert_not_called()
+        assert images[0]['deleted_at'] is None
+        assert images[0]['user_id'] is None
+    
+    def test_save_image_indexes_skips_repeated_tags(self, repo, mock_db_client, captured):
+        """Test rewriting indexes for an image with a repeated tag sends each key once"""
+        repo.save_image_indexes({'image_id': 'image123', 'user_id': 'user123', 'url': 'url1',
+                                 'tags': ['a', 'a'], 'created_at': 1234567890})
+        
+        assert [item['pk'] for item in captured['batch_put'][-1]] == ['TAG#a', 'USER#user123']
+    
+    def test_save_image_indexes_drops_removed_tags_from_listings(self, repo, mock_db_client):
+        """Test retagging a newly private image removes it from its old tag's listing"""
+        table = {}
+        mock_db_client.batch_put.side_effect = lambda items: table.update({(i['pk'], i['sk']): dict(i) for i in items})
+        mock_db_client.batch_delete.side_effect = lambda keys: [table.pop(key, None) for key in keys]
+        mock_db_client.iter_query.side_effect = lambda pk, **kwargs: iter(
+            [dict(item) for (item_pk, _), item in sorted(table.items()) if item_pk == pk])
+        image = {'image_id': 'image1', 'user_id': 'user123', 'url': 's3://bucket/image1.png',
+                 'tags': ['figure', 'old'], 'public': True, 'created_at': 1234567890}
+        repo.save_image_indexes(image)
+        assert [listed['image_id'] for listed in repo.get_images_by_tag('old')[0]] == ['image1']
+        
+        repo.save_image_indexes({**image, 'tags': ['figure'], 'public': False}, previous_tags=image['tags'])
+        
+        mock_db_client.batch_delete.assert_called_once_with([('TAG#old', 'IMG#image1')])
+        assert repo.get_images_by_tag('old') == ([], None)
+        assert [listed['public'] for listed in repo.get_images_by_tag('figure')[0]] == [False]
+    
+    def test_delete_image_marks_index_entries(self, repo, mock_db_client):
+        """Test soft delete covers the image and its index entries"""
+        image = {
+            'pk': 'IMG#image1', 'sk': 'META', 'image_id': 'image1',
+            'user_id': 'user123', 'url': 'url1', 'tags': ['portrait'], 'created_at': 1
+        }
+        
+        mock_db_client.delete_items.return_value = True
+        
+        assert repo.delete_image(image) is True
+        
+        mock_db_client.delete_item.assert_not_called()
+        deleted = mock_db_client.delete_items.call_args[0][0]
+        assert deleted == [
+            ('IMG#image1', 'META'),
+            ('TAG#portrait', 'IMG#image1'),
+            ('USER#user123', 'IMG#image1')
+        ]
+
+
+class TestJobRepository:
+    """Test cases for JobRepository"""
+    
+    @pytest.fixture
+    def mock_db_client(self):
+        """Mock DynamoDBClient"""
+        return Mock(spec=DynamoDBClient)
+    
+    @pytest.fixture
+    def repo(self, mock_db_client):
+        """Create JobRepository with mocked client"""
+        repo = JobRepository()
+        repo.db = mock_db_client
+        return repo
+    
+    def test_create_job(self, repo, mock_db_client, captured):
+        """Test creating a new generation job"""
+        with patch('api.core.repositories.jobs.uuid.uuid4', return_value='job123'), \
+             patch('time.time', return_value=1234567890):
+            
+            filters = {'style': 'portrait', 'mood': 'happy'}
+            result = repo.create_job('user123', filters, batch_size=5)
+        
+        # Should create job and status index in one batch
+        mock_db_client.batch_put.assert_called_once()
+        items = captured['batch_put'][-1]
+        assert len(items) == 2
+        
+        # Check job item
+        job_call = items[0]
+        assert job_call['pk'] == 'USER#user123'
+        assert job_call['sk'] == 'JOB#job123'
+        assert job_call['status'] == 'queued'
+        assert job_call['batch_size'] == 5
+        assert job_call['image_ids'] == []
+        assert job_call['status_sk'] == '1234567890#job123'
+        
+        # Check status index
+        status_call = items[1]
+        assert status_call['pk'] == 'JOBSTATUS#queued'
+        assert status_call['sk'] == '1234567890#job123'
+    
+    def test_jobs_created_in_same_second_get_distinct_status_entries(self, repo, mock_db_client, captured):
+        """Test the status index sort key keeps jobs created in the same second apart"""
+        with patch('api.core.repositories.jobs.uuid.uuid4', side_effect=['job1', 'job2']), \
+             patch('time.time', return_value=1234567890):
+            repo.create_job('user123', {}, batch_size=1)
+            repo.create_job('user123', {}, batch_size=1)
+        
+        status_keys = [items[1]['sk'] for items in captured['batch_put']]
+        assert status_keys == ['1234567890#job1', '1234567890#job2']
+    
+    def test_get_job(self, repo, mock_db_client):
+        """Test getting job by ID"""
+        mock_db_client.get_item.return_value = {'job_id': 'job123'}
+        
+        result = repo.get_job('user123', 'job123')
+        
+        mock_db_client.get_item.assert_called_with('USER#user123', 'JOB#job123')
+        assert result == {'job_id': 'job123'}
+    
+    def test_update_job_status(self, repo, mock_db_client, captured):
+        """Test updating job status"""
+        mock_db_client.get_item.return_value = {
+            'pk': 'USER#user123',
+            'sk': 'JOB#job123',
+            'job_id': 'job123',
+            'status': 'queued',
+            'status_sk': '1234567890#job123',
+            'created_at': 1234567890
+        }
+        
+        with patch('time.time', return_value=1234567900):
+            result = repo.update_job_status(
+                'user123', 
+                'job123', 
+                'completed',
+                image_ids=['img1', 'img2']
+            )
+        
+        # Should update job, delete old status index and create new one atomically
+        mock_db_client.transact_write.assert_called_once()
+        job_op, old_index_op, new_index_op = captured['transact_write'][-1]
+        mock_db_client.put_item.assert_not_called()
+        mock_db_client.delete_item.assert_not_called()
+        
+        # Check updated job
+        job_update = job_op['Update']
+        assert job_update['Key'] == {'pk': 'USER#user123', 'sk': 'JOB#job123'}
+        assert job_update['ConditionExpression'] == '#status = :old_status'
+        assert job_update['ExpressionAttributeValues'][':old_status'] == 'queued'
+        assert job_update['UpdateExpression'] == 'SET #f0 = :v0, #f1 = :v1, #f2 = :v2'
+        assert job_update['ExpressionAttributeValues'][':v0'] == 'completed'
+        assert job_update['ExpressionAttributeValues'][':v1'] == 1234567900
+        assert job_update['ExpressionAttributeValues'][':v2'] == ['img1', 'img2']
+        
+        # Check old index entry is deleted
+        assert old_index_op == {'Delete': {'Key': {'pk': 'JOBSTATUS#queued', 'sk': '1234567890#job123'}}}
+        
+        # Check new status index
+        new_index = new_index_op['Put']['Item']
+        assert new_index['pk'] == 'JOBSTATUS#completed'
+        assert new_index['sk'] == '1234567890#job123'
+        assert new_index['expires_at'] == 1234567900 + EXPIRED_ITEM_RETENTION_SECONDS
+        
+        assert result['status'] == 'completed'
+        assert result['image_ids'] == ['img1', 'img2']
+        assert result['updated_at'] == 1234567900
+    
+    def test_update_job_status_moves_legacy_index_entry(self, repo, mock_db_client, captured):
+        """Test a job indexed under its bare created_at has that entry replaced by the current key"""
+        mock_db_client.get_item.return_value = {
+            'pk': 'USER#user123',
+            'sk': 'JOB#job123',
+            'status': 'queued',
+            'created_at': 1234567890
+        }
+        
+        with patch('time.time', return_value=1234567900):
+            result = repo.update_job_status('user123', 'job123', 'processing')
+        
+        job_op, old_index_op, new_index_op = captured['transact_write'][-1]
+        assert old_index_op == {'Delete': {'Key': {'pk': 'JOBSTATUS#queued', 'sk': '1234567890'}}}
+        assert new_index_op['Put']['Item']['sk'] == '1234567890#job123'
+        assert '1234567890#job123' in job_op['Update']['ExpressionAttributeValues'].values()
+        assert result['status_sk'] == '1234567890#job123'
+    
+    def test_update_job_status_active_index_does_not_expire(self, repo, mock_db_client, captured):
+        """Test only finished jobs' status index entries get a TTL"""
+        mock_db_client.get_item.return_value = {
+            'pk': 'USER#user123',
+            'sk': 'JOB#job123',
+            'status': 'queued',
+            'created_at': 1234567890
+        }
+        
+        repo.update_job_status('user123', 'job123', 'processing')
+        
+        new_index = captured['transact_write'][-1][2]['Put']['Item']
+        assert new_index['pk'] == 'JOBSTATUS#processing'
+        assert 'expires_at' not in new_index
+    
+    def test_update_job_status_same_status_skips_index(self, repo, mock_db_client, captured):
+        """Test re-setting the same status only updates the job item"""
+        mock_db_client.get_item.return_value = {
+            'pk': 'USER#user123',
+            'sk': 'JOB#job123',
+            'status': 'processing',
+            'created_at': 1234567890
+        }
+        
+        repo.update_job_status('user123', 'job123', 'processing')
+        
+        operations = captured['transact_write'][-1]
+        assert len(operations) == 1
+        assert 'Update' in operations[0]
+    
+    def test_update_job_status_not_found(self, repo, mock_db_client):
+        """Test updating non-existent job raises error"""
+        mock_db_client.get_item.return_value = None
+        
+        with pytest.raises(ValueError) as exc_info:
+            repo.update_job_status('user123', 'job123', 'completed')
+        
+        assert 'Job job123 not found' in str(exc_info.value)
+
+
+class TestSubscriptionRepository:
+    """Test cases for SubscriptionRepository"""
+    
+    @pytest.fixture
+    def mock_db_client(self):
+        """Mock DynamoDBClient"""
+        return Mock(spec=DynamoDBClient)
+    
+    @pytest.fixture
+    def repo(self, mock_db_client):
+        """Create SubscriptionRepository with mocked client"""
+        repo = SubscriptionRepository()
+        repo.db = mock_db_client
+        return repo
+    
+    def test_create_subscription(self, repo, mock_db_client, captured):
+        """Test creating a new subscription"""
+        with patch('time.time', return_value=1234567890):
+            result = repo.create_subscription(
+                'user123',
+                'sub_stripe123',
+                'pro',
+                'active',
+                1234567890
+            )
+        
+        # Should create subscription and Stripe index in one batch
+        mock_db_client.batch_put.assert_called_once()
+        items = captured['batch_put'][-1]
+        assert len(items) == 2
+        
+        # Check subscription item
+        sub_call = items[0]
+        assert sub_call['pk'] == 'USER#user123'
+        assert sub_call['sk'] == 'SUB#sub_stripe123'
+        assert sub_call['plan_id'] == 'pro'
+        assert sub_call['status'] == 'active'
+        assert sub_call['status_pk'] == 'USER#user123#STATUS#active'
+        
+        # Inactive subscriptions stay out of the sparse status index
+        repo.create_subscription('user123', 'sub_old', 'pro', 'canceled', 1234567890)
+        assert 'status_pk' not in captured['batch_put'][-1][0]
+        
+        # Check Stripe index
+        index_call = items[1]
+        assert index_call['pk'] == 'SUB#sub_stripe123'
+        assert index_call['sk'] == 'USER#user123'
+    
+    def test_create_subscription_with_user_updates(self, repo, mock_db_client, captured):
+        """Test subscription creation and user quota update share one transaction"""
+        with patch('time.time', return_value=1234567890):
+            repo.create_subscription(
+                'user123',
+                'sub_stripe123',
+                'pro',
+                'active',
+                1234567890,
+                user_updates={'quota_limit': 500, 'subscription_plan': 'pro'}
+            )
+        
+        mock_db_client.batch_put.assert_not_called()
+        mock_db_client.transact_write.assert_called_once()
+        sub_op, index_op, user_op = captured['transact_write'][-1]
+        assert sub_op['Put']['Item']['sk'] == 'SUB#sub_stripe123'
+        assert index_op['Put']['Item']['pk'] == 'SUB#sub_stripe123'
+        assert user_op['Update']['Key'] == {'pk': 'USER#user123', 'sk': 'PROFILE'}
+        assert user_op['Update']['ConditionExpression'] == 'attribute_exists(pk)'
+        assert set(user_op['Update']['ExpressionAttributeValues'].values()) == {500, 'pro'}
+    
+    def test_get_subscription(self, repo, mock_db_client):
+        """Test getting subscription by ID"""
+        mock_db_client.get_item.return_value = {'subscription_id': 'sub123'}
+        
+        result = repo.get_subscription('user123', 'sub123')
+        
+        mock_db_client.get_item.assert_called_with('USER#user123', 'SUB#sub123')
+        assert result == {'subscription_id': 'sub123'}
+    
+    def test_get_user_subscriptions(self, repo, mock_db_client):
+        """Test getting all subscriptions for a user"""
+        mock_db_client.iter_query.return_value = iter([
+            {'subscription_id': 'sub1', 'status': 'active'},
+            {'subscription_id': 'sub2', 'status': 'canceled'},
+            {'sk': 'SUB#sub3'}  # Item without subscription_id
+        ])
+        
+        result = repo.get_user_subscriptions('user123')
+        
+        mock_db_client.iter_query.assert_called_once_with('USER#user123', sk_prefix='SUB#')
+        assert len(result) == 2
+        assert all('subscription_id' in sub for sub in result)
+    
+    def test_get_active_subscription(self, repo, mock_db_client):
+        """Test getting the active subscription for a user"""
+        mock_db_client.query_gsi.return_value = (
+            [{'subscription_id': 'sub2', 'status': 'active'}],
+            None
+        )
+        
+        result = repo.get_active_subscription('user123')
+        
+        # Only active rows are read, via the status-keyed index
+        mock_db_client.query_gsi.assert_called_once_with(
+            'subsByStatus',
+            'USER#user123#STATUS#active',
+            limit=1,
+            pk_attr='status_pk'
+        )
+        mock_db_client.query_items.assert_not_called()
+        mock_db_client.iter_query.assert_not_called()
+        assert result['subscription_id'] == 'sub2'
+        assert result['status'] == 'active'
+    
+    def test_get_active_subscription_none_active(self, repo, mock_db_client):
+        """Test getting active subscription when none are active"""
+        mock_db_client.query_gsi.return_value = ([], None)
+        mock_db_client.iter_query.return_value = iter([{'subscription_id': 'sub1', 'status': 'canceled'}])
+        
+        result = repo.get_active_subscription('user123')
+        
+        assert result is None
+        mock_db_client.update_fields.assert_not_called()
+    
+    def test_get_active_subscription_indexes_unindexed_active(self, repo, mock_db_client):
+        """Test an active subscription written before status_pk existed is found and indexed"""
+        legacy = {'pk': 'USER#user123', 'sk': 'SUB#sub1', 'subscription_id': 'sub1', 'status': 'active'}
+        mock_db_client.query_gsi.return_value = ([], None)
+        mock_db_client.iter_query.return_value = iter([legacy])
+        mock_db_client.update_fields.return_value = {**legacy, 'status_pk': 'USER#user123#STATUS#active'}
+        
+        result = repo.get_active_subscription('user123')
+        
+        mock_db_client.iter_query.assert_called_once_with('USER#user123', sk_prefix='SUB#')
+        mock_db_client.update_fields.assert_called_once_with(
+            'USER#user123', 'SUB#sub1', {'status_pk': 'USER#user123#STATUS#active'}
+        )
+        assert result['subscription_id'] == 'sub1'
+        assert result['status_pk'] == 'USER#user123#STATUS#active'
+    
+    def test_update_subscription(self, repo, mock_db_client):
+        """Test updating subscription"""
+        mock_db_client.update_fields.return_value = {
+            'pk': 'USER#user123',
+            'sk': 'SUB#sub123',
+            'subscription_id': 'sub123',
+            'status': 'canceled',
+            'plan_id': 'pro',
+            'updated_at': 1234567900
+        }
+        
+        with patch('time.time', return_value=1234567900):
+            result = repo.update_subscription(
+                'user123',
+                'sub123',
+                {'status': 'canceled', 'plan_id': 'pro'}
+            )
+        
+        mock_db_client.update_fields.assert_called_once_with(
+            'USER#user123',
+            'SUB#sub123',
+            {
+                'status': 'canceled',
+                'plan_id': 'pro',
+                'updated_at': 1234567900
+            },
+            remove=['status_pk']
+        )
+        mock_db_client.put_item.assert_not_called()
+        assert result['status'] == 'canceled'
+    
+    def test_update_subscription_not_found(self, repo, mock_db_client):
+        """Test updating non-existent subscription raises error"""
+        mock_db_client.update_fields.return_value = None
+        
+        with pytest.raises(ValueError) as exc_info:
+            repo.update_subscription('user123', 'sub123', {'status': 'canceled'})
+        
+        assert 'Subscription sub123 not found' in str(exc_info.value)
+    
+    def test_update_subscription_with_user_updates(self, repo, mock_db_client, captured):
+        """Test subscription and user updates share one transaction, returning the full item"""
+        mock_db_client.transact_write.return_value = True
+        mock_db_client.get_item.return_value = {
+            'pk': 'USER#user123',
+            'sk': 'SUB#sub123',
+            'subscription_id': 'sub123',
+            'plan_id': 'pro',
+            'status': 'canceled',
+            'updated_at': 1234567900
+        }
+        
+        with patch('time.time', return_value=1234567900):
+            result = repo.update_subscription(
+                'user123',
+                'sub123',
+                {'status': 'canceled'},
+                user_updates={'quota_limit': 0, 'subscription_plan': None}
+            )
+        
+        mock_db_client.update_fields.assert_not_called()
+        sub_op, user_op = captured['transact_write'][-1]
+        assert sub_op['Update']['Key'] == {'pk': 'USER#user123', 'sk': 'SUB#sub123'}
+        assert sub_op['Update']['ConditionExpression'] == 'attribute_exists(pk)'
+        assert user_op['Update']['Key'] == {'pk': 'USER#user123', 'sk': 'PROFILE'}
+        assert sub_op['Update']['UpdateExpression'] == 'SET #f0 = :v0, #f1 = :v1 REMOVE #r0'
+        assert sub_op['Update']['ExpressionAttributeNames']['#r0'] == 'status_pk'
+        assert mock_db_client.transact_write.call_args[1] == {'ignore_condition_failure': True}
+        mock_db_client.get_item.assert_called_once_with('USER#user123', 'SUB#sub123', consistent=True)
+        assert result['status'] == 'canceled'
+        assert result['plan_id'] == 'pro'
+        assert 'status_pk' not in result
+        assert result['updated_at'] == 1234567900
+    
+    @pytest.mark.parametrize('stored,message', [
+        (None, 'Subscription sub123 not found'),
+        ({'pk': 'USER#user123', 'sk': 'SUB#sub123'}, 'User user123 not found')
+    ], ids=['missing_subscription', 'missing_user'])
+    def test_update_subscription_with_user_updates_not_found(self, repo, mock_db_client, stored, message):
+        """Test a failed transaction condition raises the same ValueError as a plain update"""
+        mock_db_client.transact_write.return_value = False
+        mock_db_client.get_item.return_value = stored
+        
+        with pytest.raises(ValueError) as exc_info:
+            repo.update_subscription('user123', 'sub123', {'status': 'canceled'}, user_updates={'quota_limit': 0})
+        
+        assert message in str(exc_info.value)
+    
+    def test_update_subscription_reactivation_indexes_status(self, repo, mock_db_client):
+        """Test a subscription returning to active is written back into the status index"""
+        with patch('time.time', return_value=1234567900):
+            repo.update_subscription('user123', 'sub123', {'status': 'active'})
+        
+        mock_db_client.update_fields.assert_called_once_with(
+            'USER#user123',
+            'SUB#sub123',
+            {'status': 'active', 'updated_at': 1234567900, 'status_pk': 'USER#user123#STATUS#active'},
+            remove=None
+        )
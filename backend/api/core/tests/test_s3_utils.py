@@ -2,44 +2,102 @@
 Test cases for S3 utilities and CloudFront signed URLs
 """
 
+import copy
+import io
 import pytest
 import uuid
 import json
 import base64
 from datetime import datetime, timedelta
+from types import SimpleNamespace
 from unittest.mock import Mock, patch, MagicMock
+from boto3.exceptions import S3UploadFailedError
 from botocore.exceptions import ClientError
 
-from api.core.s3_utils import S3Client, CloudFrontSigner, ImageStorage
+from api.core.s3_utils import (
+    S3Client, CloudFrontSigner, ImageStorage, MULTIPART_THRESHOLD, COPY_MULTIPART_THRESHOLD,
+    _load_private_key
+)
+
+# Settings every S3 test runs with; tests override single values with monkeypatch
+_DEFAULT_S3_SETTINGS = {
+    'AWS_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'test-key',
+    'AWS_SECRET_ACCESS_KEY': 'test-secret',
+    'AWS_S3_BUCKET_NAME': 'test-bucket',
+    'S3_MULTIPART_THRESHOLD': MULTIPART_THRESHOLD,
+    'CLOUDFRONT_DOMAIN': 'cdn.example.com',
+    'CLOUDFRONT_KEY_PAIR_ID': 'KEYPAIRID123',
+    'CLOUDFRONT_PRIVATE_KEY': 'fake-private-key',
+    'SIGNED_URL_TTL': 3600
+}
+
+# Frozen clock for signed URL tests, and the expiry a 600 second URL gets at that moment
+_BASE_TIME = datetime(2023, 1, 1, 0, 0, 0)
+_EXPECTED_EXPIRE_TIME = int((_BASE_TIME + timedelta(seconds=600)).timestamp())
+
+
+def freeze_utcnow(monkeypatch, moment: datetime):
+    """Pin s3_utils' datetime.utcnow() to a fixed moment, leaving the rest of the class real"""
+    class FrozenDateTime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return moment
+    
+    monkeypatch.setattr('api.core.s3_utils.datetime', FrozenDateTime)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def s3_settings():
+    """Install test settings on s3_utils once for the module; tests override with monkeypatch"""
+    test_settings = SimpleNamespace(**_DEFAULT_S3_SETTINGS)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr('api.core.s3_utils.settings', test_settings)
+        yield test_settings
+
+
+@pytest.fixture(scope="module")
+def mock_boto_client():
+    """Mock boto3 S3 client, shared by the module and reset before each test"""
+    return Mock()
+
+
+@pytest.fixture(scope="module")
+def client(mock_boto_client):
+    """Create S3Client instance with mocked boto client, once per module"""
+    with patch('api.core.s3_utils._get_s3_client', return_value=mock_boto_client):
+        client = S3Client()
+        client.s3 = mock_boto_client
+        return client
 
 
 class TestS3Client:
     """Test cases for S3Client class"""
     
-    @pytest.fixture
-    def mock_boto_client(self):
-        """Mock boto3 S3 client"""
-        return Mock()
-    
-    @pytest.fixture
-    def client(self, mock_boto_client):
-        """Create S3Client instance with mocked boto client"""
-        with patch('api.core.s3_utils.boto3.client', return_value=mock_boto_client), \
-             patch('api.core.s3_utils.settings') as mock_settings:
-            mock_settings.AWS_REGION = 'us-east-1'
-            mock_settings.AWS_ACCESS_KEY_ID = 'test-key'
-            mock_settings.AWS_SECRET_ACCESS_KEY = 'test-secret'
-            mock_settings.AWS_S3_BUCKET_NAME = 'test-bucket'
-            
-            client = S3Client()
-            client.s3 = mock_boto_client
-            return client
+    @pytest.fixture(autouse=True)
+    def reset_boto_client(self, mock_boto_client):
+        """Clear calls, return values and side effects left by the previous test"""
+        mock_boto_client.reset_mock(return_value=True, side_effect=True)
     
     def test_init_sets_attributes(self, client):
         """Test client initialization"""
         assert client.bucket_name == 'test-bucket'
         assert client.s3 is not None
     
+    def test_clients_share_pooled_boto_client(self, monkeypatch):
+        """Test the boto3 client is created once with keep-alive pooling"""
+        monkeypatch.setattr('api.core.s3_utils._s3_client', None)
+        
+        with patch('api.core.s3_utils.boto3.client') as mock_boto3_client:
+            first = S3Client()
+            second = S3Client()
+        
+        mock_boto3_client.assert_called_once()
+        config = mock_boto3_client.call_args[1]['config']
+        assert config.tcp_keepalive is True
+        assert config.retries['mode'] == 'adaptive'
+        assert first.s3 is second.s3
+    
     def test_generate_image_key(self, client):
         """Test generating S3 key for images"""
         key = client.generate_image_key('user123', 'image456')
@@ -79,17 +137,89 @@ class TestS3Client:
         call_args = mock_boto_client.put_object.call_args[1]
         assert call_args['ContentType'] == 'image/jpeg'
     
-    def test_upload_image_error(self, client, mock_boto_client):
-        """Test handling upload errors"""
-        mock_boto_client.put_object.side_effect = ClientError(
-            {'Error': {'Message': 'Access Denied'}},
-            'PutObject'
-        )
+    def test_upload_large_image_uses_multipart_transfer(self, client, mock_boto_client):
+        """Test images above the multipart threshold go through upload_fileobj"""
+        image_data = b'x' * MULTIPART_THRESHOLD
+        
+        result = client.upload_image(image_data, 'user123', 'image456')
+        
+        mock_boto_client.put_object.assert_not_called()
+        mock_boto_client.upload_fileobj.assert_called_once()
+        call_args = mock_boto_client.upload_fileobj.call_args
+        fileobj, bucket, key = call_args[0]
+        assert fileobj.read() == image_data
+        assert (bucket, key) == ('test-bucket', 'images/user123/image456.png')
+        assert call_args[1]['ExtraArgs']['ContentType'] == 'image/png'
+        assert call_args[1]['Config'] is client.transfer_config
+        assert result == 's3://test-bucket/images/user123/image456.png'
+    
+    def test_multipart_threshold_from_settings(self, mock_boto_client, monkeypatch):
+        """Test the multipart threshold can be tuned through settings"""
+        monkeypatch.setattr('api.core.s3_utils.settings.S3_MULTIPART_THRESHOLD', 1024)
+        with patch('api.core.s3_utils._get_s3_client', return_value=mock_boto_client):
+            client = S3Client()
+        
+        client.upload_image(b'x' * 1024, 'user123', 'image456')
+        
+        assert client.transfer_config.multipart_threshold == 1024
+        mock_boto_client.upload_fileobj.assert_called_once()
+        mock_boto_client.put_object.assert_not_called()
+    
+    def test_upload_image_streams_file_objects(self, client, mock_boto_client):
+        """Test file-like sources are passed through without reading them into memory"""
+        small = io.BytesIO(b'fake-image-data')
+        large = io.BytesIO(b'x' * MULTIPART_THRESHOLD)
+        
+        client.upload_image(small, 'user123', 'image456')
+        client.upload_image(large, 'user123', 'image789')
+        
+        assert mock_boto_client.put_object.call_args[1]['Body'] is small
+        assert mock_boto_client.upload_fileobj.call_args[0][0] is large
+        assert large.tell() == 0
+    
+    def test_upload_image_unsized_stream_uses_multipart_transfer(self, client, mock_boto_client):
+        """Test streams whose size cannot be measured go through upload_fileobj"""
+        stream = Mock(spec=['read'])
+        
+        client.upload_image(stream, 'user123', 'image456')
+        
+        mock_boto_client.put_object.assert_not_called()
+        assert mock_boto_client.upload_fileobj.call_args[0][0] is stream
+    
+    def test_upload_image_accepts_memoryview(self, client, mock_boto_client):
+        """Test memoryview sources are uploaded through a reader over the same buffer, not a copy"""
+        data = bytearray(b'fake-image-data')
+        client.upload_image(memoryview(data)[5:], 'user123', 'image456')
+        
+        body = mock_boto_client.put_object.call_args[1]['Body']
+        assert body._view.obj is data
+        assert body.read() == b'image-data'
+        body.seek(0)
+        assert body.read(5) == b'image'
+    
+    @pytest.mark.parametrize('boto_method,error,call,expected', [
+        ('put_object', ClientError({'Error': {'Message': 'Access Denied'}}, 'PutObject'),
+         lambda client: client.upload_image(b'data', 'user123', 'image456'),
+         'Error uploading image to S3: Access Denied'),
+        ('upload_fileobj', S3UploadFailedError('Access Denied'),
+         lambda client: client.upload_image(b'x' * MULTIPART_THRESHOLD, 'user123', 'image456'),
+         'Error uploading image to S3: Access Denied'),
+        ('delete_object', ClientError({'Error': {'Message': 'NoSuchKey'}}, 'DeleteObject'),
+         lambda client: client.delete_image('user123', 'image456'),
+         'Error deleting image from S3: NoSuchKey'),
+        ('copy_object', ClientError({'Error': {'Message': 'NoSuchKey'}}, 'CopyObject'),
+         lambda client: client.copy_image('user123', 'image456', 'user789', 'image999'),
+         'Error copying image in S3: NoSuchKey')
+    ], ids=['upload', 'upload_multipart', 'delete', 'copy'])
+    def test_operation_errors(self, client, mock_boto_client, boto_method, error, call, expected):
+        """Test S3 failures surface as errors naming the operation"""
+        mock_boto_client.head_object.return_value = {'ContentLength': 1024}
+        getattr(mock_boto_client, boto_method).side_effect = error
         
         with pytest.raises(Exception) as exc_info:
-            client.upload_image(b'data', 'user123', 'image456')
+            call(client)
         
-        assert 'Error uploading image to S3: Access Denied' in str(exc_info.value)
+        assert expected in str(exc_info.value)
     
     def test_get_presigned_upload_url_success(self, client, mock_boto_client):
         """Test generating presigned upload URL"""
@@ -150,20 +280,10 @@ class TestS3Client:
         
         assert result is True
     
-    def test_delete_image_error(self, client, mock_boto_client):
-        """Test handling deletion errors"""
-        mock_boto_client.delete_object.side_effect = ClientError(
-            {'Error': {'Message': 'NoSuchKey'}},
-            'DeleteObject'
-        )
-        
-        with pytest.raises(Exception) as exc_info:
-            client.delete_image('user123', 'image456')
-        
-        assert 'Error deleting image from S3: NoSuchKey' in str(exc_info.value)
-    
     def test_copy_image_success(self, client, mock_boto_client):
         """Test successful image copy"""
+        mock_boto_client.head_object.return_value = {'ContentLength': 1024, 'ContentType': 'image/jpeg'}
+        
         result = client.copy_image('user123', 'image456', 'user789', 'image999')
         
         mock_boto_client.copy_object.assert_called_once_with(
@@ -171,6 +291,8 @@ class TestS3Client:
             CopySource={'Bucket': 'test-bucket', 'Key': 'images/user123/image456.png'},
             Key='images/user789/image999.png',
             MetadataDirective='REPLACE',
+            ContentType='image/jpeg',
+            CacheControl='max-age=31536000',
             Metadata={
                 'user_id': 'user789',
                 'image_id': 'image999'
@@ -179,17 +301,26 @@ class TestS3Client:
         
         assert result == 's3://test-bucket/images/user789/image999.png'
     
-    def test_copy_image_error(self, client, mock_boto_client):
-        """Test handling copy errors"""
-        mock_boto_client.copy_object.side_effect = ClientError(
-            {'Error': {'Message': 'NoSuchKey'}},
-            'CopyObject'
-        )
+    def test_copy_large_image_uses_multipart_copy(self, client, mock_boto_client):
+        """Test large images are copied with the managed multipart copy"""
+        mock_boto_client.head_object.return_value = {'ContentLength': COPY_MULTIPART_THRESHOLD}
         
-        with pytest.raises(Exception) as exc_info:
-            client.copy_image('user123', 'image456', 'user789', 'image999')
+        result = client.copy_image('user123', 'image456', 'user789', 'image999')
         
-        assert 'Error copying image in S3: NoSuchKey' in str(exc_info.value)
+        mock_boto_client.copy_object.assert_not_called()
+        mock_boto_client.copy.assert_called_once_with(
+            {'Bucket': 'test-bucket', 'Key': 'images/user123/image456.png'},
+            'test-bucket',
+            'images/user789/image999.png',
+            ExtraArgs={
+                'MetadataDirective': 'REPLACE',
+                'ContentType': 'image/png',
+                'CacheControl': 'max-age=31536000',
+                'Metadata': {'user_id': 'user789', 'image_id': 'image999'}
+            },
+            Config=client.copy_config
+        )
+        assert result == 's3://test-bucket/images/user789/image999.png'
 
 
 class TestCloudFrontSigner:
@@ -202,19 +333,22 @@ class TestCloudFrontSigner:
         key.sign.return_value = b'fake-signature'
         return key
     
+    @pytest.fixture(scope="module")
+    def signer_template(self, s3_settings):
+        """Build a CloudFrontSigner once per module; tests get copies with their own key"""
+        _load_private_key.cache_clear()
+        with patch('api.core.s3_utils.serialization.load_pem_private_key', return_value=Mock()):
+            signer = CloudFrontSigner()
+        _load_private_key.cache_clear()
+        return signer
+    
     @pytest.fixture
-    def signer(self, mock_private_key):
+    def signer(self, signer_template, mock_private_key):
         """Create CloudFrontSigner instance"""
-        with patch('api.core.s3_utils.settings') as mock_settings:
-            mock_settings.CLOUDFRONT_DOMAIN = 'cdn.example.com'
-            mock_settings.CLOUDFRONT_KEY_PAIR_ID = 'KEYPAIRID123'
-            mock_settings.CLOUDFRONT_PRIVATE_KEY = 'fake-private-key'
-            mock_settings.AWS_S3_BUCKET_NAME = 'test-bucket'
-            
-            with patch('api.core.s3_utils.serialization.load_pem_private_key', 
-                      return_value=mock_private_key):
-                signer = CloudFrontSigner()
-                return signer
+        CloudFrontSigner._signed_urls.clear()
+        signer = copy.copy(signer_template)
+        signer.private_key = mock_private_key
+        return signer
     
     def test_init_loads_private_key(self, signer):
         """Test signer initialization loads private key"""
@@ -222,15 +356,23 @@ class TestCloudFrontSigner:
         assert signer.key_pair_id == 'KEYPAIRID123'
         assert signer.private_key is not None
     
-    def test_init_without_private_key(self):
+    def test_private_key_parsed_once_per_process(self):
+        """Test signers configured with the same PEM share one parsed key"""
+        _load_private_key.cache_clear()
+        with patch('api.core.s3_utils.serialization.load_pem_private_key') as mock_load:
+            first = CloudFrontSigner()
+            second = CloudFrontSigner()
+        _load_private_key.cache_clear()
+        
+        mock_load.assert_called_once()
+        assert first.private_key is second.private_key
+    
+    def test_init_without_private_key(self, monkeypatch):
         """Test signer initialization without private key"""
-        with patch('api.core.s3_utils.settings') as mock_settings:
-            mock_settings.CLOUDFRONT_DOMAIN = 'cdn.example.com'
-            mock_settings.CLOUDFRONT_KEY_PAIR_ID = 'KEYPAIRID123'
-            mock_settings.CLOUDFRONT_PRIVATE_KEY = None
-            
-            signer = CloudFrontSigner()
-            assert signer.private_key is None
+        monkeypatch.setattr('api.core.s3_utils.settings.CLOUDFRONT_PRIVATE_KEY', None)
+        
+        signer = CloudFrontSigner()
+        assert signer.private_key is None
     
     def test_create_policy(self, signer):
         """Test creating CloudFront policy"""
@@ -246,17 +388,21 @@ class TestCloudFrontSigner:
         assert statement['Condition']['DateLessThan']['AWS:EpochTime'] == expire_time
         
         # Verify no whitespace
-        assert ' ' not in policy
+        assert b' ' not in policy
+        
+        # Matches the compact JSON encoding CloudFront signs against
+        assert policy == json.dumps(policy_dict, separators=(',', ':')).encode('utf-8')
     
     def test_sign_policy(self, signer, mock_private_key):
         """Test signing policy"""
-        policy = '{"test":"policy"}'
+        policy = b'{"test":"policy"}'
         
-        # Mock base64 encoding
-        with patch('base64.b64encode', return_value=b'encoded+signature=with/chars'):
-            result = signer._sign_policy(policy)
+        # Standard base64 of these bytes is '+/8=', covering every character CloudFront swaps
+        mock_private_key.sign.return_value = b'\xfb\xff'
+        result = signer._sign_policy(policy)
         
         mock_private_key.sign.assert_called_once()
+        assert mock_private_key.sign.call_args[0][0] == policy
         
         # Verify URL-safe encoding
         assert '+' not in result
@@ -265,75 +411,130 @@ class TestCloudFrontSigner:
         assert '-' in result  # + becomes -
         assert '_' in result  # = becomes _
         assert '~' in result  # / becomes ~
+        assert result == '-~8_'
     
-    def test_sign_policy_no_private_key(self):
+    def test_sign_policy_uses_cloudfront_alphabet(self, signer, mock_private_key):
+        """Test the signature is standard base64 with CloudFront's character swaps"""
+        mock_private_key.sign.return_value = b'\xfb\xff\xbf\xfe'
+        
+        result = signer._sign_policy(b'{"test":"policy"}')
+        
+        # Standard base64 of these bytes is '+/+//g=='
+        assert result == '-~-~~g__'
+    
+    def test_sign_policy_no_private_key(self, monkeypatch):
         """Test signing policy without private key raises error"""
-        with patch('api.core.s3_utils.settings') as mock_settings:
-            mock_settings.CLOUDFRONT_PRIVATE_KEY = None
-            signer = CloudFrontSigner()
-            
-            with pytest.raises(ValueError) as exc_info:
-                signer._sign_policy('policy')
-            
-            assert 'CloudFront private key not configured' in str(exc_info.value)
-    
-    def test_generate_signed_url_with_cloudfront(self, signer):
-        """Test generating signed CloudFront URL"""
+        monkeypatch.setattr('api.core.s3_utils.settings.CLOUDFRONT_PRIVATE_KEY', None)
+        signer = CloudFrontSigner()
+        
+        with pytest.raises(ValueError) as exc_info:
+            signer._sign_policy(b'policy')
+        
+        assert 'CloudFront private key not configured' in str(exc_info.value)
+    
+    @pytest.mark.parametrize('domain,signed,expected_prefix', [
+        ('cdn.example.com', True, 'https://cdn.example.com/images/user123/image456.png'),
+        ('cdn.example.com', False, 'https://cdn.example.com/images/user123/image456.png'),
+        (None, False, 'https://test-bucket.s3.amazonaws.com/images/user123/image456.png')
+    ], ids=['signed', 'no_private_key', 'no_cloudfront_domain'])
+    def test_generate_signed_url(self, monkeypatch, mock_private_key, domain, signed, expected_prefix):
+        """Test URLs are signed through CloudFront, left unsigned without a key, or fall back to S3"""
+        CloudFrontSigner._signed_urls.clear()
+        monkeypatch.setattr('api.core.s3_utils.settings.CLOUDFRONT_DOMAIN', domain)
+        monkeypatch.setattr('api.core.s3_utils.settings.CLOUDFRONT_PRIVATE_KEY', None)
+        signer = CloudFrontSigner()
+        signer.private_key = mock_private_key if signed else None
+        
+        freeze_utcnow(monkeypatch, _BASE_TIME)
+        with patch.object(signer, '_sign_policy', return_value='fake-signature'):
+            result = signer.generate_signed_url('s3://test-bucket/images/user123/image456.png',
+                                                expires_in_seconds=600)
+        
+        assert result.startswith(expected_prefix)
+        if signed:
+            assert f'Expires={_EXPECTED_EXPIRE_TIME}' in result
+            assert 'Signature=fake-signature' in result
+            assert 'Key-Pair-Id=KEYPAIRID123' in result
+        else:
+            assert result == expected_prefix
+    
+    @pytest.fixture
+    def unconfigured_cloudfront(self, monkeypatch):
+        """Clear the CloudFront settings"""
+        monkeypatch.setattr('api.core.s3_utils.settings.CLOUDFRONT_DOMAIN', None)
+        monkeypatch.setattr('api.core.s3_utils.settings.CLOUDFRONT_KEY_PAIR_ID', None)
+        monkeypatch.setattr('api.core.s3_utils.settings.CLOUDFRONT_PRIVATE_KEY', None)
+    
+    def test_generate_signed_url_no_cloudfront_domain_other_bucket(self, unconfigured_cloudfront):
+        """Test S3 URLs from another bucket map to that bucket's HTTPS URL"""
+        signer = CloudFrontSigner()
+        
+        result = signer.generate_signed_url('s3://legacy-bucket/images/test.png')
+        
+        assert result == 'https://legacy-bucket.s3.amazonaws.com/images/test.png'
+    
+    def test_generate_signed_urls_signs_each_url(self, signer, mock_private_key):
+        """Test batch signing returns one signed URL per input, in order"""
+        s3_urls = [f's3://test-bucket/images/user123/image{i}.png' for i in range(5)]
+        
+        results = signer.generate_signed_urls(s3_urls, expires_in_seconds=600)
+        
+        assert mock_private_key.sign.call_count == 5
+        assert len(results) == 5
+        for i, result in enumerate(results):
+            assert result.startswith(f'https://cdn.example.com/images/user123/image{i}.png?Expires=')
+            assert 'Key-Pair-Id=KEYPAIRID123' in result
+        
+        # The whole batch shares one expiry
+        assert len({result.split('Expires=')[1].split('&')[0] for result in results}) == 1
+    
+    def test_generate_signed_url_reuses_cached_signature(self, signer, mock_private_key):
+        """Test repeat requests within an expiry bucket skip the RSA sign"""
         s3_url = 's3://test-bucket/images/user123/image456.png'
         
-        # Calculate expected expire time (base time + 600 seconds)
-        base_time = datetime(2023, 1, 1, 0, 0, 0)
-        expected_expire_time = int((base_time + timedelta(seconds=600)).timestamp())
-        
-        with patch('api.core.s3_utils.settings') as mock_settings:
-            # Mock settings for URL generation
-            mock_settings.AWS_S3_BUCKET_NAME = 'test-bucket'
-            
-            with patch('api.core.s3_utils.datetime') as mock_datetime:
-                # Import the real datetime module classes
-                from datetime import datetime as real_datetime, timedelta as real_timedelta
-                # Set datetime to be the real class but with mocked utcnow
-                mock_datetime.utcnow.return_value = base_time
-                mock_datetime.side_effect = lambda *args, **kwargs: real_datetime(*args, **kwargs)
-                
-                with patch.object(signer, '_sign_policy', return_value='fake-signature'):
-                    result = signer.generate_signed_url(s3_url, expires_in_seconds=600)
-        
-        # Should convert to CloudFront URL and add signature
-        assert result.startswith('https://cdn.example.com/images/user123/image456.png')
-        assert f'Expires={expected_expire_time}' in result
-        assert 'Signature=fake-signature' in result
-        assert 'Key-Pair-Id=KEYPAIRID123' in result
-    
-    def test_generate_signed_url_no_cloudfront_domain(self):
-        """Test generating URL when CloudFront not configured"""
-        with patch('api.core.s3_utils.settings') as mock_settings:
-            mock_settings.CLOUDFRONT_DOMAIN = None
-            mock_settings.CLOUDFRONT_KEY_PAIR_ID = None
-            mock_settings.CLOUDFRONT_PRIVATE_KEY = None
-            mock_settings.AWS_S3_BUCKET_NAME = 'test-bucket'
-            
-            signer = CloudFrontSigner()
-            s3_url = 's3://test-bucket/images/test.png'
-            
-            result = signer.generate_signed_url(s3_url)
-            
-            # Should return S3 HTTPS URL
-            assert result == 'https://test-bucket.s3.amazonaws.com/images/test.png'
-    
-    def test_generate_signed_url_no_private_key(self, signer):
-        """Test generating unsigned CloudFront URL when key not configured"""
+        first = signer.generate_signed_url(s3_url)
+        second = signer.generate_signed_url(s3_url)
+        batch = signer.generate_signed_urls([s3_url, s3_url])
+        
+        mock_private_key.sign.assert_called_once()
+        assert first == second
+        assert batch == [first, first]
+    
+    def test_cached_signatures_expire_with_half_the_signing_ttl(self, signer, mock_private_key):
+        """Test a short signing TTL keeps cached URLs only for its own half-TTL bucket"""
+        s3_url = 's3://test-bucket/images/user123/image456.png'
+        
+        with patch('api.core.cache.time.monotonic', return_value=100), \
+             patch.object(signer, '_expire_time', return_value=1_700_000_000):
+            signer.generate_signed_url(s3_url, expires_in_seconds=60)
+        with patch('api.core.cache.time.monotonic', return_value=129), \
+             patch.object(signer, '_expire_time', return_value=1_700_000_000):
+            signer.generate_signed_url(s3_url, expires_in_seconds=60)
+        assert mock_private_key.sign.call_count == 1
+        
+        with patch('api.core.cache.time.monotonic', return_value=131), \
+             patch.object(signer, '_expire_time', return_value=1_700_000_000):
+            signer.generate_signed_url(s3_url, expires_in_seconds=60)
+        assert mock_private_key.sign.call_count == 2
+    
+    def test_expire_time_rounds_to_half_ttl_bucket(self, signer, monkeypatch):
+        """Test expiries align to half-TTL buckets"""
+        base_time = datetime(2023, 1, 1, 0, 4, 59)
+        
+        freeze_utcnow(monkeypatch, base_time)
+        expire_time = signer._expire_time(600)
+        
+        latest = int((base_time + timedelta(seconds=600)).timestamp())
+        assert expire_time % 300 == 0
+        assert latest - 300 < expire_time <= latest
+    
+    def test_generate_signed_urls_without_private_key(self, signer):
+        """Test batch generation falls back to unsigned CloudFront URLs"""
         signer.private_key = None
-        s3_url = 's3://test-bucket/images/test.png'
         
-        with patch('api.core.s3_utils.settings') as mock_settings:
-            mock_settings.AWS_S3_BUCKET_NAME = 'test-bucket'
-            
-            result = signer.generate_signed_url(s3_url)
+        results = signer.generate_signed_urls(['s3://test-bucket/a.png', 's3://test-bucket/b.png'])
         
-        # Should return unsigned CloudFront URL
-        assert result == 'https://cdn.example.com/images/test.png'
-        assert 'Signature' not in result
+        assert results == ['https://cdn.example.com/a.png', 'https://cdn.example.com/b.png']
 
 
 class TestImageStorage:
@@ -341,31 +542,44 @@ class TestImageStorage:
     
     @pytest.fixture
     def mock_s3_client(self):
-        """Mock S3Client"""
-        return Mock(spec=S3Client)
+        """Stub S3Client exposing only the methods ImageStorage calls"""
+        return SimpleNamespace(
+            upload_image=Mock(),
+            get_presigned_upload_url=Mock(),
+            delete_image=Mock(),
+            copy_image=Mock()
+        )
     
     @pytest.fixture
     def mock_cloudfront_signer(self):
-        """Mock CloudFrontSigner"""
-        return Mock(spec=CloudFrontSigner)
+        """Stub CloudFrontSigner exposing only the methods ImageStorage calls"""
+        return SimpleNamespace(generate_signed_url=Mock(), generate_signed_urls=Mock())
+    
+    def test_mocks_reject_unknown_attributes(self, mock_s3_client, mock_cloudfront_signer):
+        """Test the stubs fail loudly if ImageStorage calls anything they don't provide"""
+        assert all(callable(getattr(S3Client, name)) for name in vars(mock_s3_client))
+        assert all(callable(getattr(CloudFrontSigner, name)) for name in vars(mock_cloudfront_signer))
+        with pytest.raises(AttributeError):
+            mock_s3_client.not_a_method
+        with pytest.raises(AttributeError):
+            mock_cloudfront_signer.not_a_method
     
     @pytest.fixture
     def storage(self, mock_s3_client, mock_cloudfront_signer):
         """Create ImageStorage instance with mocked dependencies"""
         with patch('api.core.s3_utils.S3Client', return_value=mock_s3_client), \
              patch('api.core.s3_utils.CloudFrontSigner', return_value=mock_cloudfront_signer):
-            storage = ImageStorage()
+            storage = ImageStorage(id_factory=lambda: 'generated-uuid')
             storage.s3 = mock_s3_client
             storage.cloudfront = mock_cloudfront_signer
             return storage
     
     def test_store_image(self, storage, mock_s3_client):
         """Test storing an image"""
-        with patch('api.core.s3_utils.uuid.uuid4', return_value='generated-uuid'):
-            mock_s3_client.upload_image.return_value = 's3://bucket/images/user123/generated-uuid.png'
-            
-            image_data = b'fake-image-data'
-            image_id, s3_url = storage.store_image(image_data, 'user123')
+        mock_s3_client.upload_image.return_value = 's3://bucket/images/user123/generated-uuid.png'
+        
+        image_data = b'fake-image-data'
+        image_id, s3_url = storage.store_image(image_data, 'user123')
         
         assert image_id == 'generated-uuid'
         assert s3_url == 's3://bucket/images/user123/generated-uuid.png'
@@ -377,12 +591,21 @@ class TestImageStorage:
             'image/png'
         )
     
+    def test_default_image_ids_are_uuid_hex(self, mock_s3_client, mock_cloudfront_signer):
+        """Test storage generates random 32-character hex image IDs by default"""
+        with patch('api.core.s3_utils.S3Client', return_value=mock_s3_client), \
+             patch('api.core.s3_utils.CloudFrontSigner', return_value=mock_cloudfront_signer):
+            storage = ImageStorage()
+        
+        first, second = storage.id_factory(), storage.id_factory()
+        assert first != second
+        assert uuid.UUID(hex=first).hex == first
+    
     def test_store_image_with_content_type(self, storage, mock_s3_client):
         """Test storing image with custom content type"""
-        with patch('api.core.s3_utils.uuid.uuid4', return_value='generated-uuid'):
-            mock_s3_client.upload_image.return_value = 's3://bucket/test.jpg'
-            
-            storage.store_image(b'data', 'user123', 'image/jpeg')
+        mock_s3_client.upload_image.return_value = 's3://bucket/test.jpg'
+        
+        storage.store_image(b'data', 'user123', 'image/jpeg')
         
         call_args = mock_s3_client.upload_image.call_args[0]
         assert call_args[3] == 'image/jpeg'
@@ -391,10 +614,7 @@ class TestImageStorage:
         """Test getting signed URL"""
         mock_cloudfront_signer.generate_signed_url.return_value = 'https://cdn.example.com/signed'
         
-        with patch('api.core.s3_utils.settings') as mock_settings:
-            mock_settings.SIGNED_URL_TTL = 3600
-            
-            result = storage.get_signed_url('s3://bucket/test.png')
+        result = storage.get_signed_url('s3://bucket/test.png')
         
         mock_cloudfront_signer.generate_signed_url.assert_called_once_with(
             's3://bucket/test.png',
@@ -413,15 +633,27 @@ class TestImageStorage:
             7200
         )
     
+    def test_get_signed_urls_batch(self, storage, mock_cloudfront_signer):
+        """Test getting signed URLs for several images"""
+        mock_cloudfront_signer.generate_signed_urls.return_value = ['signed-a', 'signed-b']
+        
+        result = storage.get_signed_urls_batch(['s3://bucket/a.png', 's3://bucket/b.png'])
+        
+        mock_cloudfront_signer.generate_signed_urls.assert_called_once_with(
+            ['s3://bucket/a.png', 's3://bucket/b.png'],
+            3600
+        )
+        assert result == ['signed-a', 'signed-b']
+    
     def test_get_upload_url(self, storage, mock_s3_client):
         """Test getting presigned upload URL"""
-        with patch('api.core.s3_utils.uuid.uuid4', return_value='upload-uuid'):
-            mock_s3_client.get_presigned_upload_url.return_value = {
-                'url': 'https://bucket.s3.amazonaws.com',
-                'fields': {'key': 'test'}
-            }
-            
-            result = storage.get_upload_url('user123')
+        storage.id_factory = lambda: 'upload-uuid'
+        mock_s3_client.get_presigned_upload_url.return_value = {
+            'url': 'https://bucket.s3.amazonaws.com',
+            'fields': {'key': 'test'}
+        }
+        
+        result = storage.get_upload_url('user123')
         
         assert result['image_id'] == 'upload-uuid'
         assert result['url'] == 'https://bucket.s3.amazonaws.com'
@@ -443,10 +675,10 @@ class TestImageStorage:
     
     def test_copy_image(self, storage, mock_s3_client):
         """Test copying an image"""
-        with patch('api.core.s3_utils.uuid.uuid4', return_value='new-image-id'):
-            mock_s3_client.copy_image.return_value = 's3://bucket/images/user789/new-image-id.png'
-            
-            dest_id, s3_url = storage.copy_image('user123', 'image456', 'user789')
+        storage.id_factory = lambda: 'new-image-id'
+        mock_s3_client.copy_image.return_value = 's3://bucket/images/user789/new-image-id.png'
+        
+        dest_id, s3_url = storage.copy_image('user123', 'image456', 'user789')
         
         assert dest_id == 'new-image-id'
         assert s3_url == 's3://bucket/images/user789/new-image-id.png'
@@ -4,39 +4,88 @@ Test cases for SQS utilities
 
 import pytest
 import json
+from types import SimpleNamespace
 from unittest.mock import Mock, patch
 from botocore.exceptions import ClientError
 
-from api.core.sqs_utils import SQSClient, JobQueue
+from api.core.sqs_utils import SQSClient, JobQueue, WebhookQueue
+
+# Settings every SQS test runs with; tests pass overrides to apply_settings
+_QUEUE_URL = 'https://sqs.us-east-1.amazonaws.com/123456789012/test-queue'
+_WEBHOOK_QUEUE_URL = 'https://sqs.us-east-1.amazonaws.com/123456789012/webhooks'
+_DEFAULT_SQS_SETTINGS = {
+    'AWS_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'test-key',
+    'AWS_SECRET_ACCESS_KEY': 'test-secret',
+    'AWS_SQS_QUEUE_URL': _QUEUE_URL,
+    'AWS_SQS_WEBHOOK_QUEUE_URL': _WEBHOOK_QUEUE_URL
+}
+
+# Message bodies as SQS delivers them, serialized once at import
+_JOB1_BODY = json.dumps({'job_id': 'job1'})
+_JOB2_BODY = json.dumps({'job_id': 'job2'})
+
+
+def apply_settings(mock_settings, **overrides):
+    """Set the default SQS settings, plus any overrides, on a patched settings object"""
+    for name, value in {**_DEFAULT_SQS_SETTINGS, **overrides}.items():
+        setattr(mock_settings, name, value)
+    return mock_settings
+
+
+@pytest.fixture(scope="module")
+def mock_boto_client():
+    """Mock boto3 SQS client, shared by the module and reset before each test"""
+    return Mock()
+
+
+@pytest.fixture(scope="module")
+def client(mock_boto_client):
+    """Create SQSClient instance with mocked boto client, once per module"""
+    with patch('api.core.sqs_utils._get_sqs_client', return_value=mock_boto_client), \
+         patch('api.core.sqs_utils.settings') as mock_settings:
+        apply_settings(mock_settings)
+        client = SQSClient()
+        client.sqs = mock_boto_client
+        return client
 
 
 class TestSQSClient:
     """Test cases for SQSClient class"""
     
-    @pytest.fixture
-    def mock_boto_client(self):
-        """Mock boto3 SQS client"""
-        return Mock()
-    
-    @pytest.fixture
-    def client(self, mock_boto_client):
-        """Create SQSClient instance with mocked boto client"""
-        with patch('api.core.sqs_utils.boto3.client', return_value=mock_boto_client), \
-             patch('api.core.sqs_utils.settings') as mock_settings:
-            mock_settings.AWS_REGION = 'us-east-1'
-            mock_settings.AWS_ACCESS_KEY_ID = 'test-key'
-            mock_settings.AWS_SECRET_ACCESS_KEY = 'test-secret'
-            mock_settings.AWS_SQS_QUEUE_URL = 'https://sqs.us-east-1.amazonaws.com/123456789012/test-queue'
-            
-            client = SQSClient()
-            client.sqs = mock_boto_client
-            return client
+    @pytest.fixture(autouse=True)
+    def reset_boto_client(self, mock_boto_client):
+        """Clear calls, return values and side effects left by the previous test"""
+        mock_boto_client.reset_mock(return_value=True, side_effect=True)
     
     def test_init_sets_attributes(self, client):
         """Test client initialization"""
         assert client.queue_url == 'https://sqs.us-east-1.amazonaws.com/123456789012/test-queue'
         assert client.sqs is not None
     
+    def test_init_with_queue_url(self, mock_boto_client):
+        """Test an explicit queue URL overrides the jobs queue setting"""
+        with patch('api.core.sqs_utils._get_sqs_client', return_value=mock_boto_client), \
+             patch('api.core.sqs_utils.settings') as mock_settings:
+            apply_settings(mock_settings)
+            client = SQSClient(_WEBHOOK_QUEUE_URL)
+        
+        assert client.queue_url == _WEBHOOK_QUEUE_URL
+    
+    def test_clients_share_pooled_boto_client(self, monkeypatch):
+        """Test the boto3 client is created once with keep-alive pooling"""
+        monkeypatch.setattr('api.core.sqs_utils._sqs_client', None)
+        
+        with patch('api.core.sqs_utils.boto3.client') as mock_boto3_client, \
+             patch('api.core.sqs_utils.settings') as mock_settings:
+            apply_settings(mock_settings)
+            first = SQSClient()
+            second = SQSClient()
+        
+        mock_boto3_client.assert_called_once()
+        assert mock_boto3_client.call_args[1]['config'].tcp_keepalive is True
+        assert first.sqs is second.sqs
+    
     def test_send_message_success(self, client, mock_boto_client):
         """Test successful message sending"""
         mock_boto_client.send_message.return_value = {
@@ -51,7 +100,7 @@ class TestSQSClient:
         
         mock_boto_client.send_message.assert_called_once_with(
             QueueUrl='https://sqs.us-east-1.amazonaws.com/123456789012/test-queue',
-            MessageBody=json.dumps(message_body),
+            MessageBody='{"job_id":"job123","action":"generate"}',
             DelaySeconds=0
         )
     
@@ -65,17 +114,70 @@ class TestSQSClient:
         call_args = mock_boto_client.send_message.call_args[1]
         assert call_args['DelaySeconds'] == 60
     
-    def test_send_message_error(self, client, mock_boto_client):
-        """Test handling send message errors"""
-        mock_boto_client.send_message.side_effect = ClientError(
-            {'Error': {'Message': 'Queue does not exist'}},
-            'SendMessage'
-        )
+    @pytest.mark.parametrize('boto_method,message,call,expected', [
+        ('send_message', 'Queue does not exist', lambda client: client.send_message({'test': 'data'}),
+         'Error sending SQS message: Queue does not exist'),
+        ('receive_message', 'Access denied', lambda client: client.receive_messages(),
+         'Error receiving SQS messages: Access denied'),
+        ('delete_message', 'Receipt handle expired', lambda client: client.delete_message('expired-handle'),
+         'Error deleting SQS message: Receipt handle expired'),
+        ('change_message_visibility', 'Invalid receipt handle',
+         lambda client: client.change_message_visibility('invalid-handle', 60),
+         'Error changing message visibility: Invalid receipt handle')
+    ], ids=['send', 'receive', 'delete', 'change_visibility'])
+    def test_operation_errors(self, client, mock_boto_client, boto_method, message, call, expected):
+        """Test SQS failures surface as errors naming the operation"""
+        getattr(mock_boto_client, boto_method).side_effect = ClientError({'Error': {'Message': message}}, boto_method)
         
         with pytest.raises(Exception) as exc_info:
-            client.send_message({'test': 'data'})
+            call(client)
+        
+        assert expected in str(exc_info.value)
+    
+    def test_send_message_batch_chunks_by_ten(self, client, mock_boto_client):
+        """Test batch sends are split into SendMessageBatch calls of 10"""
+        mock_boto_client.send_message_batch.side_effect = lambda QueueUrl, Entries: {
+            'Successful': [{'Id': entry['Id'], 'MessageId': f"msg-{entry['Id']}"} for entry in Entries]
+        }
+        bodies = [{'job_id': f'job{i}'} for i in range(12)]
+        
+        message_ids = client.send_message_batch(bodies)
+        
+        assert message_ids == [f'msg-{i}' for i in range(12)]
+        assert mock_boto_client.send_message_batch.call_count == 2
+        first_entries = mock_boto_client.send_message_batch.call_args_list[0][1]['Entries']
+        assert len(first_entries) == 10
+        assert first_entries[0] == {'Id': '0', 'MessageBody': '{"job_id":"job0"}', 'DelaySeconds': 0}
+    
+    def test_send_message_batch_retries_failed_entries(self, client, mock_boto_client):
+        """Test entries that fail on the server side are resent"""
+        mock_boto_client.send_message_batch.side_effect = [
+            {
+                'Successful': [{'Id': '0', 'MessageId': 'msg-0'}],
+                'Failed': [{'Id': '1', 'SenderFault': False, 'Code': 'InternalError'}]
+            },
+            {'Successful': [{'Id': '1', 'MessageId': 'msg-1'}]}
+        ]
+        
+        message_ids = client.send_message_batch([{'a': 1}, {'b': 2}])
         
-        assert 'Error sending SQS message: Queue does not exist' in str(exc_info.value)
+        assert message_ids == ['msg-0', 'msg-1']
+        retry_entries = mock_boto_client.send_message_batch.call_args_list[1][1]['Entries']
+        assert [entry['Id'] for entry in retry_entries] == ['1']
+    
+    def test_send_message_batch_sender_fault(self, client, mock_boto_client):
+        """Test sender faults raise without retrying"""
+        mock_boto_client.send_message_batch.return_value = {
+            'Successful': [],
+            'Failed': [{'Id': '0', 'SenderFault': True, 'Code': 'InvalidMessageContents',
+                        'Message': 'Invalid body'}]
+        }
+        
+        with pytest.raises(Exception) as exc_info:
+            client.send_message_batch([{'a': 1}])
+        
+        assert 'Error sending SQS message batch: Invalid body' in str(exc_info.value)
+        mock_boto_client.send_message_batch.assert_called_once()
     
     def test_receive_messages_success(self, client, mock_boto_client):
         """Test successful message receiving"""
@@ -84,13 +186,13 @@ class TestSQSClient:
                 {
                     'MessageId': 'msg-1',
                     'ReceiptHandle': 'receipt-1',
-                    'Body': json.dumps({'job_id': 'job1'}),
+                    'Body': _JOB1_BODY,
                     'Attributes': {'ApproximateReceiveCount': '1'}
                 },
                 {
                     'MessageId': 'msg-2',
                     'ReceiptHandle': 'receipt-2',
-                    'Body': json.dumps({'job_id': 'job2'}),
+                    'Body': _JOB2_BODY,
                     'Attributes': {'ApproximateReceiveCount': '2'}
                 }
             ]
@@ -129,18 +231,6 @@ class TestSQSClient:
         assert call_args['MaxNumberOfMessages'] == 5
         assert call_args['WaitTimeSeconds'] == 10
     
-    def test_receive_messages_error(self, client, mock_boto_client):
-        """Test handling receive message errors"""
-        mock_boto_client.receive_message.side_effect = ClientError(
-            {'Error': {'Message': 'Access denied'}},
-            'ReceiveMessage'
-        )
-        
-        with pytest.raises(Exception) as exc_info:
-            client.receive_messages()
-        
-        assert 'Error receiving SQS messages: Access denied' in str(exc_info.value)
-    
     def test_delete_message_success(self, client, mock_boto_client):
         """Test successful message deletion"""
         result = client.delete_message('receipt-handle-123')
@@ -152,18 +242,6 @@ class TestSQSClient:
             ReceiptHandle='receipt-handle-123'
         )
     
-    def test_delete_message_error(self, client, mock_boto_client):
-        """Test handling delete message errors"""
-        mock_boto_client.delete_message.side_effect = ClientError(
-            {'Error': {'Message': 'Receipt handle expired'}},
-            'DeleteMessage'
-        )
-        
-        with pytest.raises(Exception) as exc_info:
-            client.delete_message('expired-handle')
-        
-        assert 'Error deleting SQS message: Receipt handle expired' in str(exc_info.value)
-    
     def test_change_message_visibility_success(self, client, mock_boto_client):
         """Test successful visibility timeout change"""
         result = client.change_message_visibility('receipt-123', 300)
@@ -175,18 +253,6 @@ class TestSQSClient:
             ReceiptHandle='receipt-123',
             VisibilityTimeout=300
         )
-    
-    def test_change_message_visibility_error(self, client, mock_boto_client):
-        """Test handling visibility change errors"""
-        mock_boto_client.change_message_visibility.side_effect = ClientError(
-            {'Error': {'Message': 'Invalid receipt handle'}},
-            'ChangeMessageVisibility'
-        )
-        
-        with pytest.raises(Exception) as exc_info:
-            client.change_message_visibility('invalid-handle', 60)
-        
-        assert 'Error changing message visibility: Invalid receipt handle' in str(exc_info.value)
 
 
 class TestJobQueue:
@@ -194,8 +260,20 @@ class TestJobQueue:
     
     @pytest.fixture
     def mock_sqs_client(self):
-        """Mock SQSClient"""
-        return Mock(spec=SQSClient)
+        """Stub SQSClient exposing only the methods JobQueue calls"""
+        return SimpleNamespace(
+            send_message=Mock(),
+            send_message_batch=Mock(),
+            receive_messages=Mock(),
+            delete_message=Mock(),
+            change_message_visibility=Mock()
+        )
+    
+    def test_mock_rejects_unknown_attributes(self, mock_sqs_client):
+        """Test the stub fails loudly if JobQueue calls anything it doesn't provide"""
+        assert all(callable(getattr(SQSClient, name)) for name in vars(mock_sqs_client))
+        with pytest.raises(AttributeError):
+            mock_sqs_client.not_a_method
     
     @pytest.fixture
     def queue(self, mock_sqs_client):
@@ -230,6 +308,21 @@ class TestJobQueue:
         assert call_args['batch_size'] == 5
         assert call_args['timestamp'] == 1234567890
     
+    def test_enqueue_generation_jobs(self, queue, mock_sqs_client):
+        """Test enqueueing several jobs in one batched send"""
+        mock_sqs_client.send_message_batch.return_value = ['msg-1', 'msg-2']
+        jobs = [
+            {'job_id': f'job-{i}', 'user_id': 'user-789', 'filters': {}, 'batch_size': 1, 'created_at': i}
+            for i in (1, 2)
+        ]
+        
+        message_ids = queue.enqueue_generation_jobs(jobs)
+        
+        assert message_ids == ['msg-1', 'msg-2']
+        messages = mock_sqs_client.send_message_batch.call_args[0][0]
+        assert [message['job_id'] for message in messages] == ['job-1', 'job-2']
+        assert all(message['type'] == 'image_generation' for message in messages)
+    
     def test_get_next_job_available(self, queue, mock_sqs_client):
         """Test getting next job when available"""
         mock_sqs_client.receive_messages.return_value = [
@@ -247,7 +340,37 @@ class TestJobQueue:
         assert job['message_id'] == 'msg-1'
         assert job['body']['job_id'] == 'job-1'
         
-        mock_sqs_client.receive_messages.assert_called_once_with(max_messages=1)
+        mock_sqs_client.receive_messages.assert_called_once_with(max_messages=10)
+    
+    def test_get_next_job_serves_prefetched_messages(self, queue, mock_sqs_client):
+        """Test one receive call feeds several get_next_job calls"""
+        mock_sqs_client.receive_messages.return_value = [
+            {'message_id': f'msg-{i}', 'receipt_handle': f'receipt-{i}', 'body': {}, 'attributes': {}}
+            for i in range(3)
+        ]
+        
+        jobs = [queue.get_next_job() for _ in range(3)]
+        
+        assert [job['message_id'] for job in jobs] == ['msg-0', 'msg-1', 'msg-2']
+        mock_sqs_client.receive_messages.assert_called_once()
+    
+    def test_return_prefetched_jobs(self, queue, mock_sqs_client):
+        """Test buffered jobs are made visible again"""
+        mock_sqs_client.receive_messages.return_value = [
+            {'message_id': f'msg-{i}', 'receipt_handle': f'receipt-{i}', 'body': {}, 'attributes': {}}
+            for i in range(3)
+        ]
+        queue.get_next_job()
+        
+        returned = queue.return_prefetched_jobs()
+        
+        assert returned == 2
+        assert [call[0] for call in mock_sqs_client.change_message_visibility.call_args_list] == [
+            ('receipt-1', 0), ('receipt-2', 0)
+        ]
+        
+        mock_sqs_client.receive_messages.return_value = []
+        assert queue.get_next_job() is None
     
     def test_get_next_job_none_available(self, queue, mock_sqs_client):
         """Test getting next job when none available"""
@@ -288,4 +411,24 @@ class TestJobQueue:
         mock_sqs_client.change_message_visibility.assert_called_once_with(
             'receipt-123',
             600
-        )
\ No newline at end of file
+        )
+
+
+class TestWebhookQueue:
+    """Test cases for WebhookQueue class"""
+    
+    def test_enqueue_stripe_event(self):
+        """Test Stripe events are sent to the webhook queue tagged with their source"""
+        with patch('api.core.sqs_utils.SQSClient') as mock_sqs_cls, \
+             patch('api.core.sqs_utils.settings') as mock_settings:
+            apply_settings(mock_settings)
+            mock_sqs_cls.return_value.send_message.return_value = 'msg-id-123'
+            
+            queue = WebhookQueue()
+            message_id = queue.enqueue_stripe_event({'id': 'evt_123', 'type': 'invoice.payment_failed'})
+        
+        assert message_id == 'msg-id-123'
+        mock_sqs_cls.assert_called_once_with(_WEBHOOK_QUEUE_URL)
+        mock_sqs_cls.return_value.send_message.assert_called_once_with(
+            {'source': 'stripe', 'event': {'id': 'evt_123', 'type': 'invoice.payment_failed'}}
+        )
@@ -73,6 +73,10 @@ class TestStripeClient:
         assert hobby_plan['price_cents'] == 999
         assert hobby_plan['quota'] == 100
         assert len(hobby_plan['features']) > 0
+        
+        # Reverse price lookup covers every plan
+        assert client.price_id_to_plan[hobby_plan['price_id']] == ('hobby', hobby_plan)
+        assert len(client.price_id_to_plan) == len(client.plans)
     
     @patch('stripe.Customer.create')
     def test_create_customer_success(self, mock_create, client):
@@ -293,6 +297,7 @@ class TestStripeWebhookHandler:
     @pytest.fixture
     def handler(self):
         """Create webhook handler instance"""
+        StripeWebhookHandler._customer_user_ids.clear()
         with patch('api.core.stripe_client.StripeClient'), \
              patch('api.core.stripe_client.SubscriptionRepository'), \
              patch('api.core.stripe_client.UserRepository'), \
@@ -302,6 +307,7 @@ class TestStripeWebhookHandler:
             handler.client = Mock()
             handler.subscription_repo = Mock()
             handler.user_repo = Mock()
+            handler.user_repo.get_user_id_by_stripe_customer.return_value = None
             return handler
     
     @patch('stripe.Webhook.construct_event')
@@ -342,6 +348,49 @@ class TestStripeWebhookHandler:
         
         assert 'Invalid signature' in str(exc_info.value)
     
+    @patch('api.core.stripe_client.WebhookQueue')
+    @patch('stripe.Webhook.construct_event')
+    def test_enqueue_webhook_queues_verified_event(self, mock_construct, mock_queue_cls, handler):
+        """Test verified events are queued for the worker instead of processed inline"""
+        payload = json.dumps({'id': 'evt_123', 'type': 'customer.subscription.created', 'data': {}})
+        mock_construct.return_value = json.loads(payload)
+        mock_queue_cls.return_value.enqueue_stripe_event.return_value = 'msg-123'
+        
+        with patch('api.core.stripe_client.settings') as mock_settings, \
+             patch.object(handler, 'process_event') as mock_process:
+            mock_settings.AWS_SQS_WEBHOOK_QUEUE_URL = 'https://sqs.us-east-1.amazonaws.com/123/webhooks'
+            result = handler.enqueue_webhook(payload, 'signature')
+        
+        assert result == {'status': 'queued', 'event_type': 'customer.subscription.created', 'message_id': 'msg-123'}
+        mock_queue_cls.return_value.enqueue_stripe_event.assert_called_once_with(json.loads(payload))
+        mock_process.assert_not_called()
+    
+    @patch('api.core.stripe_client.WebhookQueue')
+    @patch('stripe.Webhook.construct_event')
+    def test_enqueue_webhook_without_queue_processes_inline(self, mock_construct, mock_queue_cls, handler):
+        """Test events are processed inline when no webhook queue is configured"""
+        mock_construct.return_value = {'type': 'unhandled.event.type', 'data': {}}
+        
+        with patch('api.core.stripe_client.settings') as mock_settings:
+            mock_settings.AWS_SQS_WEBHOOK_QUEUE_URL = None
+            result = handler.enqueue_webhook('payload', 'signature')
+        
+        assert result['status'] == 'ignored'
+        mock_queue_cls.assert_not_called()
+    
+    @patch('stripe.Webhook.construct_event')
+    def test_enqueue_webhook_invalid_signature(self, mock_construct, handler):
+        """Test events failing verification are rejected before queueing"""
+        mock_construct.side_effect = stripe.error.SignatureVerificationError(
+            'Invalid sig',
+            sig_header='bad_signature'
+        )
+        
+        with pytest.raises(Exception) as exc_info:
+            handler.enqueue_webhook('payload', 'bad_signature')
+        
+        assert 'Invalid signature' in str(exc_info.value)
+    
     @patch('stripe.Webhook.construct_event')
     def test_handle_webhook_unhandled_event(self, mock_construct, handler):
         """Test webhook with unhandled event type"""
@@ -385,8 +434,8 @@ class TestStripeWebhookHandler:
         """Test handling new subscription creation"""
         mock_customer_retrieve.return_value = Mock(metadata={'user_id': 'user123'})
         
-        handler.client.plans = {
-            'hobby': {'price_id': 'price_hobby_123', 'quota': 100}
+        handler.client.price_id_to_plan = {
+            'price_hobby_123': ('hobby', {'price_id': 'price_hobby_123', 'quota': 100})
         }
         
         event = {
@@ -415,24 +464,23 @@ class TestStripeWebhookHandler:
             stripe_sub_id='sub_123',
             plan_id='hobby',
             status='active',
-            current_period_end=1234567890
-        )
-        
-        handler.user_repo.update_user.assert_called_once_with(
-            'user123',
-            {
+            current_period_end=1234567890,
+            user_updates={
                 'quota_limit': 100,
                 'subscription_plan': 'hobby'
             }
         )
+        
+        # Quota is written in the same transaction as the subscription
+        handler.user_repo.update_user.assert_not_called()
     
     @patch('stripe.Customer.retrieve')
     def test_handle_subscription_updated(self, mock_customer_retrieve, handler):
         """Test handling subscription updates"""
         mock_customer_retrieve.return_value = Mock(metadata={'user_id': 'user123'})
         
-        handler.client.plans = {
-            'pro': {'price_id': 'price_pro_123', 'quota': 500}
+        handler.client.price_id_to_plan = {
+            'price_pro_123': ('pro', {'price_id': 'price_pro_123', 'quota': 500})
         }
         
         event = {
@@ -458,7 +506,9 @@ class TestStripeWebhookHandler:
         assert result['action'] == 'subscription_updated'
         
         handler.subscription_repo.update_subscription.assert_called_once()
-        handler.user_repo.update_user.assert_called_once()
+        call_kwargs = handler.subscription_repo.update_subscription.call_args[1]
+        assert call_kwargs['user_updates'] == {'quota_limit': 500, 'subscription_plan': 'pro'}
+        handler.user_repo.update_user.assert_not_called()
     
     @patch('stripe.Customer.retrieve')
     def test_handle_subscription_deleted(self, mock_customer_retrieve, handler):
@@ -486,16 +536,14 @@ class TestStripeWebhookHandler:
             updates={
                 'status': 'canceled',
                 'canceled_at': 1234567890
-            }
-        )
-        
-        handler.user_repo.update_user.assert_called_once_with(
-            'user123',
-            {
+            },
+            user_updates={
                 'quota_limit': 0,
                 'subscription_plan': None
             }
         )
+        
+        handler.user_repo.update_user.assert_not_called()
     
     @patch('stripe.Customer.retrieve')
     def test_handle_payment_succeeded_subscription_cycle(self, mock_customer_retrieve, handler):
@@ -525,6 +573,25 @@ class TestStripeWebhookHandler:
             }
         )
     
+    @patch('stripe.Customer.retrieve')
+    def test_get_user_id_prefers_dynamodb_lookup(self, mock_customer_retrieve, handler):
+        """Test customers found in the GSI never hit the Stripe API"""
+        handler.user_repo.get_user_id_by_stripe_customer.return_value = 'user123'
+        
+        assert handler._get_user_id('cus_123') == 'user123'
+        mock_customer_retrieve.assert_not_called()
+    
+    @patch('stripe.Customer.retrieve')
+    def test_get_user_id_caches_across_deliveries(self, mock_customer_retrieve, handler):
+        """Test a resolved customer is served from the cache on later events"""
+        mock_customer_retrieve.return_value = Mock(metadata={'user_id': 'user123'})
+        
+        assert handler._get_user_id('cus_123') == 'user123'
+        assert handler._get_user_id('cus_123') == 'user123'
+        
+        mock_customer_retrieve.assert_called_once_with('cus_123')
+        handler.user_repo.get_user_id_by_stripe_customer.assert_called_once_with('cus_123')
+    
     def test_handle_payment_failed(self, handler):
         """Test handling failed payment"""
         event = {'data': {'object': {}}}
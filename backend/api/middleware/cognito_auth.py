@@ -15,7 +15,7 @@ from django.utils.functional import SimpleLazyObject
 from jose import jwt, jwk, JWTError
 from rest_framework import authentication, exceptions
 
-from api.core.dynamodb_utils import UserRepository
+from api.core.repositories import UserRepository
 
 
 class CognitoUser:
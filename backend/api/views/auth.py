@@ -9,7 +9,7 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from django.conf import settings
 
-from api.core.dynamodb_utils import UserRepository
+from api.core.repositories import UserRepository
 from api.middleware.cognito_auth import CognitoAuthentication
 
 
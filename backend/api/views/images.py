@@ -3,14 +3,13 @@ Image generation and management views
 """
 
 import json
-import time
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from django.conf import settings
 
-from api.core.dynamodb_utils import ImageRepository, JobRepository, UserRepository
+from api.core.repositories import ImageRepository, JobRepository, UserRepository
 from api.core.sqs_utils import JobQueue
 from api.core.s3_utils import ImageStorage
 from api.core.fal_client import ImageGenerator
@@ -61,11 +60,9 @@ def generate_images(request):
         queue = JobQueue()
         queue.enqueue_generation_job(job)
         
-        # Update user quota (will be adjusted if job fails)
+        # Update user quota server-side (will be adjusted if job fails)
         user_repo = UserRepository()
-        user_repo.update_user(user.user_id, {
-            'quota_used': user.quota_used + batch_size
-        })
+        user_repo.adjust_quota_used(user.user_id, batch_size)
         
         return Response({
             'job_id': job['job_id'],
@@ -102,12 +99,12 @@ def get_job_status(request, job_id):
             image_repo = ImageRepository()
             storage = ImageStorage()
             
-            for image_id in job['image_ids']:
-                image = image_repo.get_image(image_id)
-                if image:
-                    # Generate signed URL
-                    image['url'] = storage.get_signed_url(image['url'])
-                    images.append(image)
+            images = image_repo.get_images(job['image_ids'])
+            
+            # Generate signed URLs
+            signed_urls = storage.get_signed_urls_batch([image['url'] for image in images])
+            for image, signed_url in zip(images, signed_urls):
+                image['url'] = signed_url
         
         return Response({
             'job_id': job['job_id'],
@@ -145,8 +142,9 @@ def get_user_images(request):
         )
         
         # Generate signed URLs for images
-        for image in images:
-            image['url'] = storage.get_signed_url(image['url'])
+        signed_urls = storage.get_signed_urls_batch([image['url'] for image in images])
+        for image, signed_url in zip(images, signed_urls):
+            image['url'] = signed_url
         
         return Response({
             'images': images,
@@ -188,13 +186,12 @@ def get_public_gallery(request):
             }, status=status.HTTP_501_NOT_IMPLEMENTED)
         
         # Filter out private images and generate signed URLs
-        public_images = []
-        for image in images:
-            if image.get('public', True):
-                image['url'] = storage.get_signed_url(image['url'])
-                # Remove sensitive data
-                image.pop('user_id', None)
-                public_images.append(image)
+        public_images = [image for image in images if image.get('public', True)]
+        signed_urls = storage.get_signed_urls_batch([image['url'] for image in public_images])
+        for image, signed_url in zip(public_images, signed_urls):
+            image['url'] = signed_url
+            # Remove sensitive data
+            image.pop('user_id', None)
         
         return Response({
             'images': public_images,
@@ -271,7 +268,7 @@ def delete_image(request, image_id):
             )
         
         # Soft delete
-        image_repo.db.delete_item(f'IMG#{image_id}', 'META')
+        image_repo.delete_image(image)
         
         return Response({
             'message': 'Image deleted successfully'
@@ -321,20 +318,17 @@ def update_image_metadata(request, image_id):
             )
         
         # Update image
-        image.update(updates)
-        image_repo.db.put_item(image)
-        
-        # Update tag indices if tags changed
-        if 'tags' in updates:
-            # Remove old tag indices (simplified - in production would track old tags)
-            # Add new tag indices
-            for tag in updates['tags']:
-                tag_index = {
-                    'pk': f'TAG#{tag}',
-                    'sk': f'IMG#{image_id}',
-                    'created_at': int(time.time())
-                }
-                image_repo.db.put_item(tag_index)
+        previous_tags = image.get('tags', [])
+        image = image_repo.update_image(image_id, updates)
+        if not image:
+            return Response(
+                {'error': 'Image not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        # Refresh index summaries (visibility and tags are copied onto them) and
+        # remove the index entries of tags no longer on the image
+        image_repo.save_image_indexes(image, previous_tags=previous_tags)
         
         return Response({
             'message': 'Image updated successfully',
@@ -4,6 +4,7 @@ Magic link authentication endpoints
 
 import boto3
 import json
+from botocore.config import Config
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
@@ -18,10 +19,17 @@ if not settings.COGNITO_CLIENT_ID:
 if not settings.COGNITO_REGION:
     raise ValueError("COGNITO_REGION is not set in environment variables")
 
-# Initialize Cognito client
+# Initialize Cognito client, reusing keep-alive connections across requests
 cognito = boto3.client(
     'cognito-idp',
-    region_name=settings.COGNITO_REGION
+    region_name=settings.COGNITO_REGION,
+    config=Config(
+        max_pool_connections=50,
+        retries={'max_attempts': 3, 'mode': 'adaptive'},
+        tcp_keepalive=True,
+        connect_timeout=2,
+        read_timeout=10
+    )
 )
 
 
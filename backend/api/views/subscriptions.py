@@ -9,7 +9,7 @@ from rest_framework.response import Response
 from django.conf import settings
 
 from api.core.stripe_client import StripeClient
-from api.core.dynamodb_utils import SubscriptionRepository
+from api.core.repositories import SubscriptionRepository
 
 
 @api_view(['GET'])
@@ -30,7 +30,8 @@ def stripe_webhook(request):
     webhook_handler = StripeWebhookHandler()
     
     try:
-        result = webhook_handler.handle_webhook(payload, sig_header)
+        # Verify and queue only; the worker applies the event off the request path
+        result = webhook_handler.enqueue_webhook(payload, sig_header)
         
         return Response({
             'status': 'success',
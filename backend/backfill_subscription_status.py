@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+Add the subsByStatus index key (status_pk) to active subscriptions written
+before the index existed, so get_active_subscription finds them directly
+"""
+import os
+import sys
+from pathlib import Path
+
+# Add Django project root to Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+# Set up Django environment
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'figureforge.settings')
+import django
+django.setup()
+
+from api.core.dynamodb_utils import get_dynamodb_client
+from api.core.repositories import SubscriptionRepository
+
+
+def main():
+    db = get_dynamodb_client()
+    scan_params = {
+        'FilterExpression': 'begins_with(sk, :sub) AND #status = :active AND attribute_not_exists(status_pk)',
+        'ExpressionAttributeNames': {'#status': 'status'},
+        'ExpressionAttributeValues': {':sub': 'SUB#', ':active': 'active'},
+        'ProjectionExpression': 'pk, sk, user_id'
+    }
+    
+    backfilled = 0
+    while True:
+        response = db.table.scan(**scan_params)
+        for item in response.get('Items', []):
+            status_pk = SubscriptionRepository._status_key(item['user_id'], 'active')
+            db.update_fields(item['pk'], item['sk'], {'status_pk': status_pk})
+            backfilled += 1
+        
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    
+    print(f"Backfilled status_pk on {backfilled} active subscriptions")
+
+
+if __name__ == '__main__':
+    main()
@@ -165,6 +165,8 @@ AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
 AWS_S3_BUCKET_NAME = os.environ.get('AWS_S3_BUCKET_NAME', 'figureforge-prod')
 AWS_DYNAMODB_TABLE_NAME = os.environ.get('AWS_DYNAMODB_TABLE_NAME', 'figureforge')
 AWS_SQS_QUEUE_URL = os.environ.get('AWS_SQS_QUEUE_URL')
+AWS_SQS_WEBHOOK_QUEUE_URL = os.environ.get('AWS_SQS_WEBHOOK_QUEUE_URL')
+S3_MULTIPART_THRESHOLD = int(os.environ.get('S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024))  # bytes
 
 # Cognito settings
 COGNITO_USER_POOL_ID = os.environ.get('COGNITO_USER_POOL_ID')
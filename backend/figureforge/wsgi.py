@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'figureforge.settings')
 
 application = get_wsgi_application()
+
+# Build the shared DynamoDB client when the server process starts rather than
+# inside the first request it handles
+from api.core.dynamodb_utils import get_dynamodb_client  # noqa: E402
+
+get_dynamodb_client()
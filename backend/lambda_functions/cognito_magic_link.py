@@ -7,12 +7,16 @@ import os
 import secrets
 import time
 import boto3
+from botocore.config import Config
 from datetime import datetime, timedelta
 
+# Keep connections alive between warm invocations so each trigger skips the TLS handshake
+_AWS_CONFIG = Config(tcp_keepalive=True, connect_timeout=2, read_timeout=10)
+
 # Initialize AWS clients
-dynamodb = boto3.resource('dynamodb')
-ses = boto3.client('ses', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
-cognito = boto3.client('cognito-idp')
+dynamodb = boto3.resource('dynamodb', config=_AWS_CONFIG)
+ses = boto3.client('ses', region_name=os.environ.get('AWS_REGION', 'us-east-1'), config=_AWS_CONFIG)
+cognito = boto3.client('cognito-idp', config=_AWS_CONFIG)
 
 # Environment variables
 DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE', 'figureforge')
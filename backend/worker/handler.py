@@ -5,6 +5,7 @@ AWS Lambda handler for processing image generation jobs from SQS
 import json
 import os
 import sys
+import threading
 import time
 import uuid
 from typing import Dict, List, Any
@@ -12,9 +13,18 @@ from typing import Dict, List, Any
 # Add the parent directory to the path to import our modules
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from api.core.dynamodb_utils import JobRepository, ImageRepository, UserRepository
+from api.core.dynamodb_utils import get_dynamodb_client
+from api.core.repositories import JobRepository, ImageRepository, UserRepository
 from api.core.s3_utils import ImageStorage
 from api.core.fal_client import ImageGenerator
+from api.core.stripe_client import StripeWebhookHandler
+
+# Seconds reserved at the end of an invocation to record job failures
+LAMBDA_TIMEOUT_MARGIN_SECONDS = 30
+
+# Build the shared DynamoDB client during Lambda init so warm invocations reuse it
+# and the first invocation does not pay for boto3 client construction
+get_dynamodb_client()
 
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -36,6 +46,14 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     storage = ImageStorage()
     generator = ImageGenerator()
     
+    # Abort fal.ai polling before Lambda times out so failed jobs are still recorded
+    cancel_timer = None
+    if context is not None:
+        remaining = context.get_remaining_time_in_millis() / 1000 - LAMBDA_TIMEOUT_MARGIN_SECONDS
+        cancel_timer = threading.Timer(max(0, remaining), generator.client.cancel)
+        cancel_timer.daemon = True
+        cancel_timer.start()
+    
     processed_jobs = []
     failed_jobs = []
     
@@ -85,7 +103,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     image_content = storage.download_image_from_url(img_data['url'])
                     
                     # Generate unique filename
-                    image_id = str(uuid.uuid4())
+                    image_id = uuid.uuid4().hex
                     filename = f"images/{user_id}/{image_id}.png"
                     
                     # Upload to S3
@@ -146,9 +164,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 )
                 
                 # Refund quota on failure
-                user_repo.update_user(user_id, {
-                    'quota_used': max(0, user['quota_used'] - batch_size)
-                })
+                user_repo.adjust_quota_used(user_id, -batch_size)
                 
                 failed_jobs.append({
                     'job_id': job_id,
@@ -164,6 +180,9 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'error': str(e)
             })
     
+    if cancel_timer:
+        cancel_timer.cancel()
+    
     # Return processing results
     return {
         'statusCode': 200,
@@ -176,6 +195,39 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     }
 
 
+def webhook_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Apply queued Stripe webhook events from SQS
+    
+    Args:
+        event: SQS event containing webhook messages
+        context: Lambda context
+    
+    Returns:
+        Partial batch response listing messages to be redelivered
+    """
+    
+    stripe_handler = StripeWebhookHandler()
+    batch_item_failures = []
+    
+    for record in event.get('Records', []):
+        try:
+            message_body = json.loads(record['body'])
+            if message_body.get('source') != 'stripe':
+                print(f"Invalid message format: {record['body']}")
+                continue
+            
+            result = stripe_handler.process_event(message_body['event'])
+            print(f"Processed Stripe event {message_body['event'].get('id')}: {result}")
+        
+        except Exception as e:
+            # Leave the message on the queue; SQS redelivers it and redrives to the DLQ
+            print(f"Failed to process webhook message: {str(e)}")
+            batch_item_failures.append({'itemIdentifier': record['messageId']})
+    
+    return {'batchItemFailures': batch_item_failures}
+
+
 def process_single_job(job_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Process a single job (for testing purposes)